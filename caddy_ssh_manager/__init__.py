@@ -4,12 +4,18 @@ Caddy SSH管理模块
 """
 
 from .local_caddy_manager import LocalCaddyManager
+from .backup_manager import CaddyBackupManager
+from .fleet import FleetCaddyManager
+from .log_tail import CaddyLogTailer, start_log_tailers
 from .ssh_client import SSHClient
 from .api import (
     add_domain_to_caddy,
     batch_add_domains, 
     test_connection,
     get_caddy_config,
+    get_brand_domains,
+    list_backups,
+    restore_backup,
     get_system_info,
     quick_add_domain,
     quick_test_connection
@@ -17,11 +23,18 @@ from .api import (
 
 __all__ = [
     'LocalCaddyManager',
+    'CaddyBackupManager',
+    'FleetCaddyManager',
+    'CaddyLogTailer',
+    'start_log_tailers',
     'SSHClient', 
     'add_domain_to_caddy',
     'batch_add_domains',
     'test_connection',
     'get_caddy_config',
+    'get_brand_domains',
+    'list_backups',
+    'restore_backup',
     'get_system_info',
     'quick_add_domain',
     'quick_test_connection'
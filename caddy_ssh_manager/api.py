@@ -5,11 +5,18 @@ Caddy SSH管理API接口
 """
 
 import logging
-from typing import Dict, List, Any
+import threading
+from typing import Dict, List, Any, Optional
 
 from .local_caddy_manager import LocalCaddyManager
+from .fleet import FleetCaddyManager
 from .config import config
 
+# 进程内复用的管理器，保持本地镜像和解析结果常驻
+_manager: Optional[LocalCaddyManager] = None
+_fleet: Optional[FleetCaddyManager] = None
+_init_lock = threading.Lock()
+
 
 def setup_logging():
     """设置日志"""
@@ -19,10 +26,31 @@ def setup_logging():
     )
 
 
+def get_manager() -> LocalCaddyManager:
+    """获取进程内共享的本地管理器（多步操作需持有manager.lock）"""
+    global _manager
+    with _init_lock:
+        if _manager is None:
+            _manager = LocalCaddyManager()
+        return _manager
+
+
+def get_fleet() -> FleetCaddyManager:
+    """获取进程内共享的多节点管理器"""
+    global _fleet
+    with _init_lock:
+        if _fleet is None:
+            _fleet = FleetCaddyManager()
+        return _fleet
+
+
 def add_domain_to_caddy(domain: str, brand: str) -> Dict[str, Any]:
     """
     添加域名到Caddy配置（使用本地处理模式）
     
+    配置了多个节点（CADDY_HOSTS）时并发推送到所有节点，
+    结果中的hosts字段包含每个节点的结果
+    
     Args:
         domain: 要添加的域名
         brand: 品牌名称 (wujie 或 v2word)
@@ -53,12 +81,17 @@ def add_domain_to_caddy(domain: str, brand: str) -> Dict[str, Any]:
                 'error': "SSH配置不完整，请检查环境变量"
             }
         
-        # 创建本地管理器并执行完整工作流程
-        manager = LocalCaddyManager()
-        workflow_result = manager.add_domain_complete_workflow(domain, brand)
+        # 多节点模式：并发推送到所有节点
+        if config.is_fleet_mode():
+            return get_fleet().add_domain(domain, brand)
         
-        # 清理临时文件
-        manager.cleanup_local_files()
+        # 使用共享的本地管理器执行完整工作流程
+        manager = get_manager()
+        with manager.lock:
+            workflow_result = manager.add_domain_complete_workflow(domain, brand)
+            
+            # 清理临时文件（保留本地镜像）
+            manager.cleanup_local_files()
         
         if workflow_result['success']:
             return {
@@ -103,6 +136,18 @@ def batch_add_domains(domains: List[str], brand: str) -> List[Dict[str, Any]]:
         >>> results = batch_add_domains(domains, "wujie")
         >>> success_count = sum(1 for r in results if r['success'])
     """
+    # 多节点模式：各节点并发执行，节点内复用同一会话顺序添加
+    if config.is_fleet_mode():
+        if brand.lower() not in config.get_supported_brands():
+            return [add_domain_to_caddy(domain, brand) for domain in domains]
+        try:
+            return get_fleet().batch_add(domains, brand)
+        except Exception as e:
+            return [
+                {'success': False, 'domain': domain, 'brand': brand, 'error': str(e)}
+                for domain in domains
+            ]
+    
     results = []
     
     for domain in domains:
@@ -133,7 +178,7 @@ def test_connection() -> Dict[str, Any]:
             result['error'] = "SSH配置不完整"
             return result
         
-        manager = LocalCaddyManager()
+        manager = get_manager()
         success = manager.test_connection()
         
         result['success'] = success
@@ -149,7 +194,7 @@ def test_connection() -> Dict[str, Any]:
 
 def get_caddy_config() -> Dict[str, Any]:
     """
-    获取当前Caddy配置（下载到本地）
+    获取当前Caddy配置（远程未变化时直接使用本地镜像）
     
     Returns:
         配置内容和操作结果
@@ -171,16 +216,16 @@ def get_caddy_config() -> Dict[str, Any]:
             result['error'] = "SSH配置不完整"
             return result
         
-        manager = LocalCaddyManager()
-        
-        # 下载配置到本地
-        if not manager.download_config():
-            result['error'] = "下载配置失败"
-            return result
+        manager = get_manager()
         
-        # 读取本地配置
-        with open(manager.local_caddy_path, 'r', encoding='utf-8') as f:
-            config_content = f.read()
+        with manager.lock:
+            # 同步本地镜像
+            if not manager.sync_config():
+                result['error'] = "下载配置失败"
+                return result
+            
+            # 读取本地配置
+            config_content = manager.read_local_config()
         
         result['success'] = True
         result['config'] = config_content
@@ -193,6 +238,136 @@ def get_caddy_config() -> Dict[str, Any]:
         return result
 
 
+def get_brand_domains(brand: str) -> Dict[str, Any]:
+    """
+    获取品牌在Caddy配置中的域名列表
+    
+    Args:
+        brand: 品牌名称
+    
+    Returns:
+        域名列表和操作结果
+    
+    Example:
+        >>> result = get_brand_domains("wujie")
+        >>> print(result['domains'])
+    """
+    result = {
+        'success': False,
+        'brand': brand,
+        'domains': [],
+        'error': None
+    }
+    
+    try:
+        if brand.lower() not in config.get_supported_brands():
+            result['error'] = f"不支持的品牌: {brand}"
+            return result
+        
+        if not config.validate_ssh_config():
+            result['error'] = "SSH配置不完整"
+            return result
+        
+        manager = get_manager()
+        
+        with manager.lock:
+            if not manager.sync_config():
+                result['error'] = "下载配置失败"
+                return result
+            
+            result['domains'] = manager.get_parser().get_brand_domains(brand)
+        result['success'] = True
+        return result
+        
+    except Exception as e:
+        result['error'] = str(e)
+        return result
+
+
+def list_backups() -> Dict[str, Any]:
+    """
+    列出远程Caddy配置的备份
+    
+    Returns:
+        备份列表和操作结果
+    
+    Example:
+        >>> result = list_backups()
+        >>> for backup in result['backups']:
+        >>>     print(backup['path'], backup['timestamp'])
+    """
+    result = {
+        'success': False,
+        'backups': [],
+        'error': None
+    }
+    
+    try:
+        if not config.validate_ssh_config():
+            result['error'] = "SSH配置不完整"
+            return result
+        
+        backups = get_manager().list_backups()
+        result['backups'] = [
+            {**backup, 'timestamp': backup['timestamp'].isoformat()} for backup in backups
+        ]
+        result['success'] = True
+        return result
+        
+    except Exception as e:
+        result['error'] = str(e)
+        return result
+
+
+def restore_backup(backup_path: str, reload: bool = True) -> Dict[str, Any]:
+    """
+    从备份恢复远程Caddy配置
+    
+    Args:
+        backup_path: 备份文件路径（来自list_backups）
+        reload: 恢复后是否验证配置并重载Caddy
+    
+    Returns:
+        操作结果字典
+    
+    Example:
+        >>> backups = list_backups()['backups']
+        >>> result = restore_backup(backups[1]['path'])
+    """
+    result = {
+        'success': False,
+        'backup_path': backup_path,
+        'error': None
+    }
+    
+    try:
+        if not config.validate_ssh_config():
+            result['error'] = "SSH配置不完整"
+            return result
+        
+        manager = get_manager()
+        
+        with manager.lock:
+            if not manager.restore_backup(backup_path):
+                result['error'] = "恢复备份失败"
+                return result
+            
+            if reload:
+                if not manager.validate_remote_config():
+                    result['error'] = "配置验证失败"
+                    return result
+                if not manager.reload_caddy():
+                    result['error'] = "重载服务失败"
+                    return result
+        
+        result['success'] = True
+        return result
+        
+    except Exception as e:
+        result['error'] = str(e)
+        return result
+
+
 def get_system_info() -> Dict[str, Any]:
     """
     获取系统信息
@@ -211,7 +386,10 @@ def get_system_info() -> Dict[str, Any]:
         'ssh_host': ssh_config.get('host'),
         'ssh_port': ssh_config.get('port'),
         'ssh_configured': config.validate_ssh_config(),
-        'caddy_file_path': config.get_caddy_config()['file_path']
+        'caddy_file_path': config.get_caddy_config()['file_path'],
+        'backup_policy': config.get_backup_config(),
+        'fleet_hosts': [FleetCaddyManager.host_key(h) for h in config.get_fleet_config()['hosts']],
+        'fleet_mode': config.is_fleet_mode()
     }
 
 
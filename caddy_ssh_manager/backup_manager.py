@@ -0,0 +1,242 @@
+#!/usr/bin/env python3
+"""
+远程Caddyfile备份管理
+按内容哈希去重、按保留策略压缩清理，支持列出和恢复备份
+"""
+
+import re
+import shlex
+import logging
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from .ssh_client import SSHClient
+
+# 备份文件名格式: Caddyfile.bak.<时间戳>[.<sha256前12位>][.gz]
+# 不带哈希的是旧版本生成的备份，同样参与保留策略
+BACKUP_NAME_PATTERN = re.compile(
+    r"\.bak\.(?P<timestamp>\d{14})(?:\.(?P<sha>[0-9a-f]{12}))?(?P<gz>\.gz)?$"
+)
+
+HASH_PREFIX_LENGTH = 12
+
+
+class CaddyBackupManager:
+    """远程Caddyfile备份管理器"""
+    
+    def __init__(self, ssh: SSHClient, remote_caddy_path: str,
+                 keep_last: int = 10, keep_daily: int = 7, keep_weekly: int = 4,
+                 compress: bool = False):
+        """
+        初始化备份管理器
+        
+        Args:
+            ssh: SSH客户端
+            remote_caddy_path: 远程Caddyfile路径
+            keep_last: 保留最近的备份数量
+            keep_daily: 按天保留的天数（每天保留最新一份）
+            keep_weekly: 按周保留的周数（每周保留最新一份）
+            compress: 是否使用gzip压缩备份
+        """
+        self.ssh = ssh
+        self.remote_caddy_path = remote_caddy_path
+        self.keep_last = keep_last
+        self.keep_daily = keep_daily
+        self.keep_weekly = keep_weekly
+        self.compress = compress
+        self.logger = logging.getLogger("caddy_backup_manager")
+    
+    def _parse_backup_list(self, output: str) -> List[Dict]:
+        """解析ls输出的备份文件列表，按时间从新到旧排序"""
+        backups = []
+        for line in output.split('\n'):
+            path = line.strip()
+            if not path.startswith(f"{self.remote_caddy_path}.bak."):
+                continue
+            
+            match = BACKUP_NAME_PATTERN.search(path)
+            if not match:
+                continue
+            
+            backups.append({
+                'path': path,
+                'timestamp': datetime.strptime(match.group('timestamp'), "%Y%m%d%H%M%S"),
+                'sha256_prefix': match.group('sha'),
+                'compressed': bool(match.group('gz'))
+            })
+        
+        backups.sort(key=lambda b: b['timestamp'], reverse=True)
+        return backups
+    
+    def _list_command(self) -> str:
+        """列出备份文件的命令"""
+        return f"ls -1 {shlex.quote(self.remote_caddy_path)}.bak.* 2>/dev/null"
+    
+    def list_backups(self) -> List[Dict]:
+        """
+        列出远程所有备份
+        
+        Returns:
+            备份信息列表（从新到旧）
+        """
+        stdout, stderr, exit_code = self.ssh.execute_command(f"{self._list_command()}; true")
+        return self._parse_backup_list(stdout)
+    
+    def create_backup(self, current_sha256: Optional[str] = None) -> Optional[str]:
+        """
+        创建备份，内容与最新备份相同时跳过
+        
+        Args:
+            current_sha256: 远程配置当前的sha256，未提供时在远程计算
+        
+        Returns:
+            备份文件路径（跳过时返回已有的最新备份），失败返回None
+        """
+        try:
+            quoted_path = shlex.quote(self.remote_caddy_path)
+            if not current_sha256:
+                # 哈希和备份列表分开执行，各自检查结果；哈希失败时不做备份
+                stdout, stderr, exit_code = self.ssh.execute_command(f"sha256sum {quoted_path}")
+                fields = stdout.split()
+                if exit_code != 0 or not fields or not re.fullmatch(r"[0-9a-f]{64}", fields[0]):
+                    self.logger.error(f"计算远程配置哈希失败: {stderr}")
+                    return None
+                current_sha256 = fields[0]
+            
+            backups = self.list_backups()
+            sha_prefix = current_sha256[:HASH_PREFIX_LENGTH]
+            
+            if backups and backups[0]['sha256_prefix'] == sha_prefix:
+                self.logger.info(f"配置内容未变化，复用已有备份: {backups[0]['path']}")
+                return backups[0]['path']
+            
+            timestamp = datetime.now().strftime("%Y%m%d%H%M%S")
+            backup_path = f"{self.remote_caddy_path}.bak.{timestamp}.{sha_prefix}"
+            
+            if self.compress:
+                backup_path += ".gz"
+                command = f"gzip -c {quoted_path} > {shlex.quote(backup_path)}"
+            else:
+                command = f"cp {quoted_path} {shlex.quote(backup_path)}"
+            
+            self.logger.info(f"备份远程配置到: {backup_path}")
+            stdout, stderr, exit_code = self.ssh.execute_command(command)
+            
+            if exit_code != 0:
+                self.logger.error(f"备份失败: {stderr}")
+                return None
+            
+            backups.insert(0, {
+                'path': backup_path,
+                'timestamp': datetime.strptime(timestamp, "%Y%m%d%H%M%S"),
+                'sha256_prefix': sha_prefix,
+                'compressed': self.compress
+            })
+            self.compact(backups)
+            
+            self.logger.info("远程配置备份成功")
+            return backup_path
+        
+        except Exception as e:
+            self.logger.error(f"备份远程配置时出错: {e}")
+            return None
+    
+    def select_backups_to_keep(self, backups: List[Dict]) -> List[Dict]:
+        """
+        根据保留策略选出需要保留的备份
+        
+        Args:
+            backups: 备份列表（从新到旧）
+        
+        Returns:
+            需要保留的备份列表
+        """
+        keep = {b['path'] for b in backups[:self.keep_last]}
+        
+        days = []
+        weeks = []
+        for backup in backups:
+            day = backup['timestamp'].date()
+            week = tuple(backup['timestamp'].isocalendar()[:2])
+            
+            # 列表从新到旧，每个周期遇到的第一个就是该周期最新的备份
+            if day not in days and len(days) < self.keep_daily:
+                days.append(day)
+                keep.add(backup['path'])
+            if week not in weeks and len(weeks) < self.keep_weekly:
+                weeks.append(week)
+                keep.add(backup['path'])
+        
+        return [b for b in backups if b['path'] in keep]
+    
+    def compact(self, backups: Optional[List[Dict]] = None) -> int:
+        """
+        按保留策略删除多余的备份
+        
+        Args:
+            backups: 已知的备份列表，未提供时从远程读取
+        
+        Returns:
+            删除的备份数量
+        """
+        try:
+            if backups is None:
+                backups = self.list_backups()
+            
+            keep = {b['path'] for b in self.select_backups_to_keep(backups)}
+            expired = [b['path'] for b in backups if b['path'] not in keep]
+            
+            if not expired:
+                return 0
+            
+            command = "rm -f " + " ".join(shlex.quote(path) for path in expired)
+            stdout, stderr, exit_code = self.ssh.execute_command(command)
+            
+            if exit_code != 0:
+                self.logger.error(f"清理过期备份失败: {stderr}")
+                return 0
+            
+            self.logger.info(f"已清理 {len(expired)} 个过期备份")
+            return len(expired)
+        
+        except Exception as e:
+            self.logger.error(f"清理过期备份时出错: {e}")
+            return 0
+    
+    def restore_backup(self, backup_path: str) -> bool:
+        """
+        用指定备份覆盖远程配置
+        
+        Args:
+            backup_path: 备份文件路径（必须是list_backups返回的路径）
+        
+        Returns:
+            是否恢复成功
+        """
+        try:
+            backups = {b['path']: b for b in self.list_backups()}
+            backup = backups.get(backup_path)
+            if not backup:
+                self.logger.error(f"备份不存在: {backup_path}")
+                return False
+            
+            quoted_backup = shlex.quote(backup_path)
+            quoted_path = shlex.quote(self.remote_caddy_path)
+            if backup['compressed']:
+                command = f"gunzip -c {quoted_backup} > {quoted_path}"
+            else:
+                command = f"cp {quoted_backup} {quoted_path}"
+            
+            self.logger.info(f"从备份恢复远程配置: {backup_path}")
+            stdout, stderr, exit_code = self.ssh.execute_command(command)
+            
+            if exit_code != 0:
+                self.logger.error(f"恢复备份失败: {stderr}")
+                return False
+            
+            self.logger.info("远程配置恢复成功")
+            return True
+        
+        except Exception as e:
+            self.logger.error(f"恢复备份时出错: {e}")
+            return False
@@ -136,6 +136,39 @@ class CaddyConfigParser:
         new_config = '\n'.join(new_lines)
         return True, new_config
     
+    def remove_domain_from_brand_block(self, domain: str, brand: str) -> Tuple[bool, str]:
+        """
+        从品牌配置块中移除域名
+        
+        Args:
+            domain: 要移除的域名
+            brand: 品牌名称
+            
+        Returns:
+            Tuple[success, new_config_or_error_message]
+        """
+        block_info = self.find_brand_block_by_target_host(brand)
+        if not block_info:
+            return False, f"未找到品牌 {brand} 的配置块"
+        
+        domain_line_index = block_info['domain_line_index']
+        line_parts = self.lines[domain_line_index].split('{')
+        if len(line_parts) != 2:
+            return False, f"域名行格式错误: {self.lines[domain_line_index]}"
+        
+        domains = line_parts[0].split()
+        if domain not in domains:
+            return True, f"域名 {domain} 不存在"
+        
+        remaining = [d for d in domains if d != domain]
+        if not remaining:
+            return False, f"品牌 {brand} 的配置块只剩域名 {domain}，不能移除"
+        
+        new_lines = self.lines.copy()
+        new_lines[domain_line_index] = f"{' '.join(remaining)} {{"
+        
+        return True, '\n'.join(new_lines)
+    
     def get_brand_domains(self, brand: str) -> List[str]:
         """
         获取品牌当前的域名列表
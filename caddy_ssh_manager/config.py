@@ -4,7 +4,7 @@
 """
 
 import os
-from typing import Dict, Any
+from typing import Dict, Any, List, Tuple
 from dotenv import load_dotenv
 
 # 加载环境变量
@@ -19,12 +19,23 @@ class Config:
         self.ssh_config = self._load_ssh_config()
         self.brand_configs = self._load_brand_configs()
         self.caddy_config = self._load_caddy_config()
+        self.backup_config = self._load_backup_config()
+        self.fleet_config = self._load_fleet_config()
+        self.log_tail_config = self._load_log_tail_config()
     
     def _load_ssh_config(self) -> Dict[str, Any]:
         """加载SSH配置"""
+        host = os.environ.get("CADDY_IP")
+        port = int(os.environ.get("CADDY_PORT", 22))
+        
+        # 只配置了CADDY_HOSTS时，以第一个节点（含其端口）作为默认节点
+        fleet_hosts = self._parse_fleet_hosts()
+        if not host and fleet_hosts:
+            host, port = fleet_hosts[0]
+        
         return {
-            'host': os.environ.get("CADDY_IP"),
-            'port': int(os.environ.get("CADDY_PORT", 22)),
+            'host': host,
+            'port': port,
             'username': os.environ.get("CADDY_USER"),
             'password': os.environ.get("CADDY_PASSWD")
         }
@@ -48,6 +59,60 @@ class Config:
             'file_path': '/etc/caddy/Caddyfile'
         }
     
+    def _parse_fleet_hosts(self) -> List[Tuple[str, int]]:
+        """解析CADDY_HOSTS环境变量（逗号分隔的 host 或 host:port），未指定端口时使用CADDY_PORT"""
+        default_port = int(os.environ.get("CADDY_PORT", 22))
+        hosts_str = os.environ.get("CADDY_HOSTS", "")
+        
+        hosts = []
+        for entry in hosts_str.split(","):
+            host, _, port = entry.strip().partition(":")
+            if host:
+                hosts.append((host, int(port) if port else default_port))
+        return hosts
+    
+    def _load_fleet_config(self) -> Dict[str, Any]:
+        """加载多节点（边缘服务器集群）配置"""
+        hosts = []
+        for host, port in self._parse_fleet_hosts():
+            hosts.append({
+                'host': host,
+                'port': port,
+                'username': self.ssh_config['username'],
+                'password': self.ssh_config['password']
+            })
+        
+        # 未配置集群时只包含单个CADDY_IP节点
+        if not hosts and self.ssh_config.get('host'):
+            hosts.append(dict(self.ssh_config))
+        
+        return {
+            'hosts': hosts,
+            'concurrency': int(os.environ.get("CADDY_FLEET_CONCURRENCY", 4)),
+            'canary': os.environ.get("CADDY_CANARY", "false").lower() in ("1", "true", "yes")
+        }
+    
+    def _load_backup_config(self) -> Dict[str, Any]:
+        """加载备份保留策略配置"""
+        return {
+            'keep_last': int(os.environ.get("CADDY_BACKUP_KEEP_LAST", 10)),
+            'keep_daily': int(os.environ.get("CADDY_BACKUP_KEEP_DAILY", 7)),
+            'keep_weekly': int(os.environ.get("CADDY_BACKUP_KEEP_WEEKLY", 4)),
+            'compress': os.environ.get("CADDY_BACKUP_COMPRESS", "false").lower() in ("1", "true", "yes")
+        }
+    
+    def _load_log_tail_config(self) -> Dict[str, Any]:
+        """加载访问日志采集配置（聚合结果写入与域名拨测相同的Redis）"""
+        return {
+            'redis': {
+                'host': os.environ.get("REDIS_HOST", "127.0.0.1"),
+                'port': int(os.environ.get("REDIS_PORT", 6380)),
+                'db': int(os.environ.get("REDIS_DB", 0))
+            },
+            'flush_interval': float(os.environ.get("CADDY_LOG_FLUSH_INTERVAL", 10)),
+            'retention': int(os.environ.get("CADDY_LOG_RETENTION", 86400))
+        }
+    
     def get_ssh_config(self) -> Dict[str, Any]:
         """获取SSH配置"""
         return self.ssh_config
@@ -60,6 +125,22 @@ class Config:
         """获取Caddy配置"""
         return self.caddy_config
     
+    def get_backup_config(self) -> Dict[str, Any]:
+        """获取备份保留策略配置"""
+        return self.backup_config
+    
+    def get_fleet_config(self) -> Dict[str, Any]:
+        """获取多节点配置"""
+        return self.fleet_config
+    
+    def get_log_tail_config(self) -> Dict[str, Any]:
+        """获取访问日志采集配置"""
+        return self.log_tail_config
+    
+    def is_fleet_mode(self) -> bool:
+        """是否配置了多个Caddy节点"""
+        return len(self.fleet_config['hosts']) > 1
+    
     def get_supported_brands(self) -> list:
         """获取支持的品牌列表"""
         return list(self.brand_configs.keys())
@@ -0,0 +1,243 @@
+#!/usr/bin/env python3
+"""
+多节点Caddy配置下发
+将域名变更并发推送到所有边缘节点，支持金丝雀节点先行
+"""
+
+import time
+import logging
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+from .local_caddy_manager import LocalCaddyManager
+from .config import config
+
+
+class FleetCaddyManager:
+    """多节点Caddy管理器"""
+    
+    def __init__(self, hosts: Optional[List[Dict]] = None, concurrency: Optional[int] = None,
+                 canary: Optional[bool] = None, work_dir: Optional[str] = None):
+        """
+        初始化多节点管理器
+        
+        Args:
+            hosts: 节点SSH配置列表，默认读取CADDY_HOSTS
+            concurrency: 同时操作的节点数量上限
+            canary: 是否先在第一个节点上执行，成功后再推送其余节点
+            work_dir: 本地工作目录，每个节点使用独立的子目录
+        """
+        fleet_config = config.get_fleet_config()
+        self.hosts = hosts if hosts is not None else fleet_config['hosts']
+        self.concurrency = max(1, concurrency or fleet_config['concurrency'])
+        self.canary = fleet_config['canary'] if canary is None else canary
+        
+        if not self.hosts:
+            raise ValueError("未配置任何Caddy节点，请检查CADDY_IP或CADDY_HOSTS")
+        
+        self.work_dir = Path(work_dir) if work_dir else Path(tempfile.gettempdir()) / "caddy_manager"
+        
+        # 每个节点一个常驻管理器，复用SSH会话和本地镜像
+        self._managers: Dict[str, LocalCaddyManager] = {}
+        self._managers_lock = threading.Lock()
+        
+        self.logger = logging.getLogger("fleet_caddy_manager")
+    
+    @staticmethod
+    def host_key(host_config: Dict) -> str:
+        """节点标识: host:port"""
+        return f"{host_config['host']}:{host_config['port']}"
+    
+    def get_manager(self, host_config: Dict) -> LocalCaddyManager:
+        """获取节点对应的本地管理器"""
+        key = self.host_key(host_config)
+        with self._managers_lock:
+            if key not in self._managers:
+                self._managers[key] = LocalCaddyManager(
+                    work_dir=str(self.work_dir / key.replace(":", "_")),
+                    ssh_config=host_config
+                )
+            return self._managers[key]
+    
+    def _run_on_host(self, host_config: Dict, action: Callable[[LocalCaddyManager], Any]) -> Dict[str, Any]:
+        """在单个节点上执行操作并记录耗时"""
+        key = self.host_key(host_config)
+        start_time = time.time()
+        
+        try:
+            manager = self.get_manager(host_config)
+            # 同一节点上的并发调用（如检查流程和备用池维护）依次执行
+            with manager.lock:
+                result = action(manager)
+            success = all(r['success'] for r in result) if isinstance(result, list) else result['success']
+            return {
+                'host': key,
+                'success': success,
+                'result': result,
+                'duration': round(time.time() - start_time, 3),
+                'error': None if success else "节点操作失败"
+            }
+        except Exception as e:
+            self.logger.error(f"节点 {key} 操作失败: {e}")
+            return {
+                'host': key,
+                'success': False,
+                'result': None,
+                'duration': round(time.time() - start_time, 3),
+                'error': str(e)
+            }
+    
+    def run(self, action: Callable[[LocalCaddyManager], Any]) -> Dict[str, Dict[str, Any]]:
+        """
+        在所有节点上并发执行操作
+        
+        Args:
+            action: 接收LocalCaddyManager并返回结果字典（或结果列表）的函数
+        
+        Returns:
+            以节点标识为键的结果字典
+        """
+        results = {}
+        remaining = list(self.hosts)
+        
+        # 金丝雀节点失败时不再推送其余节点
+        if self.canary and len(remaining) > 1:
+            canary_host = remaining.pop(0)
+            canary_result = self._run_on_host(canary_host, action)
+            results[canary_result['host']] = canary_result
+            
+            if not canary_result['success']:
+                self.logger.error(f"金丝雀节点 {canary_result['host']} 失败，停止推送其余节点")
+                for host_config in remaining:
+                    results[self.host_key(host_config)] = {
+                        'host': self.host_key(host_config),
+                        'success': False,
+                        'result': None,
+                        'duration': 0,
+                        'error': "金丝雀节点失败，已跳过"
+                    }
+                return results
+        
+        with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            for host_result in executor.map(lambda h: self._run_on_host(h, action), remaining):
+                results[host_result['host']] = host_result
+        
+        return results
+    
+    def add_domain(self, domain: str, brand: str) -> Dict[str, Any]:
+        """
+        将域名添加到所有节点
+        
+        Args:
+            domain: 要添加的域名
+            brand: 品牌名称
+        
+        Returns:
+            汇总结果，hosts字段包含各节点结果
+        """
+        def action(manager: LocalCaddyManager) -> Dict:
+            try:
+                return manager.add_domain_complete_workflow(domain, brand)
+            finally:
+                manager.cleanup_local_files()
+        
+        start_time = time.time()
+        host_results = self.run(action)
+        failed_hosts = [host for host, r in host_results.items() if not r['success']]
+        
+        return {
+            'success': not failed_hosts,
+            'domain': domain,
+            'brand': brand,
+            'hosts': host_results,
+            'failed_hosts': failed_hosts,
+            'duration': round(time.time() - start_time, 3),
+            'error': f"以下节点失败: {failed_hosts}" if failed_hosts else None
+        }
+    
+    def remove_domain(self, domain: str, brand: str) -> Dict[str, Any]:
+        """
+        从所有节点移除域名
+        
+        Args:
+            domain: 要移除的域名
+            brand: 品牌名称
+        
+        Returns:
+            汇总结果，hosts字段包含各节点结果
+        """
+        def action(manager: LocalCaddyManager) -> Dict:
+            try:
+                return manager.remove_domain_complete_workflow(domain, brand)
+            finally:
+                manager.cleanup_local_files()
+        
+        start_time = time.time()
+        host_results = self.run(action)
+        failed_hosts = [host for host, r in host_results.items() if not r['success']]
+        
+        return {
+            'success': not failed_hosts,
+            'domain': domain,
+            'brand': brand,
+            'hosts': host_results,
+            'failed_hosts': failed_hosts,
+            'duration': round(time.time() - start_time, 3),
+            'error': f"以下节点失败: {failed_hosts}" if failed_hosts else None
+        }
+    
+    def batch_add(self, domains: List[str], brand: str) -> List[Dict[str, Any]]:
+        """
+        批量添加域名：各节点并发，节点内按顺序复用同一会话
+        
+        Args:
+            domains: 域名列表
+            brand: 品牌名称
+        
+        Returns:
+            每个域名的汇总结果列表
+        """
+        def action(manager: LocalCaddyManager) -> List[Dict]:
+            results = []
+            for domain in domains:
+                try:
+                    results.append(manager.add_domain_complete_workflow(domain, brand))
+                finally:
+                    # 每个域名结束后清理修改文件，已存在的域名不会重复上传上一个域名的修改
+                    manager.cleanup_local_files()
+            return results
+        
+        host_results = self.run(action)
+        
+        results = []
+        for index, domain in enumerate(domains):
+            per_host = {}
+            for host, host_result in host_results.items():
+                domain_result = host_result['result'][index] if host_result['result'] else None
+                per_host[host] = {
+                    'host': host,
+                    'success': bool(domain_result and domain_result['success']),
+                    'result': domain_result,
+                    'duration': host_result['duration'],
+                    'error': domain_result['error'] if domain_result else host_result['error']
+                }
+            
+            failed_hosts = [host for host, r in per_host.items() if not r['success']]
+            results.append({
+                'success': not failed_hosts,
+                'domain': domain,
+                'brand': brand,
+                'hosts': per_host,
+                'failed_hosts': failed_hosts,
+                'error': f"以下节点失败: {failed_hosts}" if failed_hosts else None
+            })
+        
+        return results
+    
+    def close(self):
+        """关闭所有节点的SSH会话"""
+        for manager in self._managers.values():
+            manager.ssh.close()
@@ -5,31 +5,38 @@
 """
 
 import os
+import json
+import hashlib
 import logging
 import tempfile
-from datetime import datetime
+import threading
 from pathlib import Path
-from typing import Dict, Optional
+from typing import Callable, Dict, List, Optional
 
 from .ssh_client import SSHClient
 from .caddy_config_parser import CaddyConfigParser
+from .backup_manager import CaddyBackupManager
 from .config import config
 
 
 class LocalCaddyManager:
     """本地Caddy配置管理器"""
     
-    def __init__(self, work_dir: Optional[str] = None):
+    def __init__(self, work_dir: Optional[str] = None, ssh_config: Optional[Dict] = None):
         """
         初始化本地管理器
         
         Args:
             work_dir: 本地工作目录，默认使用临时目录
+            ssh_config: 目标节点的SSH配置，默认使用CADDY_IP节点
         """
         # SSH配置
-        ssh_config = config.get_ssh_config()
-        if not config.validate_ssh_config():
-            raise ValueError("SSH配置不完整，请检查环境变量")
+        if ssh_config is None:
+            ssh_config = config.get_ssh_config()
+            if not config.validate_ssh_config():
+                raise ValueError("SSH配置不完整，请检查环境变量")
+        elif not all(ssh_config.get(key) for key in ('host', 'username', 'password')):
+            raise ValueError(f"节点 {ssh_config.get('host')} 的SSH配置不完整")
         
         self.ssh = SSHClient(
             ssh_config['host'],
@@ -52,10 +59,26 @@ class LocalCaddyManager:
         # 本地文件路径
         self.local_caddy_path = self.work_dir / "Caddyfile"
         self.modified_caddy_path = self.work_dir / "Caddyfile.modified"
+        # 本地镜像的远程指纹（mtime/size/sha256），用于判断是否需要重新下载
+        self.mirror_meta_path = self.work_dir / "Caddyfile.meta.json"
+        
+        # 本地镜像和临时文件由同一管理器的所有操作共享，多步操作需持有该锁（可重入）
+        self.lock = threading.RLock()
+        
+        # 常驻的解析器缓存，按配置内容的sha256失效
+        self._parser: Optional[CaddyConfigParser] = None
+        self._parser_sha256: Optional[str] = None
         
         # 品牌配置
         self.brand_configs = config.brand_configs
         
+        # 备份管理器（去重、保留策略、可选压缩）
+        self.backup_manager = CaddyBackupManager(
+            self.ssh,
+            self.remote_caddy_path,
+            **config.get_backup_config()
+        )
+        
         self.logger = self._setup_logging()
         
         self.logger.info(f"本地工作目录: {self.work_dir}")
@@ -101,6 +124,126 @@ class LocalCaddyManager:
             self.logger.error(f"下载配置时出错: {e}")
             return False
     
+    def get_remote_fingerprint(self) -> Optional[Dict]:
+        """
+        获取远程配置文件的指纹（一次很小的stat + sha256sum命令）
+        
+        Returns:
+            包含mtime、size、sha256的字典，失败返回None
+        """
+        try:
+            stdout, stderr, exit_code = self.ssh.execute_command(
+                f"stat -c '%Y %s' {self.remote_caddy_path} && sha256sum {self.remote_caddy_path}"
+            )
+            
+            if exit_code != 0:
+                self.logger.error(f"获取远程配置指纹失败: {stderr}")
+                return None
+            
+            lines = stdout.strip().split('\n')
+            mtime, size = lines[0].split()
+            sha256 = lines[1].split()[0]
+            
+            return {
+                'mtime': int(mtime),
+                'size': int(size),
+                'sha256': sha256
+            }
+            
+        except Exception as e:
+            self.logger.error(f"获取远程配置指纹时出错: {e}")
+            return None
+    
+    def _load_mirror_meta(self) -> Optional[Dict]:
+        """读取本地镜像记录的远程指纹"""
+        if not self.mirror_meta_path.exists() or not self.local_caddy_path.exists():
+            return None
+        
+        try:
+            with open(self.mirror_meta_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except Exception as e:
+            self.logger.warning(f"读取本地镜像元数据失败: {e}")
+            return None
+    
+    def _save_mirror_meta(self, fingerprint: Dict):
+        """保存本地镜像对应的远程指纹"""
+        with open(self.mirror_meta_path, 'w', encoding='utf-8') as f:
+            json.dump(fingerprint, f)
+    
+    def invalidate_mirror(self):
+        """使本地镜像失效，下次同步时强制重新下载"""
+        if self.mirror_meta_path.exists():
+            self.mirror_meta_path.unlink()
+        self._parser = None
+        self._parser_sha256 = None
+    
+    def sync_config(self, force: bool = False) -> bool:
+        """
+        同步本地镜像：只有远程文件发生变化时才重新下载
+        
+        Args:
+            force: 是否忽略指纹强制下载
+            
+        Returns:
+            本地镜像是否可用
+        """
+        fingerprint = self.get_remote_fingerprint()
+        
+        if not force and fingerprint:
+            cached = self._load_mirror_meta()
+            if cached == fingerprint:
+                self.logger.info("远程配置未变化，使用本地镜像")
+                return True
+        
+        if not self.download_config():
+            return False
+        
+        if fingerprint:
+            # 下载的内容必须与指纹一致，否则说明期间文件被修改，不记录指纹
+            local_sha256 = hashlib.sha256(self.local_caddy_path.read_bytes()).hexdigest()
+            if local_sha256 == fingerprint['sha256']:
+                self._save_mirror_meta(fingerprint)
+            else:
+                self.invalidate_mirror()
+        
+        return True
+    
+    def read_local_config(self) -> str:
+        """读取本地镜像中的配置内容"""
+        with open(self.local_caddy_path, 'r', encoding='utf-8') as f:
+            return f.read()
+    
+    def get_parser(self) -> CaddyConfigParser:
+        """
+        获取本地镜像的解析器，内容未变化时复用已解析的结果
+        
+        Returns:
+            CaddyConfigParser实例
+        """
+        content = self.read_local_config()
+        sha256 = hashlib.sha256(content.encode('utf-8')).hexdigest()
+        
+        if self._parser is None or self._parser_sha256 != sha256:
+            self._parser = CaddyConfigParser(content)
+            self._parser_sha256 = sha256
+        
+        return self._parser
+    
+    def get_brand_domains(self, brand: str) -> List[str]:
+        """
+        获取品牌当前配置的域名列表（基于本地镜像）
+        
+        Args:
+            brand: 品牌名称
+            
+        Returns:
+            域名列表
+        """
+        if not self.sync_config():
+            return []
+        return self.get_parser().get_brand_domains(brand)
+    
     def add_domain_to_local_config(self, domain: str, brand: str) -> bool:
         """
         在本地配置文件中添加域名
@@ -124,12 +267,8 @@ class LocalCaddyManager:
                 self.logger.error("本地配置文件不存在，请先下载配置")
                 return False
             
-            # 读取本地配置
-            with open(self.local_caddy_path, 'r', encoding='utf-8') as f:
-                config_content = f.read()
-            
-            # 使用解析器修改配置
-            parser = CaddyConfigParser(config_content)
+            # 使用解析器修改配置（复用常驻的解析结果）
+            parser = self.get_parser()
             success, result = parser.add_domain_to_brand_block(domain, brand)
             
             if not success:
@@ -158,35 +297,85 @@ class LocalCaddyManager:
             self.logger.error(f"修改本地配置时出错: {e}")
             return False
     
-    def backup_remote_config(self) -> Optional[str]:
+    def remove_domain_from_local_config(self, domain: str, brand: str) -> bool:
         """
-        备份远程配置文件
+        在本地配置文件中移除域名
         
+        Args:
+            domain: 要移除的域名
+            brand: 品牌名称
+            
         Returns:
-            备份文件路径，失败返回None
+            是否修改成功
         """
         try:
-            # 生成备份文件名：Caddyfile.bak.年月日时间
-            timestamp = datetime.now().strftime("%Y%m%d%H%M%S")
-            backup_path = f"{self.remote_caddy_path}.bak.{timestamp}"
+            brand = brand.lower()
+            if brand not in self.brand_configs:
+                raise ValueError(f"不支持的品牌: {brand}")
             
-            self.logger.info(f"备份远程配置到: {backup_path}")
+            self.logger.info(f"在本地配置中移除品牌 {brand} 的域名: {domain}")
             
-            # 执行备份命令
-            stdout, stderr, exit_code = self.ssh.execute_command(
-                f"cp {self.remote_caddy_path} {backup_path}"
-            )
+            if not self.local_caddy_path.exists():
+                self.logger.error("本地配置文件不存在，请先下载配置")
+                return False
             
-            if exit_code != 0:
-                self.logger.error(f"备份失败: {stderr}")
-                return None
+            parser = self.get_parser()
+            success, result = parser.remove_domain_from_brand_block(domain, brand)
+            
+            if not success:
+                self.logger.error(f"修改配置失败: {result}")
+                return False
+            
+            if "不存在" in result:
+                # 不生成修改文件，工作流程跳过上传和重载，重复移除同一域名时结果仍为成功
+                self.logger.warning(result)
+                return True
+            
+            new_parser = CaddyConfigParser(result)
+            valid, msg = new_parser.validate_config_syntax()
+            if not valid:
+                self.logger.error(f"新配置语法错误: {msg}")
+                return False
+            
+            with open(self.modified_caddy_path, 'w', encoding='utf-8') as f:
+                f.write(result)
             
-            self.logger.info("远程配置备份成功")
-            return backup_path
+            self.logger.info(f"修改后的配置已保存到: {self.modified_caddy_path}")
+            return True
             
         except Exception as e:
-            self.logger.error(f"备份远程配置时出错: {e}")
-            return None
+            self.logger.error(f"修改本地配置时出错: {e}")
+            return False
+    
+    def backup_remote_config(self) -> Optional[str]:
+        """
+        备份远程配置文件（内容与最新备份相同时复用已有备份）
+        
+        Returns:
+            备份文件路径，失败返回None
+        """
+        # 哈希在备份时由远程计算：本地镜像的指纹可能已落后于远程文件，
+        # 用它去重会把新内容误判为已有备份
+        return self.backup_manager.create_backup()
+    
+    def list_backups(self) -> List[Dict]:
+        """列出远程配置的所有备份（从新到旧）"""
+        return self.backup_manager.list_backups()
+    
+    def restore_backup(self, backup_path: str) -> bool:
+        """
+        从备份恢复远程配置
+        
+        Args:
+            backup_path: 备份文件路径
+            
+        Returns:
+            是否恢复成功
+        """
+        success = self.backup_manager.restore_backup(backup_path)
+        if success:
+            self.invalidate_mirror()
+        return success
     
     def upload_config(self) -> bool:
         """
@@ -219,12 +408,31 @@ class LocalCaddyManager:
                 return False
             
             self.logger.info("配置上传成功")
+            self._refresh_mirror_after_upload(config_content)
             return True
             
         except Exception as e:
             self.logger.error(f"上传配置时出错: {e}")
             return False
     
+    def _refresh_mirror_after_upload(self, config_content: str):
+        """上传成功后用已上传的内容更新本地镜像，避免下次重新下载"""
+        try:
+            # echo 会在文件末尾追加换行
+            uploaded_content = config_content + '\n'
+            with open(self.local_caddy_path, 'w', encoding='utf-8') as f:
+                f.write(uploaded_content)
+            
+            fingerprint = self.get_remote_fingerprint()
+            local_sha256 = hashlib.sha256(uploaded_content.encode('utf-8')).hexdigest()
+            if fingerprint and fingerprint['sha256'] == local_sha256:
+                self._save_mirror_meta(fingerprint)
+            else:
+                self.invalidate_mirror()
+        except Exception as e:
+            self.logger.warning(f"更新本地镜像失败: {e}")
+            self.invalidate_mirror()
+    
     def validate_remote_config(self) -> bool:
         """
         验证远程配置文件语法
@@ -276,7 +484,7 @@ class LocalCaddyManager:
     def add_domain_complete_workflow(self, domain: str, brand: str) -> Dict:
         """
         完整的域名添加工作流程
-        1. 下载配置到本地
+        1. 同步配置到本地镜像（仅在远程变化时下载）
         2. 在本地修改配置
         3. 备份远程配置  
         4. 上传新配置
@@ -287,6 +495,39 @@ class LocalCaddyManager:
             domain: 要添加的域名
             brand: 品牌名称
             
+        Returns:
+            操作结果字典
+        """
+        result = self._run_config_workflow(domain, brand, self.add_domain_to_local_config)
+        if result['success']:
+            self.logger.info(f"域名 {domain} 成功添加到品牌 {brand}")
+        return result
+    
+    def remove_domain_complete_workflow(self, domain: str, brand: str) -> Dict:
+        """
+        完整的域名移除工作流程，步骤与添加相同
+        
+        Args:
+            domain: 要移除的域名
+            brand: 品牌名称
+            
+        Returns:
+            操作结果字典
+        """
+        result = self._run_config_workflow(domain, brand, self.remove_domain_from_local_config)
+        if result['success']:
+            self.logger.info(f"域名 {domain} 已从品牌 {brand} 移除")
+        return result
+    
+    def _run_config_workflow(self, domain: str, brand: str, modify: Callable[[str, str], bool]) -> Dict:
+        """
+        同步、修改、备份、上传、验证并重载配置
+        
+        Args:
+            domain: 域名
+            brand: 品牌名称
+            modify: 修改本地配置的函数 (domain, brand) -> bool，无需变更时不生成修改文件
+            
         Returns:
             操作结果字典
         """
@@ -303,66 +544,84 @@ class LocalCaddyManager:
                 'reload': False
             },
             'backup_path': None,
+            'unchanged': False,
             'error': None
         }
         
-        try:
-            # 1. 下载配置
-            if not self.download_config():
-                result['error'] = "下载配置失败"
-                return result
-            result['steps']['download'] = True
-            
-            # 2. 修改本地配置
-            if not self.add_domain_to_local_config(domain, brand):
-                result['error'] = "修改本地配置失败"
-                return result
-            result['steps']['modify'] = True
-            
-            # 3. 备份远程配置
-            backup_path = self.backup_remote_config()
-            if not backup_path:
-                result['error'] = "备份远程配置失败"
-                return result
-            result['steps']['backup'] = True
-            result['backup_path'] = backup_path
-            
-            # 4. 上传新配置
-            if not self.upload_config():
-                result['error'] = "上传配置失败"
-                return result
-            result['steps']['upload'] = True
-            
-            # 5. 验证配置
-            if not self.validate_remote_config():
-                result['error'] = "配置验证失败"
-                return result
-            result['steps']['validate'] = True
-            
-            # 6. 重载服务
-            if not self.reload_caddy():
-                result['error'] = "重载服务失败"
-                return result
-            result['steps']['reload'] = True
-            
-            result['success'] = True
-            self.logger.info(f"域名 {domain} 成功添加到品牌 {brand}")
+        # 同一节点的配置变更必须串行，否则并发的流程会互相覆盖本地镜像和修改后的文件
+        with self.lock:
+            try:
+                # 1. 同步本地镜像
+                if not self.sync_config():
+                    result['error'] = "下载配置失败"
+                    return result
+                result['steps']['download'] = True
+                
+                # 2. 修改本地配置（先清除上次遗留的修改文件，避免上传过期内容）
+                if self.modified_caddy_path.exists():
+                    self.modified_caddy_path.unlink()
+                if not modify(domain, brand):
+                    result['error'] = "修改本地配置失败"
+                    return result
+                result['steps']['modify'] = True
+                
+                if not self.modified_caddy_path.exists():
+                    # 域名已存在（添加）或不存在（移除），远程配置无需变更，不备份、上传和重载
+                    self.logger.info(f"域名 {domain} 已是目标状态，跳过上传和重载")
+                    result['unchanged'] = True
+                    result['success'] = True
+                    return result
+                
+                # 3. 备份远程配置
+                backup_path = self.backup_remote_config()
+                if not backup_path:
+                    result['error'] = "备份远程配置失败"
+                    return result
+                result['steps']['backup'] = True
+                result['backup_path'] = backup_path
+                
+                # 4. 上传新配置
+                if not self.upload_config():
+                    result['error'] = "上传配置失败"
+                    return result
+                result['steps']['upload'] = True
+                
+                # 5. 验证配置
+                if not self.validate_remote_config():
+                    result['error'] = "配置验证失败"
+                    return result
+                result['steps']['validate'] = True
+                
+                # 6. 重载服务
+                if not self.reload_caddy():
+                    result['error'] = "重载服务失败"
+                    return result
+                result['steps']['reload'] = True
+                
+                result['success'] = True
+                
+            except Exception as e:
+                result['error'] = str(e)
+                self.logger.error(f"完整工作流程失败: {e}")
             
-        except Exception as e:
-            result['error'] = str(e)
-            self.logger.error(f"完整工作流程失败: {e}")
-        
         return result
     
     def test_connection(self) -> bool:
         """测试SSH连接"""
         return self.ssh.test_connection()
     
-    def cleanup_local_files(self):
-        """清理本地临时文件"""
+    def cleanup_local_files(self, keep_mirror: bool = True):
+        """
+        清理本地临时文件
+        
+        Args:
+            keep_mirror: 是否保留本地镜像（默认保留，供后续操作复用）
+        """
         try:
-            if self.local_caddy_path.exists():
-                self.local_caddy_path.unlink()
+            if not keep_mirror:
+                if self.local_caddy_path.exists():
+                    self.local_caddy_path.unlink()
+                self.invalidate_mirror()
             if self.modified_caddy_path.exists():
                 self.modified_caddy_path.unlink()
             self.logger.info("本地临时文件已清理")
@@ -0,0 +1,343 @@
+#!/usr/bin/env python3
+"""
+Caddy访问日志采集
+通过常驻SSH通道持续读取各品牌的访问日志，按字节偏移量记录断点，
+增量解析Caddy的JSON日志并按 域名/分钟 汇总状态码和延迟写入Redis
+"""
+
+import json
+import logging
+import shlex
+import socket
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from .ssh_client import SSHClient
+from .config import config
+
+# 延迟分布的上界（毫秒），最后一档为超过最大上界的请求
+LATENCY_BUCKETS_MS = (100, 500, 1000, 5000)
+
+# tail -F 在日志轮转或截断时输出的提示
+ROTATION_MARKERS = ("has been replaced", "truncated", "has appeared")
+
+# tail的提示信息前缀（stderr合并到stdout后与日志行交错输出）
+TAIL_MESSAGE_PREFIX = b"tail: "
+
+
+def minute_key(host: str, minute: int) -> str:
+    """域名每分钟聚合数据的Redis键"""
+    return f"caddy_log:{host}:{minute}"
+
+
+def parse_tail_message(line: bytes) -> Optional[str]:
+    """
+    识别输出流中tail自身的提示信息
+    
+    旧文件最后一行没有换行符时，提示信息会接在这一行后面；
+    以 } 结尾的行是内容中恰好包含前缀的JSON日志，不是提示信息
+    
+    Args:
+        line: 输出流中的一行（不含换行符）
+    
+    Returns:
+        提示信息，不是提示信息时返回None
+    """
+    index = line.find(TAIL_MESSAGE_PREFIX)
+    if index == -1 or (index > 0 and line.rstrip().endswith(b"}")):
+        return None
+    return line[index:].decode("utf-8", errors="replace")
+
+
+class LogAggregator:
+    """按 域名/分钟 汇总Caddy访问日志"""
+    
+    def __init__(self):
+        self._buckets: Dict[Tuple[str, int], Dict[str, float]] = {}
+        self.parsed = 0
+        self.skipped = 0
+    
+    def feed(self, line: bytes) -> bool:
+        """
+        解析一行JSON日志
+        
+        Args:
+            line: 日志行（不含换行符）
+        
+        Returns:
+            是否为有效的访问日志
+        """
+        try:
+            entry = json.loads(line)
+            request = entry.get("request") or {}
+            host = (request.get("host") or "").split(":")[0].lower()
+            status = int(entry.get("status", 0))
+            duration_ms = float(entry.get("duration", 0)) * 1000
+            minute = int(float(entry["ts"]) // 60 * 60)
+        except (ValueError, TypeError, KeyError, AttributeError):
+            self.skipped += 1
+            return False
+        
+        if not host or not status:
+            self.skipped += 1
+            return False
+        
+        bucket = self._buckets.setdefault((host, minute), {})
+        bucket["count"] = bucket.get("count", 0) + 1
+        status_field = f"s{status // 100}xx"
+        bucket[status_field] = bucket.get(status_field, 0) + 1
+        bucket["duration_ms_sum"] = bucket.get("duration_ms_sum", 0.0) + duration_ms
+        
+        latency_field = next((f"le_{bound}" for bound in LATENCY_BUCKETS_MS if duration_ms <= bound),
+                             f"gt_{LATENCY_BUCKETS_MS[-1]}")
+        bucket[latency_field] = bucket.get(latency_field, 0) + 1
+        
+        self.parsed += 1
+        return True
+    
+    def drain(self) -> Dict[Tuple[str, int], Dict[str, float]]:
+        """取出并清空当前的汇总数据"""
+        buckets, self._buckets = self._buckets, {}
+        return buckets
+
+
+class CaddyLogTailer:
+    """通过SSH持续读取单个节点上的一个访问日志文件"""
+    
+    def __init__(self, ssh_config: Dict[str, Any], log_file: str, redis_client=None,
+                 flush_interval: Optional[float] = None, retention: Optional[int] = None):
+        """
+        初始化日志采集器
+        
+        Args:
+            ssh_config: 节点SSH配置
+            log_file: 远程日志文件路径
+            redis_client: Redis客户端，默认按CADDY日志采集配置创建
+            flush_interval: 汇总数据写入Redis的间隔（秒）
+            retention: 每分钟汇总数据的保留时间（秒）
+        """
+        tail_config = config.get_log_tail_config()
+        
+        self.ssh = SSHClient(
+            ssh_config['host'],
+            ssh_config['port'],
+            ssh_config['username'],
+            ssh_config['password']
+        )
+        self.node = f"{ssh_config['host']}:{ssh_config['port']}"
+        self.log_file = log_file
+        self.flush_interval = flush_interval or tail_config['flush_interval']
+        self.retention = retention or tail_config['retention']
+        self.redis = redis_client or self._create_redis_client(tail_config['redis'])
+        
+        self.checkpoint_key = f"caddy_log:checkpoint:{self.node}:{log_file}"
+        self.aggregator = LogAggregator()
+        
+        self.logger = logging.getLogger("caddy_log_tailer")
+    
+    @staticmethod
+    def _create_redis_client(redis_config: Dict[str, Any]):
+        """创建Redis客户端（redis只在采集日志时需要）"""
+        import redis
+        return redis.Redis(**redis_config)
+    
+    def _remote_stat(self) -> Tuple[Optional[int], int]:
+        """获取远程日志文件的inode和大小"""
+        stdout, stderr, exit_code = self.ssh.execute_command(
+            f"stat -c '%i %s' {shlex.quote(self.log_file)}"
+        )
+        if exit_code != 0:
+            raise FileNotFoundError(f"无法读取日志文件 {self.log_file}: {stderr.strip()}")
+        inode, size = stdout.split()
+        return int(inode), int(size)
+    
+    def load_checkpoint(self) -> Tuple[Optional[int], int]:
+        """读取上次记录的 (inode, 偏移量)"""
+        data = self.redis.hgetall(self.checkpoint_key)
+        if not data:
+            return None, 0
+        values = {k.decode() if isinstance(k, bytes) else k: int(v) for k, v in data.items()}
+        return values.get("inode"), values.get("offset", 0)
+    
+    def resolve_start(self) -> Tuple[int, int]:
+        """
+        确定本次读取的起点
+        
+        文件的inode未变且未被截断时从断点继续，否则（日志已轮转）从头读取新文件
+        
+        Returns:
+            (inode, 起始偏移量)
+        """
+        inode, size = self._remote_stat()
+        saved_inode, saved_offset = self.load_checkpoint()
+        
+        if saved_inode == inode and saved_offset <= size:
+            return inode, saved_offset
+        
+        if saved_inode is not None:
+            self.logger.info(f"{self.node} {self.log_file} 已轮转或截断，从头读取")
+        return inode, 0
+    
+    def flush(self, inode: int, offset: int):
+        """将汇总数据和断点在同一事务中写入Redis，保证断点与已计入的数据一致"""
+        buckets = self.aggregator.drain()
+        
+        pipe = self.redis.pipeline(transaction=True)
+        for (host, minute), fields in buckets.items():
+            key = minute_key(host, minute)
+            for field, value in fields.items():
+                if isinstance(value, float):
+                    pipe.hincrbyfloat(key, field, value)
+                else:
+                    pipe.hincrby(key, field, value)
+            pipe.expire(key, self.retention)
+        pipe.hset(self.checkpoint_key, mapping={"inode": inode, "offset": offset})
+        pipe.execute()
+    
+    def run_once(self, stop_event: threading.Event):
+        """
+        打开一个 tail -F 通道持续读取，直到通道断开或收到停止信号
+        
+        Args:
+            stop_event: 停止信号
+        """
+        inode, offset = self.resolve_start()
+        self.logger.info(f"开始采集 {self.node} {self.log_file}，起始偏移量 {offset}")
+        
+        channel = self.ssh.get_connection().get_transport().open_session()
+        channel.settimeout(1.0)
+        # stderr合并到stdout：tail输出提示前会先刷新已读取的内容，
+        # 轮转提示因此恰好位于旧文件与新文件内容的分界处
+        channel.exec_command(f"tail -c +{offset + 1} -F {shlex.quote(self.log_file)} 2>&1")
+        
+        buffer = b""
+        last_flush = time.time()
+        try:
+            while not stop_event.is_set():
+                try:
+                    data = channel.recv(65536)
+                except socket.timeout:
+                    data = None
+                
+                if data == b"" and channel.exit_status_ready():
+                    raise ConnectionError(f"tail进程已退出，退出码 {channel.recv_exit_status()}")
+                
+                if data:
+                    buffer += data
+                    *lines, buffer = buffer.split(b"\n")
+                    for line in lines:
+                        message = parse_tail_message(line)
+                        if message is not None:
+                            inode, offset = self._handle_tail_message(message, inode, offset)
+                            continue
+                        # 只有完整的行才计入偏移量，断点续读时不会重复或遗漏
+                        offset += len(line) + 1
+                        if line.strip():
+                            self.aggregator.feed(line)
+                
+                if time.time() - last_flush >= self.flush_interval:
+                    self.flush(inode, offset)
+                    last_flush = time.time()
+        finally:
+            try:
+                self.flush(inode, offset)
+            except Exception as e:
+                self.logger.error(f"写入最后一批日志汇总失败: {e}")
+            channel.close()
+    
+    def _handle_tail_message(self, message: str, inode: int, offset: int) -> Tuple[int, int]:
+        """
+        处理tail的提示信息：轮转或截断时保存旧文件的断点，之后的内容从新文件开头计算偏移量
+        
+        Returns:
+            (inode, 偏移量)
+        """
+        if not any(marker in message for marker in ROTATION_MARKERS):
+            self.logger.warning(f"{self.node} {self.log_file}: {message.strip()}")
+            return inode, offset
+        
+        self.flush(inode, offset)
+        new_inode, size = self._remote_stat()
+        self.logger.info(f"{self.node} {self.log_file} 已轮转: {message.strip()}，"
+                         f"旧文件读取到 {offset} 字节，新文件当前 {size} 字节")
+        return new_inode, 0
+    
+    def run_forever(self, stop_event: Optional[threading.Event] = None, max_backoff: int = 60):
+        """
+        持续采集，连接断开或出错时指数退避后重连
+        
+        Args:
+            stop_event: 停止信号
+            max_backoff: 最大重连等待时间（秒）
+        """
+        stop_event = stop_event or threading.Event()
+        backoff = 1
+        
+        while not stop_event.is_set():
+            started = time.time()
+            try:
+                self.run_once(stop_event)
+            except Exception as e:
+                self.logger.error(f"采集 {self.node} {self.log_file} 失败: {e}")
+                self.ssh.close()
+            
+            # 运行较长时间后断开视为偶发，重置退避时间
+            if time.time() - started > max_backoff:
+                backoff = 1
+            stop_event.wait(backoff)
+            backoff = min(backoff * 2, max_backoff)
+        
+        self.ssh.close()
+
+
+def start_log_tailers(brands: Optional[List[str]] = None,
+                      stop_event: Optional[threading.Event] = None) -> List[threading.Thread]:
+    """
+    为所有节点上的品牌访问日志启动采集线程
+    
+    Args:
+        brands: 要采集的品牌，默认全部已配置日志文件的品牌
+        stop_event: 停止信号
+    
+    Returns:
+        采集线程列表
+    """
+    brands = brands or config.get_supported_brands()
+    stop_event = stop_event or threading.Event()
+    
+    threads = []
+    for host_config in config.get_fleet_config()['hosts']:
+        for brand in brands:
+            log_file = config.get_brand_config(brand).get('log_file')
+            if not log_file:
+                continue
+            tailer = CaddyLogTailer(host_config, log_file)
+            thread = threading.Thread(
+                target=tailer.run_forever,
+                args=(stop_event,),
+                name=f"caddy-log-{tailer.node}-{brand}",
+                daemon=True
+            )
+            thread.start()
+            threads.append(thread)
+    
+    return threads
+
+
+if __name__ == "__main__":
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    )
+    
+    stop = threading.Event()
+    workers = start_log_tailers(stop_event=stop)
+    logging.getLogger("caddy_log_tailer").info(f"已启动 {len(workers)} 个日志采集线程")
+    try:
+        while any(t.is_alive() for t in workers):
+            time.sleep(1)
+    except KeyboardInterrupt:
+        stop.set()
+        for t in workers:
+            t.join(timeout=5)
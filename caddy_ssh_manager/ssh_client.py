@@ -5,7 +5,8 @@ SSH客户端基础类
 
 import paramiko
 import logging
-from typing import Tuple
+import threading
+from typing import Optional, Tuple
 
 
 class SSHClient:
@@ -26,6 +27,10 @@ class SSHClient:
         self.username = username
         self.password = password
         self.logger = logging.getLogger(self.__class__.__name__)
+        
+        # 复用的长连接，多条命令共享同一个SSH会话
+        self._client: Optional[paramiko.SSHClient] = None
+        self._lock = threading.Lock()
     
     def create_connection(self) -> paramiko.SSHClient:
         """创建SSH连接"""
@@ -45,9 +50,26 @@ class SSHClient:
             self.logger.error(f"SSH连接失败: {e}")
             raise
     
+    def get_connection(self) -> paramiko.SSHClient:
+        """获取复用的SSH连接，连接断开时自动重建"""
+        with self._lock:
+            transport = self._client.get_transport() if self._client else None
+            if transport is None or not transport.is_active():
+                if self._client:
+                    self._client.close()
+                self._client = self.create_connection()
+            return self._client
+    
+    def close(self):
+        """关闭复用的SSH连接"""
+        with self._lock:
+            if self._client:
+                self._client.close()
+                self._client = None
+    
     def execute_command(self, command: str) -> Tuple[str, str, int]:
         """
-        执行SSH命令
+        执行SSH命令（复用长连接，连接失效时重连一次）
         
         Args:
             command: 要执行的命令
@@ -55,14 +77,18 @@ class SSHClient:
         Returns:
             Tuple[stdout, stderr, exit_code]
         """
-        with self.create_connection() as client:
-            stdin, stdout, stderr = client.exec_command(command)
-            
-            stdout_content = stdout.read().decode('utf-8')
-            stderr_content = stderr.read().decode('utf-8')
-            exit_code = stdout.channel.recv_exit_status()
-            
-            return stdout_content, stderr_content, exit_code
+        try:
+            stdin, stdout, stderr = self.get_connection().exec_command(command)
+        except (paramiko.SSHException, EOFError, OSError) as e:
+            self.logger.warning(f"SSH会话失效，重新连接: {e}")
+            self.close()
+            stdin, stdout, stderr = self.get_connection().exec_command(command)
+        
+        stdout_content = stdout.read().decode('utf-8')
+        stderr_content = stderr.read().decode('utf-8')
+        exit_code = stdout.channel.recv_exit_status()
+        
+        return stdout_content, stderr_content, exit_code
     
     def test_connection(self) -> bool:
         """测试SSH连接"""
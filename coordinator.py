@@ -5,8 +5,10 @@
 """
 
 import asyncio
+import json
 import logging
 import os
+import socket
 import sys
 import time
 from pathlib import Path
@@ -20,9 +22,11 @@ sys.path.insert(0, str(current_dir / "github_manager"))
 # 导入各模块
 import domain_monitor
 from github_api import DomainsGitHubManager
+from failover_ledger import FailoverLedger, STEP_GITHUB
 
 # 获取需要的函数
 monitor_single_check = domain_monitor.monitor_single_check
+create_new_domain = domain_monitor.create_new_domain
 
 # 加载环境变量
 load_dotenv()
@@ -52,13 +56,90 @@ class DomainCoordinator:
             target_file_path="domains.json"
         )
         
-        # 配置检查间隔（分钟）
-        self.check_interval = int(os.environ.get("COORDINATOR_INTERVAL", 10))
+        # 健康判断与监控程序保持一致，同时复用其Redis连接
+        self.health_monitor = domain_monitor.DomainHealthMonitor(
+            os.environ.get("REDIS_HOST", "127.0.0.1"),
+            int(os.environ.get("REDIS_PORT", 6380)),
+            int(os.environ.get("REDIS_DB", 0))
+        )
+        self.redis_client = self.health_monitor.redis_client
+        
+        # 故障切换操作记录，重复的检查周期跳过已完成的GitHub提交
+        self.failover_ledger = FailoverLedger(
+            self.redis_client,
+            int(os.environ.get("FAILOVER_LEDGER_TTL", 172800))
+        )
+        
+        # 拨测结果事件流：收到不健康的结果立即处理，定时检查只作为兜底
+        self.events_enabled = os.environ.get("COORDINATOR_EVENTS_ENABLED", "true").lower() in ("1", "true", "yes")
+        self.events_stream = os.environ.get("DOMAIN_EVENTS_STREAM", "domain_events")
+        self.events_group = os.environ.get("COORDINATOR_EVENTS_GROUP", "coordinator")
+        self.events_consumer = os.environ.get("COORDINATOR_CONSUMER", socket.gethostname())
+        
+        # 提交新域名后递增配置版本号并通知拨测服务立即重新获取域名列表
+        self.config_version_key = os.environ.get("DOMAIN_CONFIG_VERSION_KEY", "domain_config:version")
+        self.config_channel = os.environ.get("DOMAIN_CONFIG_CHANNEL", "domain_config:changed")
+        
+        # 预置备用域名池：后台补充，故障时直接提升（STANDBY_POOL_SIZE为0时不启用）
+        self.standby_pool = None
+        if int(os.environ.get("STANDBY_POOL_SIZE", 0)) > 0:
+            self.standby_pool = domain_monitor.DomainMonitor().standby_pool
+            provisioner, remover = self._create_caddy_hooks()
+            if provisioner:
+                self.standby_pool.caddy_provisioner = provisioner
+                self.standby_pool.caddy_remover = remover
+            else:
+                # 无法配置Caddy站点时新备用域名永远无法通过检测，不启用池子补充
+                self.logger.warning("无法配置备用域名的Caddy站点，不启用备用域名池补充")
+                self.standby_pool = None
+        self.standby_interval = int(os.environ.get("STANDBY_REFILL_INTERVAL", 300))
+        self._standby_refill = asyncio.Event()
+        
+        # 同一时间只执行一次检查，事件触发和定时检查不会并发切换同一品牌
+        self._check_lock = asyncio.Lock()
+        self._loop = None
+        
+        # 配置检查间隔（分钟），启用事件流时默认放宽为30分钟
+        default_interval = 30 if self.events_enabled else 10
+        self.check_interval = int(os.environ.get("COORDINATOR_INTERVAL", default_interval))
         
         self.logger.info(f"域名协调器已初始化")
         self.logger.info(f"domains.json路径: {domains_file_path}")
         self.logger.info(f"GitHub仓库: PotatoOfficialTeam/domains")
         self.logger.info(f"检查间隔: {self.check_interval}分钟")
+        if self.standby_pool:
+            self.logger.info(f"备用域名池: 每个品牌 {self.standby_pool.size} 个, 补充间隔 {self.standby_interval}秒")
+        if self.events_enabled:
+            self.logger.info(f"订阅拨测事件流: {self.events_stream} (消费组 {self.events_group}, 消费者 {self.events_consumer})")
+    
+    def _create_caddy_hooks(self):
+        """
+        创建备用域名的Caddy站点配置和删除函数
+        
+        Returns:
+            tuple: (provision, remove)，均为 (domain, brand) -> bool；
+                   caddy_ssh_manager不可用或未配置节点时返回 (None, None)
+        """
+        try:
+            from caddy_ssh_manager import FleetCaddyManager
+            fleet = FleetCaddyManager()
+        except Exception as e:
+            self.logger.warning(f"无法初始化Caddy节点管理，备用域名不自动配置Caddy站点: {e}")
+            return None, None
+        
+        def provision(domain: str, brand: str) -> bool:
+            result = fleet.add_domain(domain, brand)
+            if not result['success']:
+                self.logger.error(f"备用域名 {domain} 配置Caddy失败: {result['error']}")
+            return result['success']
+        
+        def remove(domain: str, brand: str) -> bool:
+            result = fleet.remove_domain(domain, brand)
+            if not result['success']:
+                self.logger.error(f"备用域名 {domain} 删除Caddy站点失败: {result['error']}")
+            return result['success']
+        
+        return provision, remove
     
     def _setup_logging(self):
         """设置日志配置"""
@@ -118,17 +199,28 @@ class DomainCoordinator:
             else:
                 full_url = domain_url
             
+            # 今天已把该域名提交到GitHub，不再重复提交
+            if self.failover_ledger.is_done(brand, domain_url, STEP_GITHUB):
+                self.logger.info(f"品牌 {brand} 的新域名 {full_url} 今日已提交到GitHub，跳过")
+                return True
+            
             self.logger.info(f"开始处理品牌 {brand} 的新域名: {full_url}")
             
-            # 替换品牌第一个域名并提交到GitHub
-            success = self.github_manager.replace_and_commit(
-                brand=brand,
-                new_domain=full_url,
-                description=description
-            )
+            if new_domain_info.get("status") == "existing":
+                # 已在配置中的备用域名：调整顺序提升为主域名
+                success = self.github_manager.promote_and_commit(brand=brand, domain=full_url)
+            else:
+                # 替换品牌第一个域名并提交到GitHub
+                success = self.github_manager.replace_and_commit(
+                    brand=brand,
+                    new_domain=full_url,
+                    description=description
+                )
             
             if success:
                 self.logger.info(f"成功替换域名到GitHub: {brand} -> {full_url}")
+                self.failover_ledger.mark_done(brand, domain_url, STEP_GITHUB, url=full_url)
+                self.notify_config_changed(brand, full_url)
                 return True
             else:
                 self.logger.error(f"替换域名到GitHub失败: {brand} -> {full_url}")
@@ -138,10 +230,57 @@ class DomainCoordinator:
             self.logger.error(f"处理新域名创建失败: {e}")
             return False
     
-    def single_check_and_process(self) -> dict:
+    def _resolve_existing_backup(self, brand: str, result: dict) -> dict:
+        """
+        确认已有的备用域名在提交的domains.json中
+        
+        排行榜来自GITHUB_DOMAIN_FILES中的所有配置文件，备用域名可能不在本程序提交的文件里，
+        此时无法调整顺序，改为提升备用池域名或生成新域名，避免每次检查都选中同一个备用域名而无法切换
+        
+        Args:
+            brand: 品牌名称
+            result: 品牌的检查结果
+            
+        Returns:
+            dict: 切换目标域名信息，没有可用的替代域名时返回 {"status": "failed"}
+        """
+        new_domain_info = result["new_domain"]
+        if self.github_manager.has_domain_of_brand(brand, new_domain_info["domain"]):
+            return new_domain_info
+        
+        failing_domain = (result.get("health_data") or {}).get("domain")
+        self.logger.warning(f"备用域名 {new_domain_info['domain']} 不在品牌 {brand} 提交的domains.json中，"
+                            f"改用备用池或新生成的域名")
+        fallback = create_new_domain(brand, failing_domain, use_backup=False)
+        if not fallback:
+            self.logger.error(f"品牌 {brand} 没有可替代的域名")
+            return {"brand": brand, "domain": new_domain_info["domain"], "status": "failed"}
+        return fallback
+    
+    def notify_config_changed(self, brand: str, url: str):
+        """
+        递增域名配置版本号并发布变更通知
+        
+        Args:
+            brand: 品牌名称
+            url: 新提交的域名URL
+        """
+        try:
+            version = self.redis_client.incr(self.config_version_key)
+            notice = {"brand": brand, "url": url, "version": version}
+            receivers = self.redis_client.publish(self.config_channel, json.dumps(notice))
+            self.logger.info(f"已发布域名配置变更通知: {brand} -> {url} (版本 {version}, {receivers} 个订阅者)")
+        except Exception as e:
+            # 通知失败时拨测服务仍会在定时刷新时获取新域名
+            self.logger.error(f"发布域名配置变更通知失败: {e}")
+    
+    def single_check_and_process(self, brands: list = None) -> dict:
         """
         执行一次完整的检查和处理流程
         
+        Args:
+            brands: 要检查的品牌列表，默认检查全部品牌
+            
         Returns:
             dict: 处理结果
         """
@@ -149,7 +288,7 @@ class DomainCoordinator:
         
         try:
             # 1. 执行域名健康监控检查
-            monitor_results = monitor_single_check()
+            monitor_results = monitor_single_check(brands)
             
             process_results = {}
             
@@ -166,7 +305,11 @@ class DomainCoordinator:
                 if result.get("should_create") and result.get("new_domain"):
                     new_domain_info = result["new_domain"]
                     
-                    if new_domain_info["status"] in ["created", "existed"]:
+                    if new_domain_info["status"] == "existing":
+                        new_domain_info = self._resolve_existing_backup(brand, result)
+                        result["new_domain"] = new_domain_info
+                    
+                    if new_domain_info["status"] in ["created", "existed", "promoted", "existing"]:
                         # 处理域名添加到GitHub
                         github_success = self.process_domain_creation(brand, new_domain_info)
                         process_result["github_updated"] = github_success
@@ -179,6 +322,10 @@ class DomainCoordinator:
                         process_result["error"] = "域名创建失败"
                 
                 process_results[brand] = process_result
+                
+                # 提升了备用域名，立即补充备用池
+                if result.get("new_domain") and result["new_domain"].get("status") == "promoted":
+                    self._request_standby_refill()
             
             self.logger.info("域名监控检查完成")
             return {
@@ -195,14 +342,150 @@ class DomainCoordinator:
                 "error": str(e)
             }
     
+    def _request_standby_refill(self):
+        """通知备用池维护任务立即补充（可在工作线程中调用）"""
+        if self.standby_pool and self._loop:
+            self._loop.call_soon_threadsafe(self._standby_refill.set)
+    
+    async def _maintain_standby_forever(self):
+        """定时（或提升备用域名后立即）检测并补充备用域名池"""
+        while True:
+            try:
+                await asyncio.to_thread(self.standby_pool.maintain_all)
+            except Exception as e:
+                self.logger.error(f"维护备用域名池失败: {e}", exc_info=True)
+            
+            try:
+                await asyncio.wait_for(self._standby_refill.wait(), self.standby_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._standby_refill.clear()
+    
+    async def run_check(self, brands: list = None) -> dict:
+        """在线程中执行检查，与其他检查互斥"""
+        async with self._check_lock:
+            return await asyncio.to_thread(self.single_check_and_process, brands)
+    
+    def _ensure_events_group(self):
+        """创建事件流消费组（已存在时忽略）"""
+        try:
+            # 从最新位置开始消费，启动前的历史结果由首次定时检查覆盖
+            self.redis_client.xgroup_create(self.events_stream, self.events_group, id="$", mkstream=True)
+            self.logger.info(f"已创建事件流消费组: {self.events_group}")
+        except Exception as e:
+            if "BUSYGROUP" not in str(e):
+                raise
+    
+    def _is_unhealthy_event(self, event: dict) -> bool:
+        """
+        判断拨测结果事件是否需要触发检查（只关注主域名）
+        
+        Args:
+            event: 事件字段
+            
+        Returns:
+            bool: 结果不可用或未达到健康阈值时返回True
+        """
+        if event.get("primary") == "0":
+            return False  # 备用域名不健康不影响品牌，由排行榜记录
+        if event.get("is_available") == "0":
+            return True
+        health_data = {
+            "domain": event.get("domain", ""),
+            "success_rate": float(event.get("success_rate", 0)),
+            "average_response_time_ms": float(event.get("average_response_time_ms", 999999))
+        }
+        return self.health_monitor.should_create_new_domain(health_data)
+    
+    async def consume_events(self):
+        """
+        通过消费组订阅拨测结果事件，收到不健康的结果后立即检查对应品牌
+        
+        先处理本消费者未确认的事件（上次退出前未处理完的），再读取新事件
+        """
+        await asyncio.to_thread(self._ensure_events_group)
+        read_id = "0"
+        
+        while True:
+            try:
+                response = await asyncio.to_thread(
+                    self.redis_client.xreadgroup,
+                    self.events_group,
+                    self.events_consumer,
+                    {self.events_stream: read_id},
+                    count=100,
+                    block=5000
+                )
+            except Exception as e:
+                self.logger.error(f"读取拨测事件失败: {e}")
+                await asyncio.sleep(5)
+                continue
+            
+            messages = response[0][1] if response else []
+            if not messages:
+                # 未确认的事件已处理完，开始读取新事件
+                read_id = ">"
+                continue
+            
+            brands = set()
+            for _, fields in messages:
+                if not fields:
+                    continue  # 事件流被裁剪后，未确认事件的内容可能已不存在
+                event = {k.decode('utf-8'): v.decode('utf-8') for k, v in fields.items()}
+                if event.get("brand") and self._is_unhealthy_event(event):
+                    brands.add(event["brand"])
+            
+            if brands:
+                self.logger.warning(f"收到不健康的拨测结果，立即检查品牌: {', '.join(sorted(brands))}")
+                result = await self.run_check(sorted(brands))
+                if not result["success"]:
+                    # 不确认事件，下次从未确认的事件重新处理
+                    self.logger.error(f"事件触发的检查失败: {result.get('error', '未知错误')}")
+                    read_id = "0"
+                    await asyncio.sleep(5)
+                    continue
+            
+            await asyncio.to_thread(
+                self.redis_client.xack,
+                self.events_stream,
+                self.events_group,
+                *[message_id for message_id, _ in messages]
+            )
+    
     async def start_monitoring(self):
         """开始持续监控"""
         self.logger.info(f"开始持续域名协调监控，每{self.check_interval}分钟检查一次")
         
+        self._loop = asyncio.get_running_loop()
+        tasks = []
+        if self.events_enabled:
+            tasks.append(asyncio.create_task(self._consume_events_forever()))
+        if self.standby_pool:
+            tasks.append(asyncio.create_task(self._maintain_standby_forever()))
+        
+        try:
+            await self._poll_forever()
+        finally:
+            for task in tasks:
+                task.cancel()
+    
+    async def _consume_events_forever(self):
+        """事件订阅出错时记录日志并重新订阅"""
+        while True:
+            try:
+                await self.consume_events()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.logger.error(f"拨测事件订阅中断: {e}", exc_info=True)
+                await asyncio.sleep(30)
+    
+    async def _poll_forever(self):
+        """定时检查全部品牌（兜底）"""
         while True:
             try:
                 # 执行检查和处理
-                result = self.single_check_and_process()
+                result = await self.run_check()
                 
                 if result["success"]:
                     self.logger.info(f"本轮检查完成，等待{self.check_interval}分钟...")
@@ -7,11 +7,13 @@
 import asyncio
 import json
 import os
-import redis
-import requests
+import secrets
+import time
 from datetime import date
 from dotenv import load_dotenv
 from logging_config import setup_logging
+from failover_ledger import FailoverLedger, STEP_DNS, STEP_STANDBY
+from standby_pool import StandbyPoolManager
 
 # 加载环境变量
 load_dotenv()
@@ -35,6 +37,7 @@ class CloudflareManager:
     
     def get_zone_id(self, domain):
         """获取域名的Zone ID"""
+        import requests
         if domain in self.zone_cache:
             return self.zone_cache[domain]
         
@@ -60,6 +63,7 @@ class CloudflareManager:
     
     def create_a_record(self, zone_id, name, ip, ttl=300):
         """创建A记录"""
+        import requests
         url = f"{self.base_url}/zones/{zone_id}/dns_records"
         
         data = {
@@ -88,6 +92,7 @@ class CloudflareManager:
     
     def check_record_exists(self, zone_id, name):
         """检查DNS记录是否已存在"""
+        import requests
         url = f"{self.base_url}/zones/{zone_id}/dns_records"
         params = {"name": name, "type": "A"}
         
@@ -103,38 +108,159 @@ class CloudflareManager:
         except Exception as e:
             logger.error(f"检查DNS记录时发生错误: {e}")
             return None
+    
+    def delete_record(self, zone_id, name):
+        """
+        删除A记录
+        
+        Returns:
+            bool: 删除成功或记录不存在时返回True
+        """
+        import requests
+        record = self.check_record_exists(zone_id, name)
+        if not record:
+            return True
+        
+        url = f"{self.base_url}/zones/{zone_id}/dns_records/{record['id']}"
+        try:
+            response = requests.delete(url, headers=self.headers)
+            response.raise_for_status()
+            result = response.json()
+            
+            if result["success"]:
+                logger.info(f"成功删除A记录: {name}")
+                return True
+            else:
+                logger.error(f"删除A记录失败: {result}")
+                return False
+                
+        except Exception as e:
+            logger.error(f"删除A记录时发生错误: {e}")
+            return False
 
 class DomainHealthMonitor:
     """域名健康监控器"""
     
     def __init__(self, redis_host, redis_port, redis_db):
+        import redis
         self.redis_client = redis.Redis(host=redis_host, port=redis_port, db=redis_db)
         self.success_rate_threshold = 0.7  # 成功率低于70%时触发
         self.response_time_threshold = 15000  # 响应时间超过15秒时触发
-        
-    def get_domain_health(self, brand):
-        """获取指定品牌的域名健康状况"""
+        # caddy_ssh_manager.log_tail汇总的真实访问数据统计窗口（分钟）
+        self.traffic_window_minutes = int(os.environ.get("TRAFFIC_WINDOW_MINUTES", 10))
+        # 真实访问请求数达到该值时才参与判断，避免少量请求的偶发错误触发切换
+        self.traffic_min_requests = int(os.environ.get("TRAFFIC_MIN_REQUESTS", 50))
+        self.traffic_5xx_threshold = float(os.environ.get("TRAFFIC_5XX_THRESHOLD", 0.2))  # 5xx比例超过20%时触发
+        self.traffic_latency_threshold = float(os.environ.get("TRAFFIC_LATENCY_THRESHOLD", 15000))  # 平均延迟超过15秒时触发
+        # 备用域名的拨测结果超过该时间（秒）时不作为切换目标
+        self.backup_max_age = int(os.environ.get("BACKUP_MAX_AGE", 14400))
+        
+    def get_traffic_stats(self, domain):
+        """
+        读取域名最近一段时间的真实访问统计（来自Caddy访问日志采集）
+        
+        Args:
+            domain: 域名
+            
+        Returns:
+            dict: 请求数、5xx比例和平均延迟，没有访问数据时返回None
+        """
         try:
-            # 获取品牌的域名列表
-            brand_key = f"domain_test:brand:{brand}"
-            brand_data = self.redis_client.get(brand_key)
+            current_minute = int(time.time() // 60 * 60)
+            keys = [f"caddy_log:{domain.lower()}:{current_minute - i * 60}"
+                    for i in range(self.traffic_window_minutes)]
             
-            if not brand_data:
-                logger.warning(f"未找到品牌 {brand} 的数据")
-                return None
+            pipe = self.redis_client.pipeline(transaction=False)
+            for key in keys:
+                pipe.hgetall(key)
             
-            if isinstance(brand_data, bytes):
-                brand_domains = json.loads(brand_data.decode('utf-8'))
-            elif isinstance(brand_data, str):
-                brand_domains = json.loads(brand_data)
-            else:
-                logger.error(f"未知的brand_data类型: {type(brand_data)}")
+            totals = {}
+            for minute_data in pipe.execute():
+                for field, value in minute_data.items():
+                    field = field.decode('utf-8') if isinstance(field, bytes) else field
+                    totals[field] = totals.get(field, 0) + float(value)
+            
+            requests_count = int(totals.get("count", 0))
+            if not requests_count:
                 return None
+            
+            return {
+                "window_minutes": self.traffic_window_minutes,
+                "requests": requests_count,
+                "error_rate_5xx": totals.get("s5xx", 0) / requests_count,
+                "average_latency_ms": totals.get("duration_ms_sum", 0) / requests_count
+            }
+        except Exception as e:
+            logger.error(f"获取域名访问统计失败 {domain}: {e}")
+            return None
+        
+    def get_brand_leaderboard(self, brand):
+        """
+        读取品牌的域名排行榜（拨测服务按可用性、成功率和响应时间排序）
+        
+        Args:
+            brand: 品牌名称
+            
+        Returns:
+            list: 排行榜，没有数据时返回空列表
+        """
+        brand_data = self.redis_client.get(f"domain_test:brand:{brand}")
+        if not brand_data:
+            return []
+        
+        if isinstance(brand_data, bytes):
+            brand_data = brand_data.decode('utf-8')
+        leaderboard = json.loads(brand_data)
+        return leaderboard if isinstance(leaderboard, list) else []
+    
+    def is_healthy(self, entry):
+        """排行榜中的域名是否达到健康阈值"""
+        success_rate = entry.get("success_rate", 0)
+        if success_rate > 1:
+            success_rate = success_rate / 100
+        return (entry.get("is_available", False)
+                and success_rate >= self.success_rate_threshold
+                and entry.get("average_response_time_ms", 999999) <= self.response_time_threshold)
+    
+    def find_healthy_backup(self, brand, exclude_domain=None):
+        """
+        从排行榜中选出响应最快的健康备用域名
+        
+        Args:
+            brand: 品牌名称
+            exclude_domain: 要排除的域名（当前不健康的主域名）
+            
+        Returns:
+            dict: 排行榜中的域名记录，没有合适的备用域名时返回None
+        """
+        try:
+            now = time.time()
+            candidates = [
+                entry for entry in self.get_brand_leaderboard(brand)
+                if entry.get("domain") != exclude_domain
+                and not entry.get("primary", True)
+                and self.is_healthy(entry)
+                and now - entry.get("timestamp", 0) <= self.backup_max_age
+            ]
+        except Exception as e:
+            logger.error(f"读取品牌 {brand} 的排行榜失败: {e}")
+            return None
+        
+        if not candidates:
+            return None
+        return min(candidates, key=lambda entry: entry.get("average_response_time_ms", 999999))
+    
+    def get_domain_health(self, brand):
+        """获取指定品牌的域名健康状况"""
+        try:
+            # 获取品牌的域名排行榜
+            brand_domains = self.get_brand_leaderboard(brand)
             if not brand_domains:
+                logger.warning(f"未找到品牌 {brand} 的数据")
                 return None
             
-            # 获取第一个域名的详细健康数据
-            primary_domain = brand_domains[0]
+            # 获取主域名的详细健康数据；刚切换、新主域名尚未拨测时以排行榜第一名为准
+            primary_domain = next((d for d in brand_domains if d.get("primary", True)), brand_domains[0])
             domain_name = primary_domain.get("domain")
             
             if not domain_name:
@@ -160,6 +286,7 @@ class DomainHealthMonitor:
                 "success_rate": health_data.get("success_rate", 0),
                 "average_response_time_ms": health_data.get("average_response_time_ms", 999999),
                 "timestamp": health_data.get("timestamp", 0),
+                "traffic": self.get_traffic_stats(domain_name),
                 "raw_data": health_data
             }
             
@@ -167,10 +294,18 @@ class DomainHealthMonitor:
             logger.error(f"获取域名健康数据失败 {brand}: {e}")
             return None
     
-    def should_create_new_domain(self, health_data):
-        """判断是否需要创建新域名"""
+    def get_unhealthy_reason(self, health_data):
+        """
+        根据拨测结果和真实访问统计判断域名是否不健康
+        
+        Args:
+            health_data: get_domain_health_data返回的健康数据
+            
+        Returns:
+            str: 不健康的原因，健康时返回None
+        """
         if not health_data:
-            return False
+            return None
         
         success_rate = health_data.get("success_rate", 1.0)
         response_time = health_data.get("average_response_time_ms", 0)
@@ -181,14 +316,30 @@ class DomainHealthMonitor:
         
         # 检查成功率是否过低
         if success_rate < self.success_rate_threshold:
-            logger.info(f"域名 {health_data['domain']} 成功率过低: {success_rate:.2%}")
-            return True
+            return f"成功率过低: {success_rate:.2%}"
         
         # 检查响应时间是否过长
         if response_time > self.response_time_threshold:
-            logger.info(f"域名 {health_data['domain']} 响应时间过长: {round(response_time)}ms")
-            return True
+            return f"响应时间过长: {round(response_time)}ms"
+        
+        # 检查真实访问（请求数不足时只有拨测结果参与判断）
+        traffic = health_data.get("traffic")
+        if traffic and traffic["requests"] >= self.traffic_min_requests:
+            if traffic["error_rate_5xx"] > self.traffic_5xx_threshold:
+                return (f"真实访问5xx比例过高: {traffic['error_rate_5xx']:.2%}"
+                        f"（最近{traffic['window_minutes']}分钟 {traffic['requests']} 次请求）")
+            if traffic["average_latency_ms"] > self.traffic_latency_threshold:
+                return (f"真实访问平均延迟过长: {round(traffic['average_latency_ms'])}ms"
+                        f"（最近{traffic['window_minutes']}分钟 {traffic['requests']} 次请求）")
         
+        return None
+    
+    def should_create_new_domain(self, health_data):
+        """判断是否需要创建新域名"""
+        reason = self.get_unhealthy_reason(health_data)
+        if reason:
+            logger.info(f"域名 {health_data['domain']} {reason}")
+            return True
         return False
 
 class DomainNameGenerator:
@@ -208,6 +359,11 @@ class DomainNameGenerator:
             prefix = f"api{brand.lower()}"
         
         return f"{prefix}{date_str}"
+    
+    @staticmethod
+    def generate_standby_subdomain(brand):
+        """生成备用子域名（同一天可生成多个，带随机后缀）"""
+        return f"{DomainNameGenerator.generate_subdomain(brand)}s{secrets.token_hex(2)}"
 
 class DomainMonitor:
     """主域名监控类"""
@@ -229,6 +385,10 @@ class DomainMonitor:
         self.cf_manager = CloudflareManager(self.cf_email, self.cf_api_key)
         self.health_monitor = DomainHealthMonitor(redis_host, redis_port, redis_db)
         self.domain_generator = DomainNameGenerator()
+        self.failover_ledger = FailoverLedger(
+            self.health_monitor.redis_client,
+            int(os.environ.get("FAILOVER_LEDGER_TTL", 172800))
+        )
         
         # 品牌域名映射
         self.brand_domains = {
@@ -236,11 +396,86 @@ class DomainMonitor:
             "v2word": self.v2word_domain
         }
         
+        # 预置备用域名池（STANDBY_POOL_SIZE为0时不启用）
+        self.standby_pool = StandbyPoolManager(
+            self.health_monitor.redis_client,
+            self.cf_manager,
+            self.domain_generator,
+            self.brand_domains,
+            self.caddy_ip,
+            size=int(os.environ.get("STANDBY_POOL_SIZE", 0)),
+            max_age=int(os.environ.get("STANDBY_MAX_AGE", 1800)),
+            grace_period=int(os.environ.get("STANDBY_GRACE_PERIOD", 1800))
+        )
+        
         logger.info(f"域名监控器已初始化: CF={self.cf_email}, Caddy IP={self.caddy_ip}")
     
-    def create_new_domain_for_brand(self, brand):
-        """为指定品牌创建新的域名解析，返回创建的域名信息"""
+    def promote_standby_for_brand(self, brand, failing_domain=None):
+        """
+        提升品牌的备用域名
+        
+        Args:
+            brand: 品牌名称
+            failing_domain: 当前不健康的域名，同一故障域名重复检查时沿用已提升的备用域名
+            
+        Returns:
+            dict: 被提升的域名信息，没有可用的备用域名时返回None
+        """
+        if failing_domain:
+            promoted_step = self.failover_ledger.get_step(brand, failing_domain, STEP_STANDBY)
+            if promoted_step:
+                logger.info(f"故障域名 {failing_domain} 今日已提升备用域名 {promoted_step['domain']}，沿用")
+                return {
+                    "brand": brand,
+                    "domain": promoted_step["domain"],
+                    "status": "promoted",
+                    "description": f"自动生成的域名 - {brand}",
+                    "from_ledger": True
+                }
+        
+        entry = self.standby_pool.promote(brand)
+        if not entry:
+            return None
+        
+        if failing_domain:
+            self.failover_ledger.mark_done(brand, failing_domain, STEP_STANDBY, domain=entry["domain"])
+        self.failover_ledger.mark_done(brand, entry["domain"], STEP_DNS, status="promoted")
+        return {
+            "brand": brand,
+            "domain": entry["domain"],
+            "status": "promoted",
+            "description": f"自动生成的域名 - {brand}",
+            "response_time_ms": entry.get("response_time_ms")
+        }
+    
+    def create_new_domain_for_brand(self, brand, failing_domain=None, use_backup=True):
+        """
+        为指定品牌选择切换目标，返回域名信息
+        
+        依次尝试：配置中已有的健康备用域名（status=existing）、
+        备用池中的域名（status=promoted）、新生成的域名（status=created/existed）；
+        use_backup为False时跳过已有的备用域名
+        """
         try:
+            # 优先切换到已在配置中、拨测健康的备用域名，无需操作Cloudflare
+            backup = self.health_monitor.find_healthy_backup(brand, failing_domain) if use_backup else None
+            if backup:
+                logger.info(f"品牌 {brand} 切换到已有的健康备用域名: {backup['domain']} "
+                            f"(成功率 {backup.get('success_rate')}, 响应时间 {round(backup.get('average_response_time_ms', 0))}ms)")
+                return {
+                    "brand": brand,
+                    "domain": backup["domain"],
+                    "status": "existing",
+                    "description": backup.get("name", "")
+                }
+            
+            # 其次提升已就绪的备用池域名，无需等待DNS生效
+            if self.standby_pool.enabled:
+                promoted = self.promote_standby_for_brand(brand, failing_domain)
+                if promoted:
+                    return promoted
+                logger.warning(f"品牌 {brand} 没有可用的备用域名，生成新域名")
+            
             # 获取品牌对应的主域名
             main_domain = self.brand_domains.get(brand)
             if not main_domain:
@@ -253,6 +488,18 @@ class DomainMonitor:
             
             logger.info(f"为品牌 {brand} 生成新域名: {full_domain}")
             
+            # 今天已为该域名完成过DNS步骤，跳过Cloudflare请求
+            dns_step = self.failover_ledger.get_step(brand, full_domain, STEP_DNS)
+            if dns_step:
+                logger.info(f"域名 {full_domain} 今日已完成DNS解析，跳过Cloudflare操作")
+                return {
+                    "brand": brand,
+                    "domain": full_domain,
+                    "status": dns_step.get("status", "existed"),
+                    "description": f"自动生成的域名 - {brand}",
+                    "from_ledger": True
+                }
+            
             # 获取Cloudflare Zone ID
             zone_id = self.cf_manager.get_zone_id(main_domain)
             if not zone_id:
@@ -263,6 +510,7 @@ class DomainMonitor:
             existing_record = self.cf_manager.check_record_exists(zone_id, full_domain)
             if existing_record:
                 logger.info(f"域名 {full_domain} 已存在，跳过创建")
+                self.failover_ledger.mark_done(brand, full_domain, STEP_DNS, status="existed")
                 return {
                     "brand": brand,
                     "domain": full_domain,
@@ -274,6 +522,7 @@ class DomainMonitor:
             result = self.cf_manager.create_a_record(zone_id, full_domain, self.caddy_ip)
             if result:
                 logger.info(f"成功为品牌 {brand} 创建新域名: {full_domain} -> {self.caddy_ip}")
+                self.failover_ledger.mark_done(brand, full_domain, STEP_DNS, status="created", ip=self.caddy_ip)
                 return {
                     "brand": brand,
                     "domain": full_domain,
@@ -319,7 +568,7 @@ class DomainMonitor:
                     # 判断是否需要创建新域名
                     if self.health_monitor.should_create_new_domain(health_data):
                         logger.warning(f"品牌 {brand} 域名健康状况不佳，准备创建新域名")
-                        success = self.create_new_domain_for_brand(brand)
+                        success = self.create_new_domain_for_brand(brand, health_data["domain"])
                         if success:
                             logger.info(f"品牌 {brand} 新域名创建成功")
                         else:
@@ -327,6 +576,10 @@ class DomainMonitor:
                     else:
                         logger.info(f"品牌 {brand} 域名健康状况良好")
                 
+                # 补充备用域名池（需要能配置Caddy站点，单独运行时由协调程序负责）
+                if self.standby_pool.can_maintain:
+                    self.standby_pool.maintain_all()
+                
                 # 等待下次检查（每10分钟检查一次）
                 logger.info("域名监控周期完成，等待10分钟后继续...")
                 await asyncio.sleep(600)
@@ -380,20 +633,8 @@ def should_create_new_domain(brand: str) -> tuple:
         
         health_monitor = DomainHealthMonitor(redis_host, redis_port, redis_db)
         
-        if health_monitor.should_create_new_domain(health_data):
-            success_rate = health_data.get("success_rate", 1.0)
-            if success_rate > 1:
-                success_rate = success_rate / 100
-            
-            response_time = health_data.get("average_response_time_ms", 0)
-            
-            if success_rate < health_monitor.success_rate_threshold:
-                reason = f"成功率过低: {success_rate:.2%}"
-            elif response_time > health_monitor.response_time_threshold:
-                reason = f"响应时间过长: {round(response_time)}ms"
-            else:
-                reason = "域名健康状况不佳"
-            
+        reason = health_monitor.get_unhealthy_reason(health_data)
+        if reason:
             return True, health_data, reason
         else:
             return False, health_data, "域名健康状况良好"
@@ -402,19 +643,21 @@ def should_create_new_domain(brand: str) -> tuple:
         logger.error(f"判断是否需要创建新域名失败: {e}")
         return False, None, f"检查失败: {str(e)}"
 
-def create_new_domain(brand: str) -> dict:
+def create_new_domain(brand: str, failing_domain: str = None, use_backup: bool = True) -> dict:
     """
-    为指定品牌创建新域名
+    为指定品牌创建新域名（启用备用池时优先提升备用域名）
     
     Args:
         brand: 品牌名称
+        failing_domain: 当前不健康的域名
+        use_backup: 是否优先切换到配置中已有的健康备用域名
         
     Returns:
         dict: 创建结果，包含域名信息，失败返回None
     """
     try:
         monitor = DomainMonitor()
-        return monitor.create_new_domain_for_brand(brand)
+        return monitor.create_new_domain_for_brand(brand, failing_domain, use_backup)
     except Exception as e:
         logger.error(f"创建新域名失败: {e}")
         return None
@@ -456,10 +699,17 @@ def monitor_single_check(brands: list = None) -> dict:
             logger.info(f"品牌 {brand}: 域名={health_data['domain']}, "
                       f"成功率={success_rate:.2%}, "
                       f"响应时间={round(health_data['average_response_time_ms'])}ms")
+            
+            traffic = health_data.get("traffic")
+            if traffic:
+                logger.info(f"品牌 {brand} 最近{traffic['window_minutes']}分钟真实访问: "
+                          f"请求数={traffic['requests']}, "
+                          f"5xx比例={traffic['error_rate_5xx']:.2%}, "
+                          f"平均延迟={round(traffic['average_latency_ms'])}ms")
         
         if should_create:
             logger.warning(f"品牌 {brand} 域名健康状况不佳: {reason}")
-            new_domain_info = create_new_domain(brand)
+            new_domain_info = create_new_domain(brand, health_data["domain"])
             if new_domain_info:
                 result["new_domain"] = new_domain_info
                 logger.info(f"品牌 {brand} 新域名创建成功: {new_domain_info['domain']}")
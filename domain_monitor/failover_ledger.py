@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""
+故障切换操作记录
+按 品牌/新域名/日期 在Redis中记录已完成的切换步骤（DNS解析、GitHub提交），
+品牌持续不健康时重复的检查周期据此跳过已完成的Cloudflare和GitHub操作
+"""
+
+import json
+import logging
+import os
+import time
+from datetime import date
+
+logger = logging.getLogger("domain_monitor")
+
+# 切换步骤
+STEP_DNS = "dns"
+STEP_GITHUB = "github"
+STEP_STANDBY = "standby"  # 记录在故障域名上，值为被提升的备用域名
+
+
+class FailoverLedger:
+    """故障切换步骤记录"""
+    
+    def __init__(self, redis_client, ttl=172800):
+        """
+        初始化操作记录
+        
+        Args:
+            redis_client: Redis客户端
+            ttl: 记录保留时间（秒），默认两天，覆盖跨日的重复检查
+        """
+        self.redis_client = redis_client
+        self.ttl = ttl
+    
+    @classmethod
+    def from_env(cls):
+        """根据环境变量中的Redis配置创建"""
+        import redis
+        redis_client = redis.Redis(
+            host=os.environ.get("REDIS_HOST", "127.0.0.1"),
+            port=int(os.environ.get("REDIS_PORT", 6380)),
+            db=int(os.environ.get("REDIS_DB", 0))
+        )
+        return cls(redis_client, int(os.environ.get("FAILOVER_LEDGER_TTL", 172800)))
+    
+    @staticmethod
+    def ledger_key(brand, domain, day=None):
+        """操作记录的Redis键"""
+        day = day or date.today().strftime("%Y%m%d")
+        return f"failover_ledger:{brand}:{domain.lower()}:{day}"
+    
+    def get_step(self, brand, domain, step):
+        """
+        读取已完成步骤的记录
+        
+        Args:
+            brand: 品牌名称
+            domain: 切换到的新域名
+            step: 步骤名称
+        
+        Returns:
+            dict: 步骤记录，未完成或读取失败时返回None
+        """
+        try:
+            data = self.redis_client.hget(self.ledger_key(brand, domain), step)
+            if not data:
+                return None
+            if isinstance(data, bytes):
+                data = data.decode('utf-8')
+            return json.loads(data)
+        except Exception as e:
+            # 读取失败时按未完成处理，宁可重复执行也不跳过切换
+            logger.error(f"读取故障切换记录失败 {brand}/{domain}/{step}: {e}")
+            return None
+    
+    def is_done(self, brand, domain, step):
+        """步骤是否已完成"""
+        return self.get_step(brand, domain, step) is not None
+    
+    def mark_done(self, brand, domain, step, **info):
+        """
+        记录步骤已完成
+        
+        Args:
+            brand: 品牌名称
+            domain: 切换到的新域名
+            step: 步骤名称
+            info: 附加信息，如DNS记录状态
+        """
+        key = self.ledger_key(brand, domain)
+        record = {"completed_at": int(time.time()), **info}
+        try:
+            pipe = self.redis_client.pipeline(transaction=True)
+            pipe.hset(key, step, json.dumps(record, ensure_ascii=False))
+            pipe.expire(key, self.ttl)
+            pipe.execute()
+        except Exception as e:
+            logger.error(f"写入故障切换记录失败 {brand}/{domain}/{step}: {e}")
@@ -0,0 +1,276 @@
+#!/usr/bin/env python3
+"""
+预置备用域名池
+为每个品牌预先创建K个DNS已生效、已通过检测的备用子域名，
+故障切换时直接提升最优的备用域名，池子在后台补充，恢复时间只剩一次GitHub提交
+"""
+
+import json
+import logging
+import time
+
+logger = logging.getLogger("domain_monitor")
+
+# 备用域名状态
+PENDING = "pending"
+HEALTHY = "healthy"
+UNHEALTHY = "unhealthy"
+EVICTING = "evicting"  # 等待删除DNS记录和Caddy站点，不参与提升
+
+# 只更新仍在池中的备用域名，避免检测期间被提升的域名又被写回池子
+UPDATE_IF_EXISTS_SCRIPT = """
+if redis.call('HEXISTS', KEYS[1], ARGV[1]) == 1 then
+    return redis.call('HSET', KEYS[1], ARGV[1], ARGV[2])
+end
+return -1
+"""
+
+
+class StandbyPoolManager:
+    """备用域名池管理器"""
+    
+    def __init__(self, redis_client, cf_manager, domain_generator, brand_domains, caddy_ip,
+                 size=0, max_age=1800, grace_period=1800, max_failures=3, check_timeout=10,
+                 caddy_provisioner=None, caddy_remover=None):
+        """
+        初始化备用域名池
+        
+        Args:
+            redis_client: Redis客户端
+            cf_manager: Cloudflare DNS管理器
+            domain_generator: 域名名称生成器
+            brand_domains: 品牌 -> 主域名
+            caddy_ip: 备用域名解析到的IP
+            size: 每个品牌保持的备用域名数量，0表示不启用
+            max_age: 备用域名最近一次检测超过该时间（秒）时不参与提升
+            grace_period: 新建备用域名等待DNS生效的时间（秒），期间检测失败不会被移出池子
+            max_failures: 连续检测失败达到该次数后移出池子
+            check_timeout: 检测请求超时（秒）
+            caddy_provisioner: 可选的 (domain, brand) -> bool，为新备用域名配置Caddy站点
+            caddy_remover: 可选的 (domain, brand) -> bool，移出池子时删除备用域名的Caddy站点
+        """
+        self.redis_client = redis_client
+        self.cf_manager = cf_manager
+        self.domain_generator = domain_generator
+        self.brand_domains = brand_domains
+        self.caddy_ip = caddy_ip
+        self.size = max(0, size)
+        self.max_age = max_age
+        self.grace_period = grace_period
+        self.max_failures = max_failures
+        self.check_timeout = check_timeout
+        self.caddy_provisioner = caddy_provisioner
+        self.caddy_remover = caddy_remover
+    
+    @property
+    def enabled(self):
+        return self.size > 0
+    
+    @property
+    def can_maintain(self):
+        """能否补充池子：新备用域名需要配置Caddy站点，否则永远无法通过检测"""
+        return self.enabled and self.caddy_provisioner is not None
+    
+    @staticmethod
+    def pool_key(brand):
+        """品牌备用域名池的Redis键"""
+        return f"domain_standby:{brand}"
+    
+    def list_standby(self, brand):
+        """
+        读取品牌的备用域名
+        
+        Returns:
+            list: 备用域名记录列表
+        """
+        entries = []
+        for domain, data in self.redis_client.hgetall(self.pool_key(brand)).items():
+            try:
+                entry = json.loads(data)
+            except (TypeError, ValueError):
+                continue
+            entry["domain"] = domain.decode('utf-8') if isinstance(domain, bytes) else domain
+            entries.append(entry)
+        return entries
+    
+    def _save_entry(self, brand, entry):
+        self.redis_client.hset(self.pool_key(brand), entry["domain"], json.dumps(entry))
+    
+    def _update_entry(self, brand, entry):
+        """更新池中已有的备用域名，域名已被提升（不在池中）时返回False"""
+        updated = self.redis_client.eval(
+            UPDATE_IF_EXISTS_SCRIPT, 1, self.pool_key(brand), entry["domain"], json.dumps(entry))
+        return updated != -1
+    
+    def check_domain(self, domain):
+        """
+        检测备用域名能否通过HTTPS访问（DNS、证书和Caddy站点均已就绪）
+        
+        Returns:
+            tuple: (是否健康, 响应时间ms)
+        """
+        import requests
+        start = time.time()
+        try:
+            response = requests.get(f"https://{domain}", timeout=self.check_timeout, allow_redirects=False)
+            return response.status_code < 500, round((time.time() - start) * 1000, 2)
+        except Exception as e:
+            logger.debug(f"备用域名 {domain} 检测失败: {e}")
+            return False, None
+    
+    def _evict(self, brand, entry):
+        """
+        删除备用域名的DNS记录和Caddy站点后移出池子
+        
+        Returns:
+            bool: 清理完成并已移出池子；清理失败时保留记录，下次维护时重试
+        """
+        domain = entry["domain"]
+        cleaned = True
+        
+        zone_id = self.cf_manager.get_zone_id(self.brand_domains.get(brand, ""))
+        if not zone_id or not self.cf_manager.delete_record(zone_id, domain):
+            logger.error(f"删除备用域名 {domain} 的DNS记录失败，下次维护时重试")
+            cleaned = False
+        
+        if self.caddy_remover and not self.caddy_remover(domain, brand):
+            logger.error(f"删除备用域名 {domain} 的Caddy站点失败，下次维护时重试")
+            cleaned = False
+        
+        if not cleaned:
+            return False
+        
+        self.redis_client.hdel(self.pool_key(brand), domain)
+        logger.warning(f"备用域名 {domain} 已清理并移出品牌 {brand} 的备用池")
+        return True
+    
+    def _refresh_entry(self, brand, entry):
+        """重新检测备用域名，连续失败且已过等待期时清理并移出池子"""
+        if entry.get("status") == EVICTING:
+            return None if self._evict(brand, entry) else entry
+        
+        healthy, response_ms = self.check_domain(entry["domain"])
+        entry["last_check"] = int(time.time())
+        entry["response_time_ms"] = response_ms
+        
+        if healthy:
+            entry["status"] = HEALTHY
+            entry["failures"] = 0
+        else:
+            entry["failures"] = entry.get("failures", 0) + 1
+            if entry.get("status") != PENDING:
+                entry["status"] = UNHEALTHY
+            
+            age = time.time() - entry.get("created_at", 0)
+            if entry["failures"] >= self.max_failures and age > self.grace_period:
+                logger.warning(f"备用域名 {entry['domain']} 连续 {entry['failures']} 次检测失败，准备移出品牌 {brand} 的备用池")
+                # 先标记为清理中（域名已被提升时不再清理），清理失败的记录仍占用池子名额，不会无限补充新域名
+                entry["status"] = EVICTING
+                if not self._update_entry(brand, entry):
+                    return None
+                return None if self._evict(brand, entry) else entry
+        
+        if not self._update_entry(brand, entry):
+            return None
+        return entry
+    
+    def _create_standby(self, brand):
+        """创建一个新的备用域名：DNS记录、Caddy站点，加入池子等待检测"""
+        main_domain = self.brand_domains.get(brand)
+        if not main_domain:
+            logger.error(f"未找到品牌 {brand} 的主域名配置")
+            return None
+        
+        zone_id = self.cf_manager.get_zone_id(main_domain)
+        if not zone_id:
+            logger.error(f"无法获取域名 {main_domain} 的Zone ID")
+            return None
+        
+        full_domain = f"{self.domain_generator.generate_standby_subdomain(brand)}.{main_domain}"
+        if not self.cf_manager.check_record_exists(zone_id, full_domain):
+            if not self.cf_manager.create_a_record(zone_id, full_domain, self.caddy_ip):
+                logger.error(f"创建备用域名DNS记录失败: {full_domain}")
+                return None
+        
+        if self.caddy_provisioner and not self.caddy_provisioner(full_domain, brand):
+            logger.error(f"备用域名 {full_domain} 配置Caddy失败，删除DNS记录，暂不加入备用池")
+            self.cf_manager.delete_record(zone_id, full_domain)
+            return None
+        
+        entry = {
+            "domain": full_domain,
+            "status": PENDING,
+            "created_at": int(time.time()),
+            "last_check": None,
+            "response_time_ms": None,
+            "failures": 0
+        }
+        self._save_entry(brand, entry)
+        logger.info(f"品牌 {brand} 新增备用域名: {full_domain} -> {self.caddy_ip}")
+        return entry
+    
+    def maintain(self, brand):
+        """
+        维护一个品牌的备用池：重新检测已有域名并补足数量
+        
+        Returns:
+            dict: 各状态的备用域名数量
+        """
+        if not self.can_maintain:
+            return {}
+        
+        entries = [e for e in (self._refresh_entry(brand, e) for e in self.list_standby(brand)) if e]
+        
+        for _ in range(self.size - len(entries)):
+            entry = self._create_standby(brand)
+            if not entry:
+                break
+            entry = self._refresh_entry(brand, entry)
+            if entry:
+                entries.append(entry)
+        
+        counts = {PENDING: 0, HEALTHY: 0, UNHEALTHY: 0, EVICTING: 0}
+        for entry in entries:
+            counts[entry.get("status", PENDING)] = counts.get(entry.get("status", PENDING), 0) + 1
+        logger.info(f"品牌 {brand} 备用池: 健康 {counts[HEALTHY]} 个, 等待生效 {counts[PENDING]} 个, "
+                    f"异常 {counts[UNHEALTHY]} 个, 清理中 {counts[EVICTING]} 个（目标 {self.size} 个）")
+        return counts
+    
+    def maintain_all(self):
+        """维护所有品牌的备用池"""
+        if not self.can_maintain:
+            logger.warning("未配置Caddy站点管理，不补充备用域名池")
+            return {}
+        
+        results = {}
+        for brand in self.brand_domains:
+            try:
+                results[brand] = self.maintain(brand)
+            except Exception as e:
+                logger.error(f"维护品牌 {brand} 的备用池失败: {e}")
+        return results
+    
+    def promote(self, brand):
+        """
+        从备用池中取出响应最快的健康域名
+        
+        Returns:
+            dict: 被提升的备用域名记录，没有可用的备用域名时返回None
+        """
+        if not self.enabled:
+            return None
+        
+        now = time.time()
+        candidates = [
+            e for e in self.list_standby(brand)
+            if e.get("status") == HEALTHY and now - (e.get("last_check") or 0) <= self.max_age
+        ]
+        candidates.sort(key=lambda e: e.get("response_time_ms") or float("inf"))
+        
+        for entry in candidates:
+            # HDEL成功才算提升成功，避免并发的检查提升同一个域名
+            if self.redis_client.hdel(self.pool_key(brand), entry["domain"]):
+                logger.info(f"提升品牌 {brand} 的备用域名: {entry['domain']} "
+                            f"(响应时间 {entry.get('response_time_ms')}ms)")
+                return entry
+        return None
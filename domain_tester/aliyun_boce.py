@@ -1,6 +1,11 @@
-from DrissionPage import ChromiumPage, ChromiumOptions
 import time
 import os
+import shutil
+import socket
+import tempfile
+
+from tracing import span
+from selector_cache import SelectorCache
 
 def ensure_screenshot_dir():
     """确保截图保存目录存在"""
@@ -22,13 +27,67 @@ def take_screenshot(page, name_prefix):
         print(f"保存截图失败: {e}")
         return None
     
+# 页面就绪条件的超时（秒），页面提前就绪时立即继续
+DOCUMENT_READY_TIMEOUT = float(os.environ.get("BOCE_DOCUMENT_READY_TIMEOUT", 15))
+NETWORK_IDLE_TIMEOUT = float(os.environ.get("BOCE_NETWORK_IDLE_TIMEOUT", 10))
+# 资源请求数保持不变多久视为网络空闲（秒）
+NETWORK_IDLE_WINDOW = 0.5
+# 条件轮询间隔（秒）
+READY_POLL_INTERVAL = 0.1
+
+def wait_document_ready(page, timeout=DOCUMENT_READY_TIMEOUT):
+    """
+    等待document.readyState变为complete
+    
+    :return: 是否在超时前就绪
+    """
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            if page.run_js("return document.readyState;") == "complete":
+                return True
+        except Exception:
+            pass  # 页面跳转过程中执行脚本可能失败，继续等待
+        time.sleep(READY_POLL_INTERVAL)
+    print(f"等待页面加载完成超时（{timeout}秒）")
+    return False
+
+def wait_network_idle(page, timeout=NETWORK_IDLE_TIMEOUT, idle_window=NETWORK_IDLE_WINDOW):
+    """
+    等待网络空闲：资源请求数在idle_window秒内不再增加
+    
+    :return: 是否在超时前空闲
+    """
+    deadline = time.time() + timeout
+    last_count = None
+    stable_since = time.time()
+    while time.time() < deadline:
+        try:
+            count = page.run_js("return performance.getEntriesByType('resource').length;")
+        except Exception:
+            count = None
+        
+        now = time.time()
+        if count is None or count != last_count:
+            last_count = count
+            stable_since = now
+        elif now - stable_since >= idle_window:
+            return True
+        time.sleep(READY_POLL_INTERVAL)
+    print(f"等待网络空闲超时（{timeout}秒），继续执行")
+    return False
+
 def open_boce_website(page):
-    """打开阿里云拨测网站"""
+    """打开阿里云拨测网站，等待页面加载完成且网络空闲"""
     try:
         print("正在导航至阿里云拨测网站...")
-        page.get('https://boce.aliyun.com/detect/http')
+        with span("navigate"):
+            page.get('https://boce.aliyun.com/detect/http')
         take_screenshot(page, "initial_page")
-        time.sleep(5)  # 等待页面加载
+        with span("document_ready") as ready_span:
+            ready_span.set(ready=wait_document_ready(page))
+        with span("network_idle") as idle_span:
+            idle_span.set(idle=wait_network_idle(page))
         take_screenshot(page, "after_wait")
         return True
     except Exception as e:
@@ -36,39 +95,51 @@ def open_boce_website(page):
         take_screenshot(page, "open_website_failed")
         return False
 
+# URL输入框选择器，第一个为主选择器
+INPUT_SELECTORS = [
+    "xpath://input[contains(@placeholder, 'Please enter')]",
+    "css:input[placeholder*='Please enter']",
+    "css:input[type='text']",
+    "xpath://input[@type='text']",
+    "xpath://div[contains(@class, 'search')]//input",
+    "xpath://div[contains(@class, 'input')]//input"
+]
+
+# 第一个尝试的选择器等待时间更长，其余只做快速确认
+FIRST_SELECTOR_TIMEOUT = 10
+FALLBACK_SELECTOR_TIMEOUT = 5
+
+# 根据日志，保留有效的选择器，移除无效的
+OK_BUTTON_SELECTORS = [
+    "xpath://button[.//span[text()='OK']]",  # 这个选择器有效
+    "css:.ant-btn-primary",  # Ant Design的主按钮，可能有效
+    "xpath://button[contains(text(), 'OK')]",  # 可能有效
+    "css:button[type='submit']"  # 可能有效
+]
+
+# 记录上次命中的选择器，下次优先尝试
+selector_cache = SelectorCache.from_env()
+
 def find_input_field(page):
     """找到并返回URL输入框元素"""
-    # 主选择器
-    url_input_locator = "xpath://input[contains(@placeholder, 'Please enter')]"
-    
-    # 备选选择器
-    alternative_selectors = [
-        "css:input[placeholder*='Please enter']",
-        "css:input[type='text']",
-        "xpath://input[@type='text']",
-        "xpath://div[contains(@class, 'search')]//input",
-        "xpath://div[contains(@class, 'input')]//input"
-    ]
-    
-    # 尝试主选择器
-    try:
-        page.wait.ele_displayed(url_input_locator, timeout=10)
-        url_input_element = page.ele(url_input_locator)
-        print("成功找到输入框，使用选择器:", url_input_locator)
-        return url_input_element
-    except Exception as e:
-        print(f"使用主选择器 {url_input_locator} 查找输入框失败: {e}")
-        take_screenshot(page, "main_selector_failed")
+    # 上次命中的选择器优先，其余按命中率排序
+    selectors = selector_cache.order("input", INPUT_SELECTORS)
     
-    # 尝试备选选择器
-    for selector in alternative_selectors:
+    for index, selector in enumerate(selectors):
+        timeout = FIRST_SELECTOR_TIMEOUT if index == 0 else FALLBACK_SELECTOR_TIMEOUT
         try:
-            page.wait.ele_displayed(selector, timeout=5)
-            url_input_element = page.ele(selector)
-            print(f"成功找到输入框，使用替代选择器: {selector}")
-            return url_input_element
-        except:
-            continue
+            with span(f"selector:{selector}", timeout=timeout):
+                page.wait.ele_displayed(selector, timeout=timeout)
+                url_input_element = page.ele(selector)
+            if url_input_element:
+                selector_cache.record("input", selector, True)
+                print(f"成功找到输入框，使用选择器: {selector}")
+                return url_input_element
+        except Exception as e:
+            print(f"使用选择器 {selector} 查找输入框失败: {e}")
+        selector_cache.record("input", selector, False)
+        if index == 0:
+            take_screenshot(page, "main_selector_failed")
     
     # 如果都失败，打印页面HTML片段并返回None
     print("无法找到URL输入框，输出当前页面HTML片段:")
@@ -88,29 +159,29 @@ def input_url(page, input_element, url):
         take_screenshot(page, "input_url_failed")
         return False
 
-def click_ok_button(page):
-    """点击OK按钮开始拨测"""
-    # 根据日志，保留有效的选择器，移除无效的
-    ok_button_selectors = [
-        "xpath://button[.//span[text()='OK']]",  # 这个选择器有效
-        "css:.ant-btn-primary",  # Ant Design的主按钮，可能有效
-        "xpath://button[contains(text(), 'OK')]",  # 可能有效
-        "css:button[type='submit']"  # 可能有效
-    ]
-    
-    # 尝试点击按钮
-    for selector in ok_button_selectors:
+def click_ok_button(page, input_element=None):
+    """
+    点击OK按钮开始拨测
+    
+    :param page: 页面对象
+    :param input_element: 已找到的URL输入框，按钮都点击失败时在其上按Enter提交
+    """
+    # 尝试点击按钮，上次命中的选择器优先
+    for selector in selector_cache.order("ok_button", OK_BUTTON_SELECTORS):
         try:
-            ok_button = page.ele(selector)
+            with span(f"selector:{selector}") as selector_span:
+                ok_button = page.ele(selector)
+                selector_span.set(found=bool(ok_button))
             if ok_button:
                 take_screenshot(page, f"before_click_button_{selector.replace(':', '_')}")
                 ok_button.click()
+                selector_cache.record("ok_button", selector, True)
                 print(f"已点击OK按钮，使用选择器: {selector}")
                 take_screenshot(page, f"after_click_button_{selector.replace(':', '_')}")
                 return True
         except Exception as e:
             print(f"尝试点击按钮失败，选择器: {selector}, 错误: {e}")
-            continue
+        selector_cache.record("ok_button", selector, False)
     
     # 备用方案: 尝试使用更通用的方法找到按钮
     try:
@@ -127,8 +198,9 @@ def click_ok_button(page):
     
     # 尝试按Enter键
     try:
-        # 找到输入框再按Enter
-        input_element = find_input_field(page)
+        # 优先复用已找到的输入框，避免再次经历选择器等待
+        if input_element is None:
+            input_element = find_input_field(page)
         if input_element:
             input_element.click()
             page.keyboard.press_key(13)  # 13是Enter键的键码
@@ -142,11 +214,20 @@ def click_ok_button(page):
     return False
 
 
-def wait_for_export_button_clickable(page, max_wait_time=180):
-    """等待Export Report按钮出现并且变为可点击状态"""
+# Export Report按钮状态的检查间隔（秒）
+EXPORT_POLL_INTERVAL = float(os.environ.get("BOCE_EXPORT_POLL_INTERVAL", 2))
+
+def wait_for_export_button_clickable(page, max_wait_time=180, should_stop=None):
+    """
+    等待Export Report按钮出现并且变为可点击状态
+    
+    :param page: 页面对象
+    :param max_wait_time: 最长等待时间（秒）
+    :param should_stop: 可选的回调，每轮检查后调用，返回True时提前结束等待并返回None
+    """
     print("等待Export Report按钮出现并变为可点击状态...")
     
-    wait_interval = 5  # 每5秒检查一次
+    wait_interval = EXPORT_POLL_INTERVAL
     start_time = time.time()
     export_button = None
     
@@ -236,6 +317,10 @@ def wait_for_export_button_clickable(page, max_wait_time=180):
             except:
                 continue
         
+        # 部分结果已能确定结论时不再等待其余检测点
+        if should_stop is not None and should_stop(page):
+            return None
+        
         # 如果找到了可点击的按钮，则已在上面的检查中返回
         # 如果没找到，则等待后再次检查
         time.sleep(wait_interval)
@@ -255,107 +340,265 @@ def wait_for_export_button_clickable(page, max_wait_time=180):
     
     return None
 
-def extract_table_data_from_page(page):
-    """直接从网页中提取表格数据而不是下载Excel文件"""
-    print("开始从网页直接提取表格数据...")
-    take_screenshot(page, "before_extract_table")
+# 每次通过CDP读取的表格行数
+TABLE_CHUNK_SIZE = 100
+
+# 在页面中定位表格行和表头，行元素保存在window.__boceRows中供分块读取
+TABLE_LOCATE_JS = """
+    // 定义映射关系，将表格列名映射到Excel文件中的列名
+    const columnMapping = {
+        '探测点': 'Detection Point',
+        '解析结果IP': 'Analysis Result IP',
+        '状态': 'Status',
+        '总响应时间': 'Total Response Time',
+        '解析时间': 'Analysis Time',
+        '建连时间': 'Connection Time',
+        'SSL时间': 'SSL Time',
+        '首包时间': 'First Packet Time',
+        '下载时间': 'Download Time'
+        // 可能需要根据实际情况添加更多映射
+    };
     
-    try:
-        # 使用JavaScript提取表格数据
-        table_data = page.run_js("""
-            // 定义映射关系，将表格列名映射到Excel文件中的列名
-            const columnMapping = {
-                '探测点': 'Detection Point',
-                '解析结果IP': 'Analysis Result IP',
-                '状态': 'Status',
-                '总响应时间': 'Total Response Time',
-                '解析时间': 'Analysis Time',
-                '建连时间': 'Connection Time',
-                'SSL时间': 'SSL Time',
-                '首包时间': 'First Packet Time',
-                '下载时间': 'Download Time'
-                // 可能需要根据实际情况添加更多映射
-            };
-            
-            // 获取表格所有行
-            const tableRows = Array.from(document.querySelectorAll('table tr, .ant-table-row, [role="row"]'));
-            if (!tableRows || tableRows.length <= 1) {
-                // 使用备用选择器尝试
-                const altRows = Array.from(document.querySelectorAll('.ant-table-tbody tr, div[role="rowgroup"] > div'));
-                if (altRows.length > 0) {
-                    tableRows.push(...altRows);
-                } else {
-                    return { error: "找不到表格行" };
-                }
-            }
-            
-            // 尝试查找表头
-            let headerCells = document.querySelectorAll('th, .ant-table-cell, [role="columnheader"]');
-            if (!headerCells || headerCells.length === 0) {
-                // 查找表头失败，尝试使用第一行作为表头
-                if (tableRows.length > 0) {
-                    headerCells = tableRows[0].querySelectorAll('td, th, .ant-table-cell');
-                    tableRows.shift(); // 移除第一行，因为它被当作表头
-                }
-            }
-            
-            // 提取表头文本
-            const headers = Array.from(headerCells).map(cell => {
-                const text = cell.innerText.trim();
-                // 使用映射转换列名
-                return columnMapping[text] || text;
-            });
-            
-            // 提取数据行
-            const rowsData = [];
-            for (const row of tableRows) {
-                const cells = row.querySelectorAll('td, .ant-table-cell, [role="cell"]');
-                if (cells && cells.length > 0) {
-                    rowsData.push(Array.from(cells).map(cell => cell.innerText.trim()));
-                }
-            }
-            
-            // 打印一些调试信息
-            console.log(`找到 ${headers.length} 列表头和 ${rowsData.length} 行数据`);
-            
-            return {
-                headers: headers, 
-                rows: rowsData
-            };
-        """)
+    // 获取表格所有行
+    const tableRows = Array.from(document.querySelectorAll('table tr, .ant-table-row, [role="row"]'));
+    if (!tableRows || tableRows.length <= 1) {
+        // 使用备用选择器尝试
+        const altRows = Array.from(document.querySelectorAll('.ant-table-tbody tr, div[role="rowgroup"] > div'));
+        if (altRows.length > 0) {
+            tableRows.push(...altRows);
+        } else {
+            return { error: "找不到表格行" };
+        }
+    }
+    
+    // 尝试查找表头
+    let headerCells = document.querySelectorAll('th, .ant-table-cell, [role="columnheader"]');
+    if (!headerCells || headerCells.length === 0) {
+        // 查找表头失败，尝试使用第一行作为表头
+        if (tableRows.length > 0) {
+            headerCells = tableRows[0].querySelectorAll('td, th, .ant-table-cell');
+            tableRows.shift(); // 移除第一行，因为它被当作表头
+        }
+    }
+    
+    // 提取表头文本
+    const headers = Array.from(headerCells).map(cell => {
+        const text = cell.innerText.trim();
+        // 使用映射转换列名
+        return columnMapping[text] || text;
+    });
+    
+    // 只保留包含单元格的数据行，并记录最大列数
+    const cellSelector = 'td, .ant-table-cell, [role="cell"]';
+    const dataRows = tableRows.filter(row => row.querySelectorAll(cellSelector).length > 0);
+    const maxCells = dataRows.reduce((max, row) => Math.max(max, row.querySelectorAll(cellSelector).length), 0);
+    window.__boceRows = dataRows;
+    
+    console.log(`找到 ${headers.length} 列表头和 ${dataRows.length} 行数据`);
+    
+    return {
+        headers: headers,
+        row_count: dataRows.length,
+        max_cells: maxCells
+    };
+"""
+
+# 读取window.__boceRows中的一段行数据
+TABLE_CHUNK_JS = """
+    const rows = (window.__boceRows || []).slice(arguments[0], arguments[0] + arguments[1]);
+    return rows.map(row => Array.from(row.querySelectorAll('td, .ant-table-cell, [role="cell"]'))
+        .map(cell => cell.innerText.trim()));
+"""
+
+
+# 读取window.__boceRows中指定列的文本
+TABLE_COLUMN_JS = """
+    const index = arguments[0];
+    return (window.__boceRows || []).map(row => {
+        const cells = row.querySelectorAll('td, .ant-table-cell, [role="cell"]');
+        return cells.length > index ? cells[index].innerText.trim() : '';
+    });
+"""
+
+
+# 检测点仍在检测中时状态列显示的文本（小写比较），其余非空文本（如"-"、"Timeout"）表示检测已结束
+IN_PROGRESS_STATUS_MARKERS = ("testing", "loading", "pending", "waiting", "检测中", "等待")
+
+
+def is_status_pending(status):
+    """
+    检测点状态是否仍在检测中：状态为空或为检测中的提示文本
+    
+    :param status: 状态列文本
+    :return: 是否待定
+    """
+    text = str(status).strip().lower()
+    return not text or any(marker in text for marker in IN_PROGRESS_STATUS_MARKERS)
+
+
+class PartialVerdict:
+    """
+    根据部分检测点结果判断可用性结论是否已确定
+    
+    已完成的检测点中状态码为200的计为成功，其他状态码和"-"、"Timeout"等结束文本计为失败，
+    状态为空或仍在检测中的为待定。
+    即使所有待定检测点都成功也达不到阈值时，不可用的结论已确定；
+    即使所有待定检测点都失败仍达到阈值时，可用的结论已确定。
+    只有表格预先列出了待定的检测点（总数已知）且总数连续两次不变时才做判断
+    """
+    
+    def __init__(self, mode="unhealthy", threshold=70, min_points=10):
+        """
+        :param mode: off不提前结束；unhealthy只在确定不可用时结束；any确定可用或不可用都结束
+        :param threshold: 成功率阈值（%），与DomainHealthMonitor的故障切换阈值一致
+        :param min_points: 至少有多少检测点返回结果后才做判断
+        """
+        self.mode = mode
+        self.threshold = threshold
+        self.min_points = min_points
+        self.verdict = None  # 'unhealthy' / 'healthy'
+        self.counts = None
+        self._last_total = None
+    
+    @classmethod
+    def from_env(cls):
+        """根据环境变量创建"""
+        return cls(
+            mode=os.environ.get("BOCE_EARLY_EXIT", "unhealthy").lower(),
+            threshold=float(os.environ.get("BOCE_EARLY_EXIT_THRESHOLD", 70)),
+            min_points=int(os.environ.get("BOCE_EARLY_EXIT_MIN_POINTS", 10))
+        )
+    
+    @property
+    def enabled(self):
+        return self.mode in ("unhealthy", "any")
+    
+    def evaluate(self, statuses):
+        """
+        根据当前各检测点的状态文本更新结论
         
+        :param statuses: 各检测点的状态列文本
+        :return: 已确定的结论或None
+        """
+        total = len(statuses)
+        pending = sum(1 for status in statuses if is_status_pending(status))
+        success = sum(1 for status in statuses if status == "200")
+        failed = total - success - pending
+        self.counts = {"total": total, "success": success, "failed": failed, "pending": pending}
         
-        if not table_data or 'error' in table_data:
-            print(f"提取表格数据失败: {table_data.get('error', '未知错误')}")
-            # 尝试打印页面HTML帮助调试
-            html_snippet = page.html[:2000]  # 获取页面前2000个字符
-            print(f"页面HTML片段: {html_snippet}")
+        stable = total > 0 and total == self._last_total
+        self._last_total = total
+        if not stable or pending == 0 or success + failed < self.min_points:
             return None
         
-        # 将提取的数据转换为DataFrame
-        import pandas as pd
+        best_rate = (success + pending) / total * 100
+        worst_rate = success / total * 100
+        if best_rate < self.threshold:
+            self.verdict = "unhealthy"
+        elif worst_rate >= self.threshold and self.mode == "any":
+            self.verdict = "healthy"
+        return self.verdict
+    
+    def check(self, page):
+        """读取页面中当前的状态列并判断结论是否已确定"""
+        try:
+            table_info = page.run_js(TABLE_LOCATE_JS)
+            if not table_info or 'error' in table_info:
+                return False
+            headers = table_info.get('headers', [])
+            if 'Status' not in headers:
+                return False
+            statuses = page.run_js(TABLE_COLUMN_JS, headers.index('Status')) or []
+        except Exception as e:
+            print(f"读取部分拨测结果失败: {e}")
+            return False
         
-        headers = table_data.get('headers', [])
-        rows = table_data.get('rows', [])
+        return self.evaluate([str(status).strip() for status in statuses]) is not None
+
+
+def _rows_to_frame(headers, rows, width):
+    """将一段行数据转换为固定列数的DataFrame，缺失的单元格补空字符串"""
+    import pandas as pd
+    
+    df = pd.DataFrame(rows).reindex(columns=range(width)).fillna('')
+    df.columns = headers
+    return df
+
+
+def iter_table_rows(page, chunk_size=TABLE_CHUNK_SIZE, completed_only=False):
+    """
+    分块读取网页中的表格数据
+    
+    :param page: 页面对象
+    :param chunk_size: 每块的行数
+    :param completed_only: 是否只保留已结束检测的行（提前结束时丢弃仍在检测的行，保留"Timeout"等失败的行）
+    :return: 生成器，逐块产出DataFrame
+    """
+    table_info = page.run_js(TABLE_LOCATE_JS)
+    
+    if not table_info or 'error' in table_info:
+        print(f"提取表格数据失败: {(table_info or {}).get('error', '未知错误')}")
+        # 尝试打印页面HTML帮助调试
+        html_snippet = page.html[:2000]  # 获取页面前2000个字符
+        print(f"页面HTML片段: {html_snippet}")
+        return
+    
+    headers = table_info.get('headers', [])
+    row_count = table_info.get('row_count', 0)
+    
+    if not headers or not row_count:
+        print("提取的表格没有表头或数据行")
+        return
+    
+    # 处理列数不匹配的情况
+    width = max(len(headers), table_info.get('max_cells', 0))
+    if len(headers) < width:
+        headers = headers + [f'未命名列{i}' for i in range(len(headers), width)]
+    
+    for offset in range(0, row_count, chunk_size):
+        rows = page.run_js(TABLE_CHUNK_JS, offset, chunk_size)
+        if rows:
+            df = _rows_to_frame(headers, rows, width)
+            if completed_only and 'Status' in df.columns:
+                df = df[~df['Status'].map(is_status_pending)]
+            if not df.empty:
+                yield df
+
+
+def extract_table_data_from_page(page, row_consumer=None, completed_only=False):
+    """
+    直接从网页中提取表格数据而不是下载Excel文件
+    
+    :param page: 页面对象
+    :param row_consumer: 可选的回调，逐块接收DataFrame；提供时不在内存中拼接完整表格
+    :param completed_only: 是否只保留已结束检测的行
+    :return: 未提供row_consumer时返回完整DataFrame，否则返回读取的行数；失败返回None
+    """
+    print("开始从网页直接提取表格数据...")
+    take_screenshot(page, "before_extract_table")
+    
+    try:
+        chunks = []
+        row_count = 0
         
-        if not headers or not rows:
-            print("提取的表格没有表头或数据行")
+        for chunk in iter_table_rows(page, completed_only=completed_only):
+            row_count += len(chunk)
+            if row_consumer is not None:
+                row_consumer(chunk)
+            else:
+                chunks.append(chunk)
+        
+        if row_count == 0:
             return None
         
-        # 处理列数不匹配的情况
-        max_cols = max(len(headers), max(len(row) for row in rows))
-        if len(headers) < max_cols:
-            headers.extend([f'未命名列{i}' for i in range(len(headers), max_cols)])
+        if row_consumer is not None:
+            print(f"成功分块提取{row_count}行数据")
+            return row_count
         
-        # 确保所有行有相同的列数
-        for i, row in enumerate(rows):
-            if len(row) < max_cols:
-                rows[i] = row + [''] * (max_cols - len(row))
-            elif len(row) > max_cols:
-                rows[i] = row[:max_cols]
+        import pandas as pd
         
         # 创建DataFrame
-        df = pd.DataFrame(rows, columns=headers)
+        df = pd.concat(chunks, ignore_index=True)
         print(f"成功创建DataFrame，包含{len(df)}行和以下列:")
         print(df.columns.tolist())
         print("\n数据预览:")
@@ -368,46 +611,154 @@ def extract_table_data_from_page(page):
         take_screenshot(page, "extract_table_error")
         return None
     
-def scrape_aliyun_boce(target_url: str):
+# 精简模式：不加载图片、媒体、字体和统计脚本，使用较小的窗口
+LEAN_PROFILE = os.environ.get("BOCE_LEAN_PROFILE", "true").lower() in ("1", "true", "yes")
+# 多次拨测共享的静态资源磁盘缓存目录，为空时不启用
+DISK_CACHE_DIR = os.environ.get("BOCE_DISK_CACHE_DIR", "")
+
+# 精简模式下拦截的请求（Network.setBlockedURLs通配符）
+# 样式表不拦截：判断Export Report按钮是否可点击依赖计算后的样式
+BLOCKED_URL_PATTERNS = [
+    # 图片
+    "*.png", "*.jpg", "*.jpeg", "*.gif", "*.webp", "*.svg", "*.ico",
+    # 字体
+    "*.woff", "*.woff2", "*.ttf", "*.otf", "*.eot",
+    # 音视频
+    "*.mp4", "*.webm", "*.mp3", "*.m3u8",
+    # 第三方统计和埋点
+    "*google-analytics.com*", "*googletagmanager.com*", "*doubleclick.net*",
+    "*hm.baidu.com*", "*cnzz.com*", "*log.mmstat.com*", "*arms-retcode*"
+]
+
+def find_free_port():
+    """向系统申请一个空闲的本地端口"""
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+def build_chromium_options(profile_dir=None):
     """
-    使用DrissionPage访问阿里云网站拨测工具并抓取HTTP检测结果。
+    创建无头浏览器配置
     
-    :param target_url: 需要检测的网址
-    :return: 提取的数据DataFrame或None
+    :param profile_dir: 可选的浏览器用户目录，指定时同时分配独立的调试端口
+    :return: ChromiumOptions对象
     """
+    from DrissionPage import ChromiumOptions
     
-    # 创建ChromiumOptions对象并配置参数
     options = ChromiumOptions()
     options.headless = True  # 设置为无头模式
     options.set_argument('--no-sandbox')
     options.set_argument('--disable-dev-shm-usage')
     options.set_argument('--headless=new')
-    options.set_argument('--window-size=1920,1080')  # 设置较高的分辨率
+    # 每次拨测使用独立的调试端口和临时用户目录，并发拨测时各自启动浏览器，
+    # 不会接管同一个9222端口上的浏览器，超时结束浏览器时也不影响其他拨测
+    if profile_dir:
+        # 启动前就确定用户目录，浏览器启动卡住时可按目录结束进程
+        options.set_user_data_path(profile_dir)
+        options.set_local_port(find_free_port())
+    else:
+        options.auto_port()
+    
+    if LEAN_PROFILE:
+        # 只需要提交URL和读取结果表格，较小的窗口和禁用图片可减少渲染和内存开销
+        options.set_argument('--window-size=1280,800')
+        options.set_argument('--blink-settings=imagesEnabled=false')
+        options.set_argument('--mute-audio')
+        options.set_argument('--disable-extensions')
+        options.set_argument('--disable-background-networking')
+    else:
+        options.set_argument('--window-size=1920,1080')  # 设置较高的分辨率
+    
+    if DISK_CACHE_DIR:
+        os.makedirs(DISK_CACHE_DIR, exist_ok=True)
+        options.set_argument(f'--disk-cache-dir={os.path.abspath(DISK_CACHE_DIR)}')
+    
+    return options
+
+def apply_request_blocking(page):
+    """通过CDP拦截图片、字体、媒体和统计脚本请求，失败时不影响拨测"""
+    try:
+        page.run_cdp('Network.enable')
+        page.run_cdp('Network.setBlockedURLs', urls=BLOCKED_URL_PATTERNS)
+    except Exception as e:
+        print(f"设置请求拦截失败，继续以完整模式加载: {e}")
+
+def scrape_aliyun_boce(target_url: str, row_consumer=None, early_exit=None, probe_context=None):
+    """
+    使用DrissionPage访问阿里云网站拨测工具并抓取HTTP检测结果。
+    
+    :param target_url: 需要检测的网址
+    :param row_consumer: 可选的回调，逐块接收结果DataFrame（流式处理）
+    :param early_exit: 可选的PartialVerdict，部分结果已能确定结论时提前结束等待
+    :param probe_context: 可选的ProbeContext，记录浏览器进程ID，超时取消后尽快结束
+    :return: 提取的数据DataFrame或None；流式处理时返回读取的行数
+    """
+    
+    # 浏览器依赖只在真正执行拨测时加载，避免拖慢导入clean_url等轻量函数的程序
+    from DrissionPage import ChromiumPage
+    
+    # 创建ChromiumPage对象；用户目录在启动前登记，启动卡住超时时也能结束浏览器
+    profile_dir = tempfile.mkdtemp(prefix="boce_profile_")
+    if probe_context is not None:
+        probe_context.attach_profile(profile_dir)
+    with span("launch"):
+        try:
+            page = ChromiumPage(build_chromium_options(profile_dir))
+        except Exception:
+            shutil.rmtree(profile_dir, ignore_errors=True)
+            raise
+        if probe_context is not None:
+            probe_context.attach_browser(getattr(page, 'process_id', None))
+        if LEAN_PROFILE:
+            apply_request_blocking(page)
     
-    # 创建ChromiumPage对象
-    page = ChromiumPage(options)
+    def cancelled():
+        return probe_context is not None and probe_context.cancelled
     
     try:
         # 1. 打开阿里云拨测网站
-        if not open_boce_website(page):
+        with span("open"):
+            opened = open_boce_website(page)
+        if not opened:
             return False
         
-        # 2. 查找输入框
-        url_input_element = find_input_field(page)
-        if not url_input_element:
-            raise Exception("无法找到URL输入框")
-        
-        # 3. 输入URL
-        if not input_url(page, url_input_element, target_url):
-            raise Exception("输入URL失败")
+        # 2. 查找输入框并输入URL
+        with span("input"):
+            url_input_element = find_input_field(page)
+            if not url_input_element:
+                raise Exception("无法找到URL输入框")
+            
+            # 3. 输入URL
+            if not input_url(page, url_input_element, target_url):
+                raise Exception("输入URL失败")
         
         # 4. 点击OK按钮
-        if not click_ok_button(page):
+        with span("click"):
+            clicked = click_ok_button(page, url_input_element)
+        if not clicked:
             raise Exception("无法点击OK按钮")
         
         # 5. 等待Export Report按钮出现并变为可点击
         # 这一步保留，用于判断页面是否完全加载
-        export_button = wait_for_export_button_clickable(page)
+        with span("wait") as wait_span:
+            check_verdict = early_exit.check if early_exit is not None and early_exit.enabled else None
+            
+            def should_stop(current_page):
+                return cancelled() or bool(check_verdict and check_verdict(current_page))
+            
+            export_button = wait_for_export_button_clickable(page, should_stop=should_stop)
+            if early_exit is not None and early_exit.verdict:
+                wait_span.set(early_exit=early_exit.verdict)
+        
+        if cancelled():
+            print("拨测已超时取消")
+            return None
+        
+        if not export_button and early_exit is not None and early_exit.verdict:
+            # 结论已确定，只读取已返回结果的检测点
+            print(f"部分结果已确定结论({early_exit.verdict})，提前结束拨测: {early_exit.counts}")
+            with span("extract"):
+                return extract_table_data_from_page(page, row_consumer, completed_only=True)
         
         if not export_button:
             print("未找到可点击的Export Report按钮，无法确认页面加载完成")
@@ -418,7 +769,8 @@ def scrape_aliyun_boce(target_url: str):
         take_screenshot(page, "page_fully_loaded")
         
         # 6. 不点击Export按钮，直接从网页提取表格数据
-        df = extract_table_data_from_page(page)
+        with span("extract"):
+            df = extract_table_data_from_page(page, row_consumer)
         if df is not None:
             print("成功从网页提取表格数据")
             return df
@@ -427,19 +779,26 @@ def scrape_aliyun_boce(target_url: str):
             return None
     
     except Exception as e:
+        if cancelled():
+            # 浏览器已被结束，后续的页面操作都会失败
+            print(f"拨测已超时取消: {e}")
+            return None
         print(f"在爬虫执行过程中发生意外错误: {e}")
         take_screenshot(page, "critical_error")
         return None
     
     finally:
-        # 最终截图，无论成功还是失败
-        take_screenshot(page, "final_state")
+        if not cancelled():
+            # 最终截图，无论成功还是失败
+            take_screenshot(page, "final_state")
+            
+            # 确保关闭页面（超时取消时浏览器进程已被结束）
+            try:
+                page.quit()
+            except Exception as e:
+                print(f"关闭页面失败: {e}")
         
-        # 确保关闭页面
-        try:
-            page.quit()
-        except Exception as e:
-            print(f"关闭页面失败: {e}")
+        shutil.rmtree(profile_dir, ignore_errors=True)
 
 def clean_url(url):
     """清理URL，去除http://或https://前缀"""
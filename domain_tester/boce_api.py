@@ -1,10 +1,13 @@
 #!/usr/bin/env python3
 """
 波测API接口 - 供其他程序调用的波测功能
-提供简单的函数接口来执行波测
+提供简单的函数接口来执行波测，同时提供对应的异步接口
 """
 
+import asyncio
+import os
 import sys
+import threading
 from pathlib import Path
 
 # 添加domain_tester模块到Python路径
@@ -12,14 +15,31 @@ current_dir = Path(__file__).parent
 sys.path.insert(0, str(current_dir / "domain_tester"))
 
 from run_boce import run_boce
+from probe_cache import ProbeResultCache
+from probe_deadline import ProbeRunner
 
-def test_domain(url: str, verbose: bool = False) -> dict:
+# 拨测结果缓存（TTL由BOCE_CACHE_TTL配置），同一URL的并发调用共享一次拨测
+probe_cache = ProbeResultCache.from_env()
+
+# 所有拨测（包括异步接口）在专用线程池中执行，超过PROBE_DEADLINE后取消并结束浏览器；
+# 同时执行的拨测数量由BOCE_API_WORKERS限制，排队等待的时间不计入截止时间
+probe_runner = ProbeRunner.from_env(max_workers=int(os.environ.get("BOCE_API_WORKERS", 2)))
+_probe_slots = threading.BoundedSemaphore(probe_runner.max_workers)
+
+def _run_boce_with_deadline(url: str) -> dict:
+    """在截止时间内执行拨测，超时抛出ProbeTimeout"""
+    with _probe_slots:
+        return probe_runner.run_sync(run_boce, url)
+
+def test_domain(url: str, verbose: bool = False, use_cache: bool = True, max_age: int = None) -> dict:
     """
     测试域名的可用性和性能
     
     Args:
         url (str): 要测试的URL地址
         verbose (bool): 是否返回详细信息，默认False
+        use_cache (bool): 是否允许使用缓存的拨测结果，默认True
+        max_age (int): 可接受的缓存结果最大年龄（秒），默认使用BOCE_CACHE_TTL
     
     Returns:
         dict: 测试结果，包含以下字段：
@@ -40,8 +60,11 @@ def test_domain(url: str, verbose: bool = False) -> dict:
         >>> print(f"最高延迟地区: {result['details']['max_latency_area']}")
     """
     try:
-        # 执行波测
-        raw_result = run_boce(url)
+        # 执行波测（优先使用缓存结果）
+        if use_cache:
+            raw_result = probe_cache.get_or_probe(url, _run_boce_with_deadline, ttl=max_age)
+        else:
+            raw_result = _run_boce_with_deadline(url)
         
         if raw_result is None:
             return {
@@ -73,7 +96,9 @@ def test_domain(url: str, verbose: bool = False) -> dict:
                 'min_latency_value': raw_result['min_latency_value'],
                 'unavailable_areas': raw_result['unavailable_areas'],
                 'error_status_distribution': raw_result['error_status_distribution'],
-                'isp_analysis': raw_result['isp_analysis']
+                'isp_analysis': raw_result['isp_analysis'],
+                'latency_breakdown': raw_result.get('latency_breakdown'),
+                'spans': raw_result.get('spans', [])
             }
         
         return result
@@ -89,12 +114,13 @@ def test_domain(url: str, verbose: bool = False) -> dict:
             'error': str(e)
         }
 
-def quick_check(url: str) -> bool:
+def quick_check(url: str, use_cache: bool = True) -> bool:
     """
     快速检查域名是否可用
     
     Args:
         url (str): 要测试的URL地址
+        use_cache (bool): 是否允许使用缓存的拨测结果
     
     Returns:
         bool: 域名是否可用
@@ -105,15 +131,16 @@ def quick_check(url: str) -> bool:
         >>> else:
         >>>     print("域名不可用")
     """
-    result = test_domain(url)
+    result = test_domain(url, use_cache=use_cache)
     return result['available']
 
-def get_domain_performance(url: str) -> dict:
+def get_domain_performance(url: str, use_cache: bool = True) -> dict:
     """
     获取域名性能指标
     
     Args:
         url (str): 要测试的URL地址
+        use_cache (bool): 是否允许使用缓存的拨测结果
     
     Returns:
         dict: 性能指标，包含：
@@ -127,7 +154,7 @@ def get_domain_performance(url: str) -> dict:
         >>> print(f"平均响应时间: {perf['avg_response_time']}ms")
         >>> print(f"最快地区: {perf['fastest_area']}")
     """
-    result = test_domain(url, verbose=True)
+    result = test_domain(url, verbose=True, use_cache=use_cache)
     
     if not result['success']:
         return {
@@ -146,6 +173,87 @@ def get_domain_performance(url: str) -> dict:
         'slowest_area': details.get('max_latency_area', 'N/A')
     }
 
+async def async_test_domain(url: str, verbose: bool = False, use_cache: bool = True, max_age: int = None) -> dict:
+    """
+    test_domain的异步版本，拨测在线程中执行，不阻塞事件循环；
+    超过PROBE_DEADLINE的拨测被取消，返回success为False的结果
+    
+    Args:
+        url (str): 要测试的URL地址
+        verbose (bool): 是否返回详细信息
+        use_cache (bool): 是否允许使用缓存的拨测结果
+        max_age (int): 可接受的缓存结果最大年龄（秒）
+    
+    Returns:
+        dict: 与test_domain相同的测试结果
+    
+    Example:
+        >>> result = await async_test_domain("github.com")
+        >>> print(f"域名可用: {result['available']}")
+    """
+    return await asyncio.to_thread(test_domain, url, verbose, use_cache, max_age)
+
+async def async_quick_check(url: str, use_cache: bool = True) -> bool:
+    """
+    quick_check的异步版本
+    
+    Args:
+        url (str): 要测试的URL地址
+        use_cache (bool): 是否允许使用缓存的拨测结果
+    
+    Returns:
+        bool: 域名是否可用
+    """
+    return await asyncio.to_thread(quick_check, url, use_cache)
+
+async def async_get_domain_performance(url: str, use_cache: bool = True) -> dict:
+    """
+    get_domain_performance的异步版本
+    
+    Args:
+        url (str): 要测试的URL地址
+        use_cache (bool): 是否允许使用缓存的拨测结果
+    
+    Returns:
+        dict: 性能指标
+    """
+    return await asyncio.to_thread(get_domain_performance, url, use_cache)
+
+async def test_domains(urls: list, concurrency: int = 2, verbose: bool = False, use_cache: bool = True):
+    """
+    批量测试域名，按完成顺序逐个返回结果
+    
+    Args:
+        urls (list): 要测试的URL列表
+        concurrency (int): 同时进行的拨测数量（每个拨测占用一个浏览器，总数另受BOCE_API_WORKERS限制）
+        verbose (bool): 是否返回详细信息
+        use_cache (bool): 是否允许使用缓存的拨测结果
+    
+    Yields:
+        dict: 单个域名的测试结果（与test_domain相同，额外包含url字段）
+    
+    Example:
+        >>> async for result in test_domains(["a.com", "b.com"], concurrency=2):
+        >>>     if not result['available']:
+        >>>         print(f"{result['url']} 不可用")
+    """
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+    
+    async def probe(url):
+        async with semaphore:
+            result = await async_test_domain(url, verbose, use_cache)
+        result['url'] = url
+        return result
+    
+    tasks = [asyncio.create_task(probe(url)) for url in urls]
+    try:
+        for finished in asyncio.as_completed(tasks):
+            yield await finished
+    finally:
+        # 调用方提前结束迭代时，取消尚未开始的拨测
+        for task in tasks:
+            task.cancel()
+
 # 示例使用
 if __name__ == "__main__":
     # 基础测试
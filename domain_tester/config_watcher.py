@@ -0,0 +1,119 @@
+"""
+域名配置变更通知
+协调程序提交新域名后递增版本号并发布变更消息，
+拨测服务订阅该频道，收到通知后立即重新获取域名列表并拨测新域名；
+断线期间漏收的消息在重新订阅时通过版本号比对发现
+"""
+
+import asyncio
+import json
+import logging
+import os
+import threading
+
+from redis_opt import get_redis_client
+
+logger = logging.getLogger("domain_tester")
+
+VERSION_KEY = "domain_config:version"
+CHANGED_CHANNEL = "domain_config:changed"
+
+
+class ConfigWatcher:
+    """订阅域名配置变更"""
+    
+    def __init__(self, channel=CHANGED_CHANNEL, version_key=VERSION_KEY):
+        """
+        :param channel: 变更通知频道
+        :param version_key: 配置版本号键
+        """
+        self.channel = channel
+        self.version_key = version_key
+        self._version = None
+        self._pending = []
+        self._event = asyncio.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        self._loop = None
+    
+    @classmethod
+    def from_env(cls):
+        """根据环境变量创建"""
+        return cls(
+            channel=os.environ.get("DOMAIN_CONFIG_CHANNEL", CHANGED_CHANNEL),
+            version_key=os.environ.get("DOMAIN_CONFIG_VERSION_KEY", VERSION_KEY)
+        )
+    
+    def start(self):
+        """在后台线程中订阅变更频道"""
+        self._loop = asyncio.get_running_loop()
+        self._thread = threading.Thread(target=self._listen, name="config-watcher", daemon=True)
+        self._thread.start()
+    
+    def stop(self):
+        self._stop.set()
+    
+    def _listen(self):
+        """订阅线程：断线后重新订阅"""
+        while not self._stop.is_set():
+            pubsub = None
+            try:
+                pubsub = get_redis_client().pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(self.channel)
+                logger.info(f"已订阅域名配置变更频道: {self.channel}")
+                self._check_missed()
+                while not self._stop.is_set():
+                    message = pubsub.get_message(timeout=1.0)
+                    if message and message.get("type") == "message":
+                        self._handle(message["data"])
+            except Exception as e:
+                logger.error(f"域名配置变更订阅中断，5秒后重试: {e}")
+                self._stop.wait(5)
+            finally:
+                if pubsub is not None:
+                    try:
+                        pubsub.close()
+                    except Exception:
+                        pass
+    
+    def _check_missed(self):
+        """订阅（或重新订阅）后比对版本号，未订阅期间有变更时补发一条通知"""
+        value = get_redis_client().get(self.version_key)
+        version = int(value) if value is not None else 0
+        if self._version is not None and version > self._version:
+            logger.info(f"域名配置版本号 {self._version} -> {version}，订阅中断期间有变更")
+            self._loop.call_soon_threadsafe(self._notify, {"version": version})
+        self._version = version
+    
+    def _handle(self, data):
+        try:
+            if isinstance(data, bytes):
+                data = data.decode("utf-8")
+            notice = json.loads(data)
+            if not isinstance(notice, dict):
+                raise ValueError("通知内容不是对象")
+        except (ValueError, UnicodeDecodeError) as e:
+            logger.warning(f"忽略无效的域名配置变更通知 {data!r}: {e}")
+            return
+        if isinstance(notice.get("version"), int):
+            self._version = max(notice["version"], self._version or 0)
+        self._loop.call_soon_threadsafe(self._notify, notice)
+    
+    def _notify(self, notice):
+        self._pending.append(notice)
+        self._event.set()
+    
+    async def wait(self, timeout):
+        """
+        等待变更通知或超时
+        
+        :param timeout: 最长等待时间（秒）
+        :return: 期间收到的变更通知列表（{brand, url, version}）
+        """
+        try:
+            await asyncio.wait_for(self._event.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        self._event.clear()
+        notices, self._pending = self._pending, []
+        return notices
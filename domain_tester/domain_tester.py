@@ -1,52 +1,71 @@
 # domain_tester.py
 import asyncio
+import functools
 import json
 import logging
 import os
+import sys
 from dotenv import load_dotenv
-import numpy as np
-import redis
 import time
-import httpx
 from logging_config import setup_logging
 # 加载环境变量
 load_dotenv()
 
-# 导入你现有的拨测模块
-from redis_opt import redis_operation
+# 导入你现有的拨测模块（浏览器、pandas等重依赖在拨测时才加载）
+from redis_opt import redis_operation, create_redis_client
 from run_boce import run_boce
 from aliyun_boce import clean_url
-
-# Redis客户端
-redis_client = redis.Redis(host='localhost', port=6379, db=0)
+from probe_scheduler import ProbeScheduler
+from result_writer import ResultWriter
+from metrics import record_probe, record_precheck, start_metrics_server
+from precheck import PrecheckGate
+from config_watcher import ConfigWatcher
+from probe_deadline import ProbeRunner, ProbeTimeout
 
 # 配置日志
 
 logger = setup_logging("domain_tester")
 
+# 拨测结果事件流，协调程序通过消费组订阅，发现不健康的结果后立即处理
+EVENTS_STREAM = os.environ.get("DOMAIN_EVENTS_STREAM", "domain_events")
+EVENTS_MAXLEN = int(os.environ.get("DOMAIN_EVENTS_MAXLEN", 10000))
+
 class NumpyEncoder(json.JSONEncoder):
     """处理numpy数据类型的JSON编码器"""
     def default(self, obj):
-        if isinstance(obj, np.integer):
-            return int(obj)
-        elif isinstance(obj, np.floating):
-            return float(obj)
-        elif isinstance(obj, np.ndarray):
-            return obj.tolist()
+        # numpy未被加载时不可能出现numpy对象，无需为此导入numpy
+        np = sys.modules.get("numpy")
+        if np is not None:
+            if isinstance(obj, np.integer):
+                return int(obj)
+            elif isinstance(obj, np.floating):
+                return float(obj)
+            elif isinstance(obj, np.ndarray):
+                return obj.tolist()
         return super(NumpyEncoder, self).default(obj)
 
-async def fetch_domains_from_github(github_url, github_files, github_token=None):
-    """从GitHub获取域名列表"""
+async def fetch_domains_from_github(github_url, github_files, github_token=None, no_cache=False):
+    """
+    从GitHub获取域名列表
+    
+    no_cache为True时附加时间戳参数并禁用缓存，用于配置刚提交后绕过CDN缓存拿到最新内容
+    """
+    import httpx
+    
     domains = []
     headers = {}
+    params = None
     if github_token:
         headers["Authorization"] = f"Bearer {github_token}"
+    if no_cache:
+        headers["Cache-Control"] = "no-cache"
+        params = {"_": int(time.time() * 1000)}
     
     async with httpx.AsyncClient(timeout=30.0, headers=headers) as client:
         for filename in github_files:
             url = f"{github_url}/{filename}"
             try:
-                response = await client.get(url)
+                response = await client.get(url, params=params)
                 response.raise_for_status()
                 
                 data = response.json()
@@ -54,19 +73,21 @@ async def fetch_domains_from_github(github_url, github_files, github_token=None)
                 # 处理新的JSON格式，只处理panels部分
                 if isinstance(data, dict) and "panels" in data:
                     panels = data["panels"]
-                    # 遍历每个品牌（字段名）
+                    # 遍历每个品牌（字段名），第一个域名为主域名，其余为备用域名
                     for brand_name, brand_domains in panels.items():
-                        if isinstance(brand_domains, list) and len(brand_domains) > 0:
-                            # 只取每个品牌的第一个域名
-                            first_domain = brand_domains[0]
+                        if not isinstance(brand_domains, list):
+                            continue
+                        for rank_index, candidate in enumerate(brand_domains):
                             domain_info = {
-                                "url": first_domain.get("url"),
-                                "description": first_domain.get("description", ""),
+                                "url": candidate.get("url"),
+                                "description": candidate.get("description", ""),
                                 "brand": brand_name,
-                                "name": first_domain.get("description", first_domain.get("url", ""))
+                                "name": candidate.get("description", candidate.get("url", "")),
+                                "rank_index": rank_index,
+                                "primary": rank_index == 0
                             }
                             domains.append(domain_info)
-                            logger.info(f"添加品牌 {brand_name} 的域名: {first_domain.get('url')}")
+                            logger.info(f"添加品牌 {brand_name} 的{'主' if rank_index == 0 else '备用'}域名: {candidate.get('url')}")
                 else:
                     # 兼容旧格式
                     if isinstance(data, list):
@@ -89,8 +110,68 @@ async def fetch_domains_from_github(github_url, github_files, github_token=None)
                 logger.error(f"获取域名列表失败: {e}")
     
     return domains
-async def test_domain(domain_info):
-    """对单个域名执行拨测"""
+def _result_references(result):
+    """拨测结果对应的品牌引用列表（旧结果没有references时按单个品牌处理）"""
+    references = result.get("references")
+    if references:
+        return references
+    return [{
+        "brand": result.get("brand"),
+        "name": result.get("name", ""),
+        "rank_index": result.get("rank_index", 0),
+        "primary": result.get("primary", True)
+    }]
+
+def build_probe_targets(domains):
+    """
+    将域名列表按clean_url去重为拨测目标
+    同一域名出现在多个品牌或多个配置文件中时只拨测一次，结果写入所有引用它的品牌
+    
+    :param domains: fetch_domains_from_github返回的域名列表
+    :return: 拨测目标列表，每个目标带有references（引用它的品牌及其在品牌中的位置）
+    """
+    targets = {}
+    for domain_info in domains:
+        url = domain_info.get("url")
+        if not url:
+            continue
+        reference = {
+            "brand": domain_info.get("brand", ""),
+            "name": domain_info.get("name", url),
+            "rank_index": domain_info.get("rank_index", 0),
+            "primary": domain_info.get("primary", True)
+        }
+        
+        target = targets.setdefault(clean_url(url), {"url": url, "references": {}})
+        existing = target["references"].get(reference["brand"])
+        # 同一品牌在多个配置文件中重复出现时保留靠前的位置
+        if existing is None or reference["rank_index"] < existing["rank_index"]:
+            target["references"][reference["brand"]] = reference
+    
+    result = []
+    for target in targets.values():
+        references = sorted(target["references"].values(), key=lambda r: (not r["primary"], r["rank_index"]))
+        lead = references[0]
+        result.append({
+            "url": target["url"],
+            "brand": lead["brand"],
+            "name": lead["name"],
+            "rank_index": lead["rank_index"],
+            "primary": any(r["primary"] for r in references),
+            "references": references
+        })
+    
+    if len(result) < len(domains):
+        logger.info(f"{len(domains)} 个域名配置去重后共 {len(result)} 个拨测目标")
+    return result
+
+async def test_domain(domain_info, probe_runner):
+    """
+    对单个域名执行拨测
+    
+    超过截止时间时返回timed_out为True的结果：超时说明浏览器会话卡死，
+    不代表域名不可用，因此该结果只用于调度和指标，不写入Redis
+    """
     domain = domain_info.get("url")
     brand = domain_info.get("brand", "")
     name = domain_info.get("name", domain)
@@ -102,9 +183,22 @@ async def test_domain(domain_info):
     logger.info(f"开始对域名 {cleaned_domain} 进行拨测")
     
     try:
-        # 执行拨测（同步操作）
-        loop = asyncio.get_event_loop()
-        result_data = await loop.run_in_executor(None, run_boce, cleaned_domain)
+        # 执行拨测（同步操作，在专用线程中执行，超时后取消并结束浏览器）
+        try:
+            result_data = await probe_runner.run(run_boce, cleaned_domain)
+        except ProbeTimeout as e:
+            logger.error(f"域名 {cleaned_domain} {e}")
+            return {
+                "domain": cleaned_domain,
+                "brand": brand,
+                "name": name,
+                "rank_index": domain_info.get("rank_index", 0),
+                "primary": domain_info.get("primary", True),
+                "references": _result_references(domain_info),
+                "timed_out": True,
+                "is_available": False,
+                "timestamp": int(time.time())
+            }
         
         # 检查结果
         if result_data is not None:
@@ -114,6 +208,9 @@ async def test_domain(domain_info):
                 result_data["domain"] = cleaned_domain
                 result_data["brand"] = brand
                 result_data["name"] = name
+                result_data["rank_index"] = domain_info.get("rank_index", 0)
+                result_data["primary"] = domain_info.get("primary", True)
+                result_data["references"] = _result_references(domain_info)
                 result_data["timestamp"] = int(time.time())
                 
                 logger.info(f"域名 {cleaned_domain} 拨测完成")
@@ -130,7 +227,11 @@ async def test_domain(domain_info):
 
 @redis_operation
 def cleanup_redis_cache(client, current_domains):
-    """清理Redis中不在当前域名列表中的缓存"""
+    """
+    清理Redis中不在当前域名列表中的缓存，并按当前配置重建品牌索引
+    
+    :param current_domains: build_probe_targets返回的拨测目标列表
+    """
     try:
         # 获取当前域名列表
         current_domain_urls = {domain_info.get("url") for domain_info in current_domains if domain_info.get("url")}
@@ -153,11 +254,19 @@ def cleanup_redis_cache(client, current_domains):
                 deleted_count += 1
                 logger.info(f"删除过期域名缓存: {domain}")
         
-        # 清理品牌索引缓存，让它们重新生成
+        # 按当前配置中的品牌和位置立即重建品牌索引，不必等各品牌的下一次拨测结果；
+        # 删除和重建在同一事务中提交，读取方不会看到索引缺失
+        brand_domains = _collect_target_results(client, current_domains)
         brand_keys = list(client.scan_iter(match="domain_test:brand:*"))
+        pipe = client.pipeline(transaction=True)
         if brand_keys:
-            client.delete(*brand_keys)
-            logger.info(f"清理了 {len(brand_keys)} 个品牌索引缓存")
+            pipe.delete(*brand_keys)
+        for brand, domains in brand_domains.items():
+            if domains:
+                pipe.setex(f"domain_test:brand:{brand}", 86400, json.dumps(_build_brand_summary(domains), cls=NumpyEncoder))
+        pipe.execute()
+        rebuilt = sum(1 for domains in brand_domains.values() if domains)
+        logger.info(f"清理了 {len(brand_keys)} 个品牌索引缓存，按当前配置重建了 {rebuilt} 个")
         
         logger.info(f"Redis缓存清理完成，删除了 {deleted_count} 个过期域名缓存")
         return True
@@ -166,71 +275,215 @@ def cleanup_redis_cache(client, current_domains):
         logger.error(f"清理Redis缓存失败: {e}", exc_info=True)
         return False
 
+def _collect_brand_results(client, brands):
+    """一次扫描读取所有域名拨测结果，按品牌分组"""
+    keys = []
+    for key in client.scan_iter(match="domain_test:*"):
+        key_str = key.decode('utf-8')
+        if key_str == "domain_test:metadata" or key_str.startswith("domain_test:brand:"):
+            continue  # 跳过元数据和品牌索引键
+        keys.append(key_str)
+    
+    brand_domains = {brand: [] for brand in brands}
+    if not keys:
+        return brand_domains, 0
+    
+    # 一次往返批量读取，避免逐个GET
+    for key_str, domain_data in zip(keys, client.mget(keys)):
+        if not domain_data:
+            continue
+        try:
+            domain_obj = json.loads(domain_data)
+        except json.JSONDecodeError:
+            logger.warning(f"Redis键 {key_str} 包含无效JSON")
+            continue
+        # 确保domain_obj是字典而不是列表
+        if not isinstance(domain_obj, dict):
+            continue
+        # 一个结果可能被多个品牌引用，按各品牌中的名称和位置分别计入
+        for reference in _result_references(domain_obj):
+            if reference.get("brand") in brand_domains:
+                brand_domains[reference["brand"]].append({**domain_obj, **reference})
+    
+    return brand_domains, len(keys)
+
+def _collect_target_results(client, targets):
+    """
+    读取拨测目标已有的结果，按当前配置中的引用（品牌、名称、位置）分组
+    
+    :param targets: build_probe_targets返回的拨测目标列表
+    :return: 品牌 -> 域名结果列表
+    """
+    brand_domains = {}
+    for target in targets:
+        for reference in target["references"]:
+            brand_domains.setdefault(reference["brand"], [])
+    if not targets:
+        return brand_domains
+    
+    keys = [f"domain_test:{clean_url(target['url'])}" for target in targets]
+    for target, domain_data in zip(targets, client.mget(keys)):
+        if not domain_data:
+            continue
+        try:
+            domain_obj = json.loads(domain_data)
+        except json.JSONDecodeError:
+            continue
+        if not isinstance(domain_obj, dict):
+            continue
+        for reference in target["references"]:
+            brand_domains[reference["brand"]].append({**domain_obj, **reference})
+    
+    return brand_domains
+
+def _build_brand_summary(domains):
+    """
+    生成品牌域名排行榜：可用的域名在前，再按成功率和响应时间排序
+    每项带有配置中的位置（rank_index）和是否为主域名，供故障切换选择备用域名
+    """
+    domains = sorted(domains, key=lambda x: (
+        not x.get("is_available", False),
+        -x.get("success_rate", 0),
+        x.get("average_response_time_ms", 999999)
+    ))
+    return [
+        {
+            "domain": d.get("domain", "unknown"),
+            "name": d.get("name", ""),
+            "success_rate": d.get("success_rate", 0),
+            "average_response_time_ms": d.get("average_response_time_ms", 999999),
+            "is_available": bool(d.get("is_available", False)),
+            "primary": bool(d.get("primary", True)),
+            "rank_index": d.get("rank_index", 0),
+            "timestamp": d.get("timestamp", 0)
+        }
+        for d in domains
+    ]
+
+def build_precheck_refresh(domain_info, precheck):
+    """
+    生成预检健康时的刷新记录：写入时沿用上次完整拨测的结果，只更新时间戳、预检信息和品牌引用，
+    品牌排行榜因此保持最新，备用域名不会因时间戳过期而被排除
+    
+    :param domain_info: 调度队列中的域名信息
+    :param precheck: 预检结果
+    :return: 提交给写入任务的刷新记录
+    """
+    return {
+        "domain": clean_url(domain_info["url"]),
+        "refresh_only": True,
+        "brand": domain_info.get("brand", ""),
+        "name": domain_info.get("name", domain_info["url"]),
+        "rank_index": domain_info.get("rank_index", 0),
+        "primary": domain_info.get("primary", True),
+        "references": _result_references(domain_info),
+        "precheck": precheck,
+        "timestamp": int(time.time())
+    }
+
+def _merge_refresh(previous, refresh):
+    """把预检刷新记录合并到完整拨测结果上"""
+    merged = dict(previous)
+    merged.update({key: value for key, value in refresh.items() if key != "refresh_only"})
+    return merged
+
+def _build_result_events(result):
+    """生成写入事件流的拨测结果摘要，每个引用该域名的品牌一条（字段值只能是字符串或数字）"""
+    return [
+        {
+            "domain": result["domain"],
+            "brand": reference.get("brand") or "",
+            "is_available": int(bool(result.get("is_available"))),
+            "primary": int(bool(reference.get("primary", True))),
+            "success_rate": float(result.get("success_rate", 0) or 0),
+            "average_response_time_ms": float(result.get("average_response_time_ms", 999999) or 0),
+            "timestamp": int(result.get("timestamp") or time.time())
+        }
+        for reference in _result_references(result)
+    ]
+
+def write_results_batch(client, results):
+    """
+    批量将拨测结果保存到Redis
+    结果写入、品牌索引重建和元数据更新分别通过pipeline一次提交，
+    每个受影响的品牌只重建一次索引，最后向事件流发布每个结果的摘要；
+    预检刷新记录（refresh_only）合并到已保存的可用结果上，只更新时间戳
+    
+    出错时抛出异常，由调用方决定是否重试
+    """
+    # 同一域名只保留最新的结果；预检刷新记录合并到同批次中更早的完整结果上
+    latest = {}
+    for result in results:
+        if result and "domain" in result:
+            previous = latest.get(result["domain"])
+            if result.get("refresh_only") and previous is not None:
+                result = _merge_refresh(previous, result)
+            latest[result["domain"]] = result
+    
+    # 预检刷新记录沿用Redis中已保存的完整拨测结果，没有可用的结果时不写入
+    refreshes = [domain for domain, result in latest.items() if result.get("refresh_only")]
+    if refreshes:
+        stored = client.mget([f"domain_test:{domain}" for domain in refreshes])
+        for domain, domain_data in zip(refreshes, stored):
+            try:
+                previous = json.loads(domain_data) if domain_data else None
+            except json.JSONDecodeError:
+                previous = None
+            if isinstance(previous, dict) and previous.get("is_available"):
+                latest[domain] = _merge_refresh(previous, latest[domain])
+            else:
+                del latest[domain]
+    if not latest:
+        return 0
+    
+    # 1. 保存域名拨测结果
+    pipe = client.pipeline(transaction=False)
+    for domain, result in latest.items():
+        # 使用自定义编码器处理numpy类型
+        pipe.setex(f"domain_test:{domain}", 86400, json.dumps(result, cls=NumpyEncoder))  # 24小时过期
+    pipe.execute()
+    
+    # 2. 更新受影响品牌的域名索引
+    brands = {
+        reference.get("brand")
+        for result in latest.values()
+        for reference in _result_references(result)
+        if reference.get("brand")
+    }
+    brand_domains, domain_count = _collect_brand_results(client, brands)
+    
+    pipe = client.pipeline(transaction=False)
+    for brand, domains in brand_domains.items():
+        pipe.setex(f"domain_test:brand:{brand}", 86400, json.dumps(_build_brand_summary(domains), cls=NumpyEncoder))
+    
+    # 3. 更新拨测元数据
+    metadata = {
+        "last_test_time": int(time.time()),
+        "domain_count": domain_count
+    }
+    pipe.set("domain_test:metadata", json.dumps(metadata))
+    
+    # 4. 品牌索引更新后再发布结果事件，消费方读到的索引已包含本批结果
+    for result in latest.values():
+        for event in _build_result_events(result):
+            pipe.xadd(EVENTS_STREAM, event, maxlen=EVENTS_MAXLEN, approximate=True)
+    pipe.execute()
+    
+    logger.info(f"{len(latest)} 个域名拨测结果已保存到Redis: {', '.join(latest)}")
+    return len(latest)
+
 @redis_operation
-def save_result_to_redis(client, result):
+def save_results_batch(client, results):
+    """批量保存拨测结果，连接错误时自动重连并重试"""
+    return write_results_batch(client, results)
+
+def save_result_to_redis(result):
     """将拨测结果保存到Redis"""
     if not result or "domain" not in result:
         return False
     
-    domain = result["domain"]
-    brand = result.get("brand", "")
-    
     try:
-        # 确保没有使用.get()方法处理列表
-        # 打印结果结构，帮助调试
-        logger.debug(f"拨测结果结构: {type(result)}, 键: {list(result.keys())}")
-        
-        # 1. 保存域名拨测结果
-        redis_key = f"domain_test:{domain}"
-        # 使用自定义编码器处理numpy类型
-        client.setex(redis_key, 86400, json.dumps(result, cls=NumpyEncoder))  # 24小时过期
-        
-        # 2. 更新品牌域名索引
-        if brand:
-            # 获取该品牌现有的所有域名拨测结果
-            brand_domains = []
-            brand_pattern = f"domain_test:*"
-            for key in client.scan_iter(match=brand_pattern):
-                key_str = key.decode('utf-8')
-                if key_str == "domain_test:metadata" or key_str.startswith("domain_test:brand:"):
-                    continue  # 跳过元数据和品牌索引键
-                    
-                domain_data = client.get(key)
-                if domain_data:
-                    try:
-                        domain_obj = json.loads(domain_data)
-                        # 确保domain_obj是字典而不是列表
-                        if isinstance(domain_obj, dict) and domain_obj.get("brand") == brand:
-                            brand_domains.append(domain_obj)
-                    except json.JSONDecodeError:
-                        logger.warning(f"Redis键 {key_str} 包含无效JSON")
-                        continue
-            
-            # 按成功率排序
-            brand_domains.sort(key=lambda x: (-x.get("success_rate", 0), x.get("average_response_time_ms", 999999)))
-            
-            # 保存排序后的品牌域名列表
-            brand_key = f"domain_test:brand:{brand}"
-            brand_summary = []
-            for d in brand_domains:
-                if isinstance(d, dict):  # 确保是字典
-                    brand_summary.append({
-                        "domain": d.get("domain", "unknown"),
-                        "name": d.get("name", ""),
-                        "success_rate": d.get("success_rate", 0)
-                    })
-            
-            client.setex(brand_key, 86400, json.dumps(brand_summary, cls=NumpyEncoder))
-        
-        # 3. 更新拨测元数据
-        metadata = {
-            "last_test_time": int(time.time()),
-            "domain_count": len(list(client.scan_iter(match="domain_test:*"))) - 
-                          len(list(client.scan_iter(match="domain_test:brand:*"))) - 1
-        }
-        client.set("domain_test:metadata", json.dumps(metadata))
-        
-        logger.info(f"域名 {domain} 拨测结果已保存到Redis")
+        save_results_batch([result])
         return True
     except Exception as e:
         logger.error(f"保存拨测结果到Redis失败: {e}", exc_info=True)
@@ -264,42 +517,140 @@ async def main():
     
     logger.info(f"GitHub配置: URL={github_url}, 文件={github_files}, 刷新间隔={refresh_interval}秒")
     
-    while True:
-        try:
-            # 1. 从GitHub获取域名列表
-            domains = await fetch_domains_from_github(github_url, github_files, github_token)
-            logger.info(f"获取到 {len(domains)} 个域名")
-            
-            if not domains:
-                logger.warning("未获取到任何域名，等待5分钟后重试")
-                await asyncio.sleep(300)
-                continue
-            
-            # 2. 清理Redis中过期的域名缓存，确保与仓库配置同步
-            logger.info("开始清理Redis缓存，确保与仓库配置同步")
-            cleanup_redis_cache(domains)
-            
-            # 3. 顺序执行拨测
-            for domain_info in domains:
-                # 执行拨测
-                result = await test_domain(domain_info)
+    # 启动指标HTTP服务（METRICS_PORT为0时不启动）
+    try:
+        metrics_server = start_metrics_server()
+        if metrics_server:
+            logger.info(f"指标服务已启动: http://0.0.0.0:{metrics_server.server_port}/metrics")
+    except OSError as e:
+        logger.error(f"指标服务启动失败: {e}")
+    
+    # 按域名健康度调度拨测：异常域名高频复测，健康域名逐步退避
+    scheduler = ProbeScheduler.from_env(refresh_interval)
+    logger.info(f"拨测调度: 最小间隔={scheduler.min_interval}秒, 最大间隔={scheduler.max_interval}秒")
+    next_refresh = 0
+    
+    # 本地预检：只有可疑、不可达或到期需要全量检测的域名才执行阿里云拨测
+    precheck_gate = PrecheckGate.from_env()
+    logger.info(f"本地预检: {'启用' if precheck_gate.enabled else '关闭'}, 全量检测间隔={precheck_gate.full_interval}秒")
+    
+    # 拨测结果放入队列后由后台任务批量写入Redis，写入延迟不计入拨测时间
+    # 写入任务使用独立的客户端：连接错误直接抛出，由写入任务有限次退避重试
+    writer_client = create_redis_client(float(os.environ.get("RESULT_WRITE_TIMEOUT", 5)))
+    writer = ResultWriter.from_env(functools.partial(write_results_batch, writer_client))
+    writer.start()
+    
+    # 单次拨测的截止时间，卡死的浏览器会话不会阻塞主循环
+    probe_runner = ProbeRunner.from_env()
+    logger.info(f"单次拨测截止时间: {probe_runner.deadline}秒")
+    
+    # 协调程序提交新域名后立即重新获取域名列表，新域名不必等到下次定时刷新
+    config_watcher = ConfigWatcher.from_env()
+    config_watcher.start()
+    pending_changes = {}  # 变更通知中的新域名 -> (品牌, 放弃等待的时间)
+    change_retry_delay = int(os.environ.get("CONFIG_CHANGE_RETRY_DELAY", 30))
+    change_timeout = int(os.environ.get("CONFIG_CHANGE_TIMEOUT", 600))
+    
+    try:
+        while True:
+            try:
+                # 1. 到达刷新时间时从GitHub获取域名列表并同步调度队列
+                if time.time() >= next_refresh:
+                    domains = await fetch_domains_from_github(
+                        github_url, github_files, github_token, no_cache=bool(pending_changes))
+                    logger.info(f"获取到 {len(domains)} 个域名")
+                    
+                    if domains:
+                        # 2. 清理Redis中过期的域名缓存并重建品牌索引，确保与仓库配置同步
+                        logger.info("开始清理Redis缓存，确保与仓库配置同步")
+                        targets = build_probe_targets(domains)
+                        cleanup_redis_cache(targets)
+                        scheduler.sync(targets)
+                        next_refresh = time.time() + refresh_interval
+                    else:
+                        # 获取失败时沿用已有的调度队列，5分钟后重试
+                        logger.warning("未获取到任何域名，5分钟后重新获取")
+                        next_refresh = time.time() + 300
+                    
+                    # 变更通知中的新域名立即拨测；GitHub内容尚未更新时稍后重新获取
+                    for url, (brand, give_up_at) in list(pending_changes.items()):
+                        if not url or scheduler.force_due(url, brand):
+                            del pending_changes[url]
+                        elif time.time() >= give_up_at:
+                            logger.warning(f"域名列表中始终未出现品牌 {brand} 的新域名 {url}，等待定时刷新")
+                            del pending_changes[url]
+                        else:
+                            next_refresh = min(next_refresh, time.time() + change_retry_delay)
                 
-                # 保存结果到Redis
-                if result:
-                    save_result_to_redis(result)
+                # 3. 取出已到期的域名，先并发做本地预检
+                due_domains = []
+                while (domain_info := scheduler.pop_due()) is not None:
+                    due_domains.append(domain_info)
+                try:
+                    prechecks = await precheck_gate.run([d["url"] for d in due_domains]) if due_domains else []
+                except Exception as e:
+                    # 预检出错时全部升级为完整拨测，已出队的域名不能丢失
+                    logger.error(f"本地预检失败，全部执行完整拨测: {e}", exc_info=True)
+                    prechecks = [None] * len(due_domains)
                 
-                # 每个域名拨测后短暂等待，避免过于频繁
-                await asyncio.sleep(5)
-            
-            logger.info(f"所有域名拨测完成，等待{refresh_interval}秒后进行下一轮拨测")
-            
-            # 3. 使用环境变量中配置的刷新间隔等待
-            await asyncio.sleep(refresh_interval)
-            
-        except Exception as e:
-            logger.error(f"拨测过程中发生错误: {e}", exc_info=True)
-            # 出错后等待5分钟再重试
-            await asyncio.sleep(300)
+                # 4. 预检健康且近期做过完整拨测的域名直接重新调度，其余升级为阿里云拨测
+                for domain_info, precheck in zip(due_domains, prechecks):
+                    key = ProbeScheduler.domain_key(domain_info)
+                    result = None
+                    try:
+                        if not precheck_gate.needs_full_check(key, precheck):
+                            record_precheck(precheck["verdict"], escalated=False)
+                            await writer.submit(build_precheck_refresh(domain_info, precheck))
+                            result = {"is_available": True}
+                            logger.info(f"域名 {clean_url(domain_info['url'])} 预检健康"
+                                        f"（{precheck['total_ms']}ms），跳过完整拨测")
+                            continue
+                        
+                        if precheck is not None:
+                            record_precheck(precheck["verdict"], escalated=True)
+                            logger.info(f"域名 {clean_url(domain_info['url'])} 预检结果: {precheck['verdict']}"
+                                        f"{'，' + precheck['error'] if precheck['error'] else ''}，执行完整拨测")
+                        
+                        probe_start = time.perf_counter()
+                        result = await test_domain(domain_info, probe_runner)
+                        record_probe(domain_info.get("brand", ""), result, time.perf_counter() - probe_start)
+                        precheck_gate.record_full_check(key, result)
+                        
+                        # 提交结果，由写入任务异步保存到Redis（超时的结果不代表域名状态，不写入）
+                        if result and not result.get("timed_out"):
+                            if precheck is not None:
+                                result["precheck"] = precheck
+                            await writer.submit(result)
+                    except Exception as e:
+                        # 单个域名出错不影响同批已出队的其余域名
+                        logger.error(f"处理域名 {domain_info.get('url')} 时出错: {e}", exc_info=True)
+                    finally:
+                        # 已出队的域名必须重新入队，处理中途出错时按失败以最小间隔复测
+                        interval = scheduler.record(domain_info, result)
+                        if interval is not None:
+                            logger.info(f"域名 {clean_url(domain_info['url'])} 下次拨测在 {interval} 秒后")
+                
+                # 5. 等待到下一个域名到期、下一次刷新或收到配置变更通知
+                wait = next_refresh - time.time()
+                next_due = scheduler.seconds_until_next_due()
+                if next_due is not None:
+                    wait = min(wait, next_due)
+                changes = await config_watcher.wait(max(1, wait))
+                if changes:
+                    for change in changes:
+                        logger.info(f"收到域名配置变更通知: 品牌={change.get('brand')}, "
+                                    f"域名={change.get('url')}, 版本={change.get('version')}")
+                        pending_changes[change.get("url") or ""] = (change.get("brand"), time.time() + change_timeout)
+                    next_refresh = 0
+                
+            except Exception as e:
+                logger.error(f"拨测过程中发生错误: {e}", exc_info=True)
+                # 出错后等待5分钟再重试
+                await asyncio.sleep(300)
+    finally:
+        config_watcher.stop()
+        probe_runner.close()
+        await writer.close()
 
 if __name__ == "__main__":
     asyncio.run(main())
\ No newline at end of file
@@ -0,0 +1,274 @@
+"""
+运行指标
+不依赖第三方库的Counter/Gauge/Histogram实现，以Prometheus文本格式
+通过一个小型HTTP服务暴露（METRICS_PORT，设为0关闭）
+"""
+
+import bisect
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# 拨测各阶段耗时分布（秒），覆盖从毫秒级到数分钟的等待
+STAGE_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 15, 30, 60, 90, 120, 180, 300)
+# Redis写入等耗时较短操作的分布（秒）
+FAST_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)
+
+
+def _format_labels(labelnames, values):
+    if not labelnames:
+        return ""
+    pairs = []
+    for name, value in zip(labelnames, values):
+        escaped = str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        pairs.append(f'{name}="{escaped}"')
+    return "{" + ",".join(pairs) + "}"
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    """指标基类，按标签值分组保存数据"""
+    
+    type_name = ""
+    
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+    
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"指标 {self.name} 需要标签 {self.labelnames}，实际为 {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+    
+    def samples(self):
+        """返回(后缀, 标签名, 标签值, 数值)列表"""
+        with self._lock:
+            return [("", self.labelnames, key, value) for key, value in self._values.items()]
+    
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type_name}"]
+        for suffix, labelnames, values, value in self.samples():
+            lines.append(f"{self.name}{suffix}{_format_labels(labelnames, values)} {_format_value(value)}")
+        return "\n".join(lines)
+
+
+class Counter(_Metric):
+    """只增不减的计数器"""
+    
+    type_name = "counter"
+    
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    """可增可减的瞬时值；提供callback时在输出时实时计算"""
+    
+    type_name = "gauge"
+    
+    def __init__(self, name, documentation, labelnames=(), callback=None):
+        """
+        :param callback: 可选的函数，返回{标签值元组: 数值}，用于队列长度等实时数据
+        """
+        super().__init__(name, documentation, labelnames)
+        self.callback = callback
+    
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+    
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+    
+    def samples(self):
+        if self.callback is None:
+            return super().samples()
+        try:
+            values = self.callback()
+        except Exception:
+            values = {}
+        return [("", self.labelnames, tuple(key), value) for key, value in values.items()]
+
+
+class Histogram(_Metric):
+    """累积分桶的耗时分布"""
+    
+    type_name = "histogram"
+    
+    def __init__(self, name, documentation, labelnames=(), buckets=STAGE_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+    
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = {"counts": [0] * (len(self.buckets) + 1), "sum": 0.0, "count": 0}
+            state["counts"][bisect.bisect_left(self.buckets, value)] += 1
+            state["sum"] += value
+            state["count"] += 1
+    
+    @contextmanager
+    def time(self, **labels):
+        """记录with代码块的耗时，代码块抛出异常时同样记录"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+    
+    def samples(self):
+        samples = []
+        bucket_labelnames = self.labelnames + ("le",)
+        with self._lock:
+            for key, state in self._values.items():
+                cumulative = 0
+                for bound, count in zip(self.buckets + (float("inf"),), state["counts"]):
+                    cumulative += count
+                    samples.append(("_bucket", bucket_labelnames, key + (_format_value(bound),), cumulative))
+                samples.append(("_sum", self.labelnames, key, state["sum"]))
+                samples.append(("_count", self.labelnames, key, state["count"]))
+        return samples
+
+
+class Registry:
+    """指标注册表"""
+    
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+    
+    def register(self, metric):
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"指标 {metric.name} 已注册")
+            self._metrics[metric.name] = metric
+        return metric
+    
+    def get(self, name):
+        return self._metrics.get(name)
+    
+    def render(self):
+        """输出Prometheus文本格式"""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return "\n".join(metric.render() for metric in metrics) + "\n"
+
+
+REGISTRY = Registry()
+
+# 拨测流程
+BOCE_STAGE_SECONDS = REGISTRY.register(Histogram(
+    "boce_stage_duration_seconds", "scrape_aliyun_boce各阶段及各选择器尝试的耗时", ["stage"]))
+ANALYZE_SECONDS = REGISTRY.register(Histogram(
+    "boce_analyze_duration_seconds", "拨测结果分析耗时"))
+PROBE_SECONDS = REGISTRY.register(Histogram(
+    "domain_probe_duration_seconds", "单个域名完整拨测耗时", ["brand"]))
+PROBE_TOTAL = REGISTRY.register(Counter(
+    "domain_probe_total", "拨测次数，status为available/unavailable/failed/timeout", ["brand", "status"]))
+LAST_PROBE_TIMESTAMP = REGISTRY.register(Gauge(
+    "domain_last_probe_timestamp_seconds", "品牌最近一次拨测完成的时间戳", ["brand"]))
+LAST_PROBE_AGE = REGISTRY.register(Gauge(
+    "domain_last_probe_age_seconds", "品牌距最近一次拨测完成的秒数", ["brand"],
+    callback=lambda: {key: time.time() - ts for _, _, key, ts in LAST_PROBE_TIMESTAMP.samples()}))
+PRECHECK_TOTAL = REGISTRY.register(Counter(
+    "domain_precheck_total", "本地预检次数，escalated表示是否升级为完整拨测", ["verdict", "escalated"]))
+
+# 结果写入
+REDIS_WRITE_SECONDS = REGISTRY.register(Histogram(
+    "redis_write_duration_seconds", "批量写入Redis的耗时", buckets=FAST_BUCKETS))
+REDIS_WRITE_FAILURES = REGISTRY.register(Counter(
+    "redis_write_failures_total", "批量写入Redis失败次数"))
+RESULT_QUEUE_DEPTH = REGISTRY.register(Gauge(
+    "result_queue_depth", "等待写入Redis的拨测结果数"))
+RESULTS_DROPPED = REGISTRY.register(Counter(
+    "result_queue_dropped_total", "写入重试耗尽后丢弃的拨测结果数"))
+
+
+def record_probe(brand, result, duration):
+    """记录一次域名拨测的结果和耗时"""
+    if result is None:
+        status = "failed"
+    elif result.get("timed_out"):
+        status = "timeout"
+    elif result.get("is_available"):
+        status = "available"
+    else:
+        status = "unavailable"
+    
+    PROBE_TOTAL.inc(brand=brand, status=status)
+    PROBE_SECONDS.observe(duration, brand=brand)
+    LAST_PROBE_TIMESTAMP.set(time.time(), brand=brand)
+
+
+def record_precheck(verdict, escalated):
+    """记录一次本地预检的结论及是否升级为完整拨测"""
+    PRECHECK_TOTAL.inc(verdict=verdict, escalated=str(bool(escalated)).lower())
+
+
+# 额外的JSON接口: 路径 -> 返回可序列化数据的函数
+_json_routes = {}
+
+
+def register_json_route(path, provider):
+    """在指标服务上注册一个返回JSON的路径，如span耗时统计"""
+    _json_routes[path] = provider
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    registry = REGISTRY
+    
+    def do_GET(self):
+        path = self.path.split("?", 1)[0]
+        if path in ("/", "/metrics"):
+            body = self.registry.render().encode("utf-8")
+            content_type = "text/plain; version=0.0.4; charset=utf-8"
+        elif path in _json_routes:
+            body = json.dumps(_json_routes[path](), ensure_ascii=False, indent=2).encode("utf-8")
+            content_type = "application/json; charset=utf-8"
+        else:
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+    
+    def log_message(self, format, *args):
+        pass  # 抓取请求不写入日志
+
+
+def start_metrics_server(port=None, host="0.0.0.0"):
+    """
+    在后台线程中启动指标HTTP服务
+    
+    :param port: 监听端口，默认读取METRICS_PORT（默认9108），为0时不启动
+    :return: HTTP服务对象，未启动时返回None
+    """
+    if port is None:
+        port = int(os.environ.get("METRICS_PORT", 9108))
+    if not port:
+        return None
+    
+    server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    thread = threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True)
+    thread.start()
+    return server
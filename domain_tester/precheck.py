@@ -0,0 +1,201 @@
+"""
+本地可达性预检
+在本机并发完成DNS解析、TCP连接、TLS握手和HTTP HEAD并分别计时，
+只有可疑、不可达或到了定期全量检测时间的域名才升级为阿里云多地区拨测
+"""
+
+import asyncio
+import os
+import socket
+import ssl
+import time
+from urllib.parse import urlsplit
+
+# 预检结论
+HEALTHY = "healthy"
+SUSPICIOUS = "suspicious"
+DOWN = "down"
+
+
+def _parse_target(url):
+    """解析出(scheme, host, port, path)，没有协议时按https处理"""
+    if "://" not in url:
+        url = f"https://{url}"
+    parts = urlsplit(url)
+    scheme = parts.scheme or "https"
+    port = parts.port or (443 if scheme == "https" else 80)
+    path = parts.path or "/"
+    if parts.query:
+        path = f"{path}?{parts.query}"
+    return scheme, parts.hostname, port, path
+
+
+async def precheck_domain(url, timeout=5.0, slow_ms=3000):
+    """
+    对单个URL做本地可达性预检
+    
+    :param url: 待检测的URL
+    :param timeout: 每一步的超时（秒）
+    :param slow_ms: 总耗时超过该值时判为可疑
+    :return: 包含verdict、各步骤耗时(ms)、HTTP状态码和错误信息的字典
+    """
+    result = {
+        "url": url,
+        "verdict": DOWN,
+        "dns_ms": None,
+        "tcp_ms": None,
+        "tls_ms": None,
+        "http_ms": None,
+        "total_ms": None,
+        "status_code": None,
+        "error": None
+    }
+    loop = asyncio.get_running_loop()
+    start = time.perf_counter()
+    step = "dns"
+    writer = None
+    
+    try:
+        scheme, host, port, path = _parse_target(url)
+        if not host:
+            raise ValueError("无法解析主机名")
+        
+        # 1. DNS解析
+        step_start = time.perf_counter()
+        infos = await asyncio.wait_for(
+            loop.getaddrinfo(host, port, type=socket.SOCK_STREAM), timeout)
+        result["dns_ms"] = round((time.perf_counter() - step_start) * 1000, 2)
+        address = infos[0][4][0]
+        
+        # 2. TCP连接
+        step = "tcp"
+        step_start = time.perf_counter()
+        reader, writer = await asyncio.wait_for(asyncio.open_connection(address, port), timeout)
+        result["tcp_ms"] = round((time.perf_counter() - step_start) * 1000, 2)
+        
+        # 3. TLS握手
+        if scheme == "https":
+            step = "tls"
+            step_start = time.perf_counter()
+            await asyncio.wait_for(
+                writer.start_tls(ssl.create_default_context(), server_hostname=host), timeout)
+            result["tls_ms"] = round((time.perf_counter() - step_start) * 1000, 2)
+        
+        # 4. HTTP HEAD
+        step = "http"
+        step_start = time.perf_counter()
+        request = (
+            f"HEAD {path} HTTP/1.1\r\n"
+            f"Host: {host}\r\n"
+            "User-Agent: Mozilla/5.0 (domain_tester precheck)\r\n"
+            "Accept: */*\r\n"
+            "Connection: close\r\n\r\n"
+        )
+        writer.write(request.encode("ascii"))
+        await writer.drain()
+        status_line = await asyncio.wait_for(reader.readline(), timeout)
+        result["http_ms"] = round((time.perf_counter() - step_start) * 1000, 2)
+        
+        fields = status_line.decode("latin-1").split()
+        if len(fields) < 2 or not fields[1].isdigit():
+            raise ValueError(f"无效的HTTP响应: {status_line[:50]!r}")
+        result["status_code"] = int(fields[1])
+    
+    except Exception as e:
+        message = str(e) or type(e).__name__
+        result["error"] = f"{step}: {message}"
+    finally:
+        if writer is not None:
+            writer.close()
+            try:
+                await asyncio.wait_for(writer.wait_closed(), 1)
+            except Exception:
+                pass
+    
+    result["total_ms"] = round((time.perf_counter() - start) * 1000, 2)
+    
+    if result["status_code"] is not None:
+        # 能完成HTTP请求但返回5xx或响应过慢，交给多地区拨测确认
+        if result["status_code"] >= 500 or result["total_ms"] > slow_ms:
+            result["verdict"] = SUSPICIOUS
+        else:
+            result["verdict"] = HEALTHY
+    elif step == "http":
+        # 连接已建立但没有有效响应
+        result["verdict"] = SUSPICIOUS
+    
+    return result
+
+
+async def precheck_many(urls, concurrency=20, timeout=5.0, slow_ms=3000):
+    """
+    并发预检多个URL
+    
+    :return: 与urls顺序一致的预检结果列表
+    """
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+    
+    async def run(url):
+        async with semaphore:
+            return await precheck_domain(url, timeout, slow_ms)
+    
+    return await asyncio.gather(*(run(url) for url in urls))
+
+
+class PrecheckGate:
+    """
+    决定预检后是否升级为完整拨测
+    
+    本机网络与国内各地区不同（如被墙的域名在本机仍可访问），
+    因此预检健康的域名也要定期做一次完整拨测；预检不可达时同样升级，
+    由多地区拨测给出故障切换所需的结论
+    """
+    
+    def __init__(self, enabled=True, full_interval=7200, timeout=5.0, concurrency=20, slow_ms=3000):
+        """
+        :param enabled: 是否启用预检，关闭时所有域名都做完整拨测
+        :param full_interval: 预检健康的域名至少每隔多少秒做一次完整拨测
+        :param timeout: 预检每一步的超时（秒）
+        :param concurrency: 预检并发数
+        :param slow_ms: 预检总耗时超过该值时判为可疑
+        """
+        self.enabled = enabled
+        self.full_interval = full_interval
+        self.timeout = timeout
+        self.concurrency = concurrency
+        self.slow_ms = slow_ms
+        self._last_full = {}  # key -> (完整拨测时间, 是否可用)
+    
+    @classmethod
+    def from_env(cls):
+        """根据环境变量创建"""
+        return cls(
+            enabled=os.environ.get("PRECHECK_ENABLED", "true").lower() in ("1", "true", "yes"),
+            full_interval=int(os.environ.get("PRECHECK_FULL_INTERVAL", 7200)),
+            timeout=float(os.environ.get("PRECHECK_TIMEOUT", 5)),
+            concurrency=int(os.environ.get("PRECHECK_CONCURRENCY", 20)),
+            slow_ms=float(os.environ.get("PRECHECK_SLOW_MS", 3000))
+        )
+    
+    async def run(self, urls):
+        """并发预检；未启用时返回None列表"""
+        if not self.enabled:
+            return [None] * len(urls)
+        return await precheck_many(urls, self.concurrency, self.timeout, self.slow_ms)
+    
+    def needs_full_check(self, key, precheck):
+        """
+        是否需要完整拨测：预检未启用、非健康、从未完整拨测过、
+        上次完整拨测不可用或距上次完整拨测超过full_interval
+        """
+        if precheck is None or precheck["verdict"] != HEALTHY:
+            return True
+        last = self._last_full.get(key)
+        if last is None:
+            return True
+        checked_at, available = last
+        return not available or time.time() - checked_at >= self.full_interval
+    
+    def record_full_check(self, key, result):
+        """记录一次完整拨测的结果"""
+        self._last_full[key] = (time.time(), bool(result and result.get("is_available")))
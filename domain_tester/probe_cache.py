@@ -0,0 +1,183 @@
+"""
+拨测结果缓存
+进程内LRU + Redis中domain_tester已保存的domain_test:*结果两级缓存，
+同一URL的并发请求合并为一次拨测
+"""
+
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+
+from aliyun_boce import clean_url
+
+# Redis不可用后暂停访问的秒数，避免每次查询都等待连接超时
+REDIS_RETRY_COOLDOWN = 60
+
+
+class ProbeResultCache:
+    """拨测结果缓存，按清理后的URL索引"""
+    
+    def __init__(self, ttl=300, max_size=128, use_redis=True):
+        """
+        :param ttl: 结果有效期（秒）
+        :param max_size: 进程内缓存的最大条目数
+        :param use_redis: 是否读取Redis中domain_tester保存的结果
+        """
+        self.ttl = ttl
+        self.max_size = max_size
+        self.use_redis = use_redis
+        
+        self._entries = OrderedDict()  # url -> (timestamp, result)
+        self._inflight = {}  # url -> Future，正在进行的拨测
+        self._lock = threading.Lock()
+        
+        self._redis_client = None
+        self._redis_disabled_until = 0
+    
+    @classmethod
+    def from_env(cls):
+        """根据环境变量创建缓存"""
+        return cls(
+            ttl=int(os.environ.get("BOCE_CACHE_TTL", 300)),
+            max_size=int(os.environ.get("BOCE_CACHE_SIZE", 128)),
+            use_redis=os.environ.get("BOCE_CACHE_REDIS", "true").lower() in ("1", "true", "yes")
+        )
+    
+    def _get_redis(self):
+        """懒加载Redis客户端，连接失败后冷却一段时间"""
+        if not self.use_redis or time.time() < self._redis_disabled_until:
+            return None
+        
+        if self._redis_client is None:
+            try:
+                import redis
+            except ImportError:
+                self.use_redis = False
+                return None
+            
+            self._redis_client = redis.Redis(
+                host=os.environ.get('REDIS_HOST', 'redis'),
+                port=int(os.environ.get('REDIS_PORT', 6379)),
+                db=int(os.environ.get('REDIS_DB', 5)),
+                socket_timeout=1,
+                socket_connect_timeout=1
+            )
+        return self._redis_client
+    
+    def _lookup_local(self, url, ttl):
+        """查询进程内缓存"""
+        with self._lock:
+            entry = self._entries.get(url)
+            if entry is None:
+                return None
+            
+            timestamp, result = entry
+            if time.time() - timestamp > ttl:
+                del self._entries[url]
+                return None
+            
+            self._entries.move_to_end(url)
+            return dict(result)
+    
+    def _lookup_redis(self, url, ttl):
+        """查询Redis中domain_tester保存的拨测结果"""
+        client = self._get_redis()
+        if client is None:
+            return None
+        
+        try:
+            data = client.get(f"domain_test:{url}")
+        except Exception as e:
+            print(f"读取Redis拨测缓存失败，{REDIS_RETRY_COOLDOWN}秒内不再尝试: {e}")
+            self._redis_disabled_until = time.time() + REDIS_RETRY_COOLDOWN
+            return None
+        
+        if not data:
+            return None
+        
+        try:
+            result = json.loads(data)
+        except json.JSONDecodeError:
+            return None
+        
+        timestamp = result.get("timestamp", 0) if isinstance(result, dict) else 0
+        if time.time() - timestamp > ttl:
+            return None
+        
+        # 提升到进程内缓存，保留原始拨测时间
+        self._store(url, result, timestamp)
+        return dict(result)
+    
+    def _store(self, url, result, timestamp=None):
+        """写入进程内缓存并淘汰最久未使用的条目"""
+        with self._lock:
+            self._entries[url] = (timestamp or time.time(), result)
+            self._entries.move_to_end(url)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+    
+    def get(self, url, ttl=None):
+        """
+        查询缓存
+        
+        :param url: 待检测的URL
+        :param ttl: 本次查询可接受的最大结果年龄（秒），默认使用缓存的ttl
+        :return: 缓存的拨测结果或None
+        """
+        key = clean_url(url)
+        ttl = self.ttl if ttl is None else ttl
+        if ttl <= 0:
+            return None
+        return self._lookup_local(key, ttl) or self._lookup_redis(key, ttl)
+    
+    def get_or_probe(self, url, probe_func, ttl=None, force=False):
+        """
+        优先返回缓存结果，否则执行拨测；同一URL的并发调用共享一次拨测
+        
+        :param url: 待检测的URL
+        :param probe_func: 拨测函数，接收清理后的URL，返回结果字典或None
+        :param ttl: 可接受的最大结果年龄（秒）
+        :param force: 是否跳过缓存强制拨测（仍会与进行中的拨测合并）
+        :return: 拨测结果或None
+        """
+        key = clean_url(url)
+        
+        if not force:
+            cached = self.get(key, ttl)
+            if cached is not None:
+                return cached
+        
+        with self._lock:
+            future = self._inflight.get(key)
+            is_owner = future is None
+            if is_owner:
+                future = Future()
+                self._inflight[key] = future
+        
+        if not is_owner:
+            result = future.result()
+            return dict(result) if result is not None else None
+        
+        try:
+            result = probe_func(key)
+            if result is not None:
+                self._store(key, result)
+            future.set_result(result)
+            return dict(result) if result is not None else None
+        except Exception as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+    
+    def invalidate(self, url=None):
+        """清除指定URL（或全部）的进程内缓存"""
+        with self._lock:
+            if url is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(clean_url(url), None)
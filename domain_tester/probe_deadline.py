@@ -0,0 +1,209 @@
+"""
+单次拨测的截止时间
+拨测在专用线程池中执行，超过PROBE_DEADLINE后设置取消标志并结束该次拨测的浏览器进程树，
+卡死的浏览器会话不会无限占用线程或阻塞主循环
+"""
+
+import asyncio
+import logging
+import os
+import signal
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+
+logger = logging.getLogger("domain_tester")
+
+
+class ProbeTimeout(Exception):
+    """拨测超过截止时间"""
+
+
+class ProbeContext:
+    """单次拨测的上下文：记录浏览器进程，供超时时从其他线程取消"""
+    
+    def __init__(self, url):
+        self.url = url
+        self.browser_pid = None
+        self.profile_dir = None
+        self.cancel_event = threading.Event()
+        self.started = time.time()
+    
+    def attach_profile(self, profile_dir):
+        """启动浏览器前记录其用户目录，启动卡住时按目录查找并结束浏览器进程"""
+        self.profile_dir = profile_dir
+    
+    def attach_browser(self, pid):
+        """记录本次拨测启动的浏览器进程"""
+        self.browser_pid = pid
+    
+    @property
+    def cancelled(self):
+        return self.cancel_event.is_set()
+
+
+def kill_process_tree(pid):
+    """
+    结束进程及其全部子进程（Chromium的渲染、GPU等进程）
+    
+    没有安装psutil时只结束主进程
+    
+    :param pid: 浏览器主进程ID
+    :return: 结束的进程数量
+    """
+    try:
+        import psutil
+    except ImportError:
+        try:
+            os.kill(pid, signal.SIGKILL)
+            return 1
+        except ProcessLookupError:
+            return 0
+    
+    try:
+        parent = psutil.Process(pid)
+        processes = parent.children(recursive=True) + [parent]
+    except psutil.NoSuchProcess:
+        return 0
+    
+    return _kill_processes(psutil, processes)
+
+
+def kill_profile_processes(profile_dir):
+    """
+    结束命令行中使用指定用户目录的全部浏览器进程
+    
+    浏览器启动卡住时还拿不到主进程ID，此时按启动前分配的用户目录查找；
+    没有安装psutil时无法查找，返回0
+    
+    :param profile_dir: 浏览器用户目录
+    :return: 结束的进程数量
+    """
+    try:
+        import psutil
+    except ImportError:
+        return 0
+    
+    marker = f"--user-data-dir={profile_dir}"
+    processes = []
+    for process in psutil.process_iter(["cmdline"]):
+        if marker in (process.info.get("cmdline") or []):
+            processes.append(process)
+    return _kill_processes(psutil, processes)
+
+
+def _kill_processes(psutil, processes):
+    killed = 0
+    for process in processes:
+        try:
+            process.kill()
+            killed += 1
+        except psutil.NoSuchProcess:
+            pass
+    psutil.wait_procs(processes, timeout=5)
+    return killed
+
+
+class ProbeRunner:
+    """带截止时间的拨测执行器"""
+    
+    def __init__(self, deadline=600, cancel_grace=30, max_workers=1):
+        """
+        :param deadline: 单次拨测的最长时间（秒）
+        :param cancel_grace: 超时结束浏览器后等待拨测线程退出的时间（秒）
+        :param max_workers: 同时执行的拨测数量（每个拨测占用一个线程和一个浏览器），主循环逐个拨测时为1
+        """
+        self.deadline = deadline
+        self.cancel_grace = cancel_grace
+        self.max_workers = max(1, max_workers)
+        self._lock = threading.Lock()
+        self._executor = self._new_executor()
+    
+    @classmethod
+    def from_env(cls, max_workers=1):
+        """根据环境变量创建"""
+        return cls(
+            deadline=float(os.environ.get("PROBE_DEADLINE", 600)),
+            cancel_grace=float(os.environ.get("PROBE_CANCEL_GRACE", 30)),
+            max_workers=max_workers
+        )
+    
+    def _new_executor(self):
+        return ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="probe")
+    
+    def _replace_executor(self, stuck):
+        """线程仍卡在浏览器调用中，换一个线程池，后续拨测不排在它后面"""
+        with self._lock:
+            if self._executor is not stuck:
+                return  # 其他超时的拨测已经替换过
+            logger.error(f"拨测线程在取消后 {self.cancel_grace} 秒内未退出，改用新的线程池")
+            stuck.shutdown(wait=False)
+            self._executor = self._new_executor()
+    
+    def _cancel(self, context):
+        """设置取消标志并结束本次拨测的浏览器进程"""
+        context.cancel_event.set()
+        killed = 0
+        if context.browser_pid:
+            killed = kill_process_tree(context.browser_pid)
+        if context.profile_dir:
+            # 浏览器启动卡住时没有主进程ID；已脱离进程树的子进程也按用户目录一并结束
+            killed += kill_profile_processes(context.profile_dir)
+        logger.warning(f"拨测 {context.url} 超过 {self.deadline} 秒，已取消并结束 {killed} 个浏览器进程"
+                       f"（主进程 {context.browser_pid}）")
+    
+    async def run(self, probe_func, url):
+        """
+        在专用线程中执行拨测，超时后取消
+        
+        :param probe_func: 拨测函数，调用方式为 probe_func(url, probe_context)
+        :param url: 待检测的URL
+        :return: 拨测函数的返回值
+        :raises ProbeTimeout: 超过截止时间
+        """
+        context = ProbeContext(url)
+        executor = self._executor
+        loop = asyncio.get_running_loop()
+        future = loop.run_in_executor(executor, probe_func, url, context)
+        
+        try:
+            # shield保证超时后仍能继续等待线程退出
+            return await asyncio.wait_for(asyncio.shield(future), self.deadline)
+        except asyncio.TimeoutError:
+            pass
+        
+        await asyncio.to_thread(self._cancel, context)
+        try:
+            await asyncio.wait_for(future, self.cancel_grace)
+        except asyncio.TimeoutError:
+            self._replace_executor(executor)
+        except Exception:
+            pass  # 浏览器被结束后拨测线程抛出的异常
+        
+        raise ProbeTimeout(f"拨测超过 {self.deadline} 秒")
+    
+    def run_sync(self, probe_func, url):
+        """
+        run的同步版本，供在普通线程中调用的接口使用
+        
+        调用方需保证同时调用的数量不超过max_workers，否则排队时间也计入截止时间
+        
+        :raises ProbeTimeout: 超过截止时间
+        """
+        context = ProbeContext(url)
+        executor = self._executor
+        future = executor.submit(probe_func, url, context)
+        
+        done, _ = wait([future], timeout=self.deadline)
+        if done:
+            return future.result()
+        
+        self._cancel(context)
+        done, _ = wait([future], timeout=self.cancel_grace)
+        if not done:
+            self._replace_executor(executor)
+        
+        raise ProbeTimeout(f"拨测超过 {self.deadline} 秒")
+    
+    def close(self):
+        self._executor.shutdown(wait=False)
@@ -0,0 +1,183 @@
+"""
+自适应拨测调度器
+按下次到期时间维护优先队列：异常的域名以最小间隔复测，
+新变更的域名立即拨测，持续健康的域名逐步退避到最大间隔；
+备用域名的间隔按倍数放宽
+"""
+
+import heapq
+import itertools
+import logging
+import os
+import time
+
+from aliyun_boce import clean_url
+
+logger = logging.getLogger("domain_tester")
+
+
+class ProbeScheduler:
+    """基于域名健康度的拨测优先队列"""
+    
+    def __init__(self, min_interval=300, max_interval=3600, backup_factor=3):
+        """
+        :param min_interval: 异常或新变更域名的复测间隔（秒）
+        :param max_interval: 持续健康域名的最大复测间隔（秒）
+        :param backup_factor: 备用域名（非品牌第一个域名）的间隔倍数
+        """
+        self.min_interval = max(1, min_interval)
+        self.max_interval = max(max_interval, self.min_interval)
+        self.backup_factor = max(1, backup_factor)
+        
+        self._entries = {}  # key -> {"info", "interval", "next_due"}
+        self._heap = []  # (next_due, seq, key)，过期条目在出队时丢弃
+        self._counter = itertools.count()
+    
+    @classmethod
+    def from_env(cls, refresh_interval=1800):
+        """根据环境变量创建调度器，最大间隔默认为GitHub刷新间隔的两倍"""
+        return cls(
+            min_interval=int(os.environ.get("PROBE_MIN_INTERVAL", 300)),
+            max_interval=int(os.environ.get("PROBE_MAX_INTERVAL", refresh_interval * 2)),
+            backup_factor=int(os.environ.get("PROBE_BACKUP_FACTOR", 3))
+        )
+    
+    @staticmethod
+    def domain_key(domain_info):
+        """调度键: 清理后的URL（多个品牌引用的同一域名只调度一次）"""
+        return clean_url(domain_info.get('url', ''))
+    
+    def interval_bounds(self, domain_info):
+        """域名的(最小间隔, 最大间隔)，备用域名按倍数放宽"""
+        if domain_info.get("primary", True):
+            return self.min_interval, self.max_interval
+        return self.min_interval * self.backup_factor, self.max_interval * self.backup_factor
+    
+    def __len__(self):
+        return len(self._entries)
+    
+    def _push(self, key, next_due):
+        entry = self._entries[key]
+        entry["next_due"] = next_due
+        heapq.heappush(self._heap, (next_due, next(self._counter), key))
+    
+    def sync(self, domains):
+        """
+        与最新的域名列表同步：新增的域名立即到期，已移除的域名出队，
+        出队后未重新调度的域名补回队列
+        
+        :param domains: build_probe_targets去重后的拨测目标列表
+        :return: (新增数量, 移除数量)
+        """
+        now = time.time()
+        current = {}
+        for domain_info in domains:
+            if domain_info.get("url"):
+                current[self.domain_key(domain_info)] = domain_info
+        
+        removed = [key for key in self._entries if key not in current]
+        for key in removed:
+            del self._entries[key]
+        
+        added = 0
+        for key, domain_info in current.items():
+            entry = self._entries.get(key)
+            if entry is None:
+                # 主域名先拨测，备用域名排在其后
+                next_due = now if domain_info.get("primary", True) else now + 1
+                self._entries[key] = {
+                    "info": domain_info,
+                    "interval": self.interval_bounds(domain_info)[0],
+                    "next_due": next_due
+                }
+                self._push(key, next_due)
+                added += 1
+            else:
+                # 名称、描述等信息以最新列表为准，不影响调度
+                entry["info"] = domain_info
+                if entry["next_due"] is None:
+                    # 出队后未被record重新调度（处理中途出错），补回队列避免永久丢失
+                    self._push(key, now)
+        
+        if added or removed:
+            logger.info(f"调度队列已同步: 新增 {added} 个，移除 {len(removed)} 个，共 {len(self._entries)} 个域名")
+        return added, len(removed)
+    
+    def force_due(self, url, brand=None):
+        """
+        让指定URL立即到期（如配置变更后需要马上拨测新域名），并重置为最小间隔
+        
+        :param url: 域名URL
+        :param brand: 品牌名称，为空时匹配所有品牌
+        :return: 匹配到的域名数量
+        """
+        target = clean_url(url)
+        now = time.time()
+        matched = 0
+        for key, entry in self._entries.items():
+            info = entry["info"]
+            if clean_url(info.get("url", "")) != target:
+                continue
+            if brand and brand not in {r.get("brand") for r in info.get("references", [info])}:
+                continue
+            entry["interval"] = self.interval_bounds(info)[0]
+            self._push(key, now)
+            matched += 1
+        return matched
+    
+    def pop_due(self, now=None):
+        """
+        取出一个已到期的域名
+        
+        :return: 域名信息，没有到期域名时返回None
+        """
+        now = time.time() if now is None else now
+        while self._heap and self._heap[0][0] <= now:
+            next_due, _, key = heapq.heappop(self._heap)
+            entry = self._entries.get(key)
+            if entry is None or entry["next_due"] != next_due:
+                continue  # 已移除或已重新调度
+            entry["next_due"] = None
+            return entry["info"]
+        return None
+    
+    def seconds_until_next_due(self, now=None):
+        """距离下一个域名到期的秒数，队列为空时返回None"""
+        now = time.time() if now is None else now
+        while self._heap:
+            next_due, _, key = self._heap[0]
+            entry = self._entries.get(key)
+            if entry is None or entry["next_due"] != next_due:
+                heapq.heappop(self._heap)
+                continue
+            return max(0.0, next_due - now)
+        return None
+    
+    @staticmethod
+    def is_healthy(result):
+        """拨测成功且判定可用即为健康"""
+        return bool(result) and bool(result.get("is_available"))
+    
+    def record(self, domain_info, result):
+        """
+        根据拨测结果重新调度域名
+        
+        :param domain_info: pop_due返回的域名信息
+        :param result: 拨测结果，失败为None
+        :return: 下次拨测的间隔（秒），域名已不在列表中时返回None
+        """
+        key = self.domain_key(domain_info)
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        
+        # 以最新列表中的信息为准，备用域名被提升为主域名后按主域名的间隔调度
+        min_interval, max_interval = self.interval_bounds(entry["info"])
+        if self.is_healthy(result):
+            # 连续健康时间隔逐次翻倍，新变更的域名因此在前几轮保持较高频率
+            entry["interval"] = min(max(entry["interval"] * 2, min_interval), max_interval)
+        else:
+            entry["interval"] = min_interval
+        
+        self._push(key, time.time() + entry["interval"])
+        return entry["interval"]
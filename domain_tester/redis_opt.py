@@ -29,9 +29,7 @@ def get_redis_client():
             logger.warning("现有Redis连接无效，尝试重新建立连接...")
             redis_client = None
     
-    redis_host = os.environ.get('REDIS_HOST', 'redis')  # 使用Docker服务名
-    redis_port = int(os.environ.get('REDIS_PORT', 6379))
-    redis_db = int(os.environ.get('REDIS_DB', 5))
+    redis_host, redis_port, redis_db = _redis_address()
 
     redis_pool = redis.ConnectionPool(
         host=redis_host, 
@@ -51,6 +49,32 @@ def get_redis_client():
     
     return redis_client
 
+def _redis_address():
+    """从环境变量读取Redis地址"""
+    redis_host = os.environ.get('REDIS_HOST', 'redis')  # 使用Docker服务名
+    redis_port = int(os.environ.get('REDIS_PORT', 6379))
+    redis_db = int(os.environ.get('REDIS_DB', 5))
+    return redis_host, redis_port, redis_db
+
+def create_redis_client(socket_timeout=5):
+    """
+    创建不自动重试的Redis客户端
+    连接或读写超时直接抛出ConnectionError/TimeoutError，由调用方决定是否重试
+    
+    :param socket_timeout: 连接和读写超时（秒）
+    :return: Redis客户端（首次执行命令时才建立连接）
+    """
+    redis_host, redis_port, redis_db = _redis_address()
+    return redis.Redis(
+        host=redis_host,
+        port=redis_port,
+        db=redis_db,
+        socket_timeout=socket_timeout,
+        socket_connect_timeout=socket_timeout,
+        retry_on_timeout=False,
+        health_check_interval=30
+    )
+
 # 包装Redis操作的函数，支持自动重试
 def redis_operation(operation_func):
     """装饰器，为Redis操作添加自动重试功能"""
@@ -0,0 +1,137 @@
+"""
+拨测结果异步写入
+拨测协程把结果放入有界队列，写入任务按批取出并在线程中批量写入Redis；
+队列满时提交方等待写入任务腾出空间（背压），结果只在一批重试耗尽后才被丢弃
+"""
+
+import asyncio
+import logging
+import os
+import time
+
+from metrics import REDIS_WRITE_SECONDS, REDIS_WRITE_FAILURES, RESULTS_DROPPED, RESULT_QUEUE_DEPTH
+
+logger = logging.getLogger("domain_tester")
+
+
+class ResultWriter:
+    """拨测结果的批量写入器"""
+    
+    def __init__(self, save_batch, max_queue=100, batch_size=20, flush_interval=1.0,
+                 max_retries=5, retry_delay=1.0):
+        """
+        :param save_batch: 批量保存函数，接收结果列表，失败时抛出异常（自身不应无限重试）
+        :param max_queue: 队列最大长度，队列满时提交方等待
+        :param batch_size: 单批最多写入的结果数
+        :param flush_interval: 凑批的最长等待时间（秒）
+        :param max_retries: 单批写入失败后的最大重试次数
+        :param retry_delay: 首次重试的等待时间（秒），之后指数增长
+        """
+        self.save_batch = save_batch
+        self.batch_size = max(1, batch_size)
+        self.flush_interval = flush_interval
+        self.max_retries = max_retries
+        self.retry_delay = retry_delay
+        
+        self._queue = asyncio.Queue(maxsize=max(1, max_queue))
+        self._task = None
+        
+        self.written = 0
+        self.dropped = 0
+    
+    @classmethod
+    def from_env(cls, save_batch):
+        """根据环境变量创建写入器"""
+        return cls(
+            save_batch,
+            max_queue=int(os.environ.get("RESULT_QUEUE_SIZE", 100)),
+            batch_size=int(os.environ.get("RESULT_BATCH_SIZE", 20)),
+            flush_interval=float(os.environ.get("RESULT_FLUSH_INTERVAL", 1.0)),
+            max_retries=int(os.environ.get("RESULT_WRITE_RETRIES", 5))
+        )
+    
+    @property
+    def pending(self):
+        """队列中等待写入的结果数"""
+        return self._queue.qsize()
+    
+    def start(self):
+        """启动后台写入任务"""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+        return self._task
+    
+    async def submit(self, result):
+        """
+        提交拨测结果，不等待写入完成
+        队列已满时等待写入任务腾出空间，Redis持续不可用时拨测随之放慢，而不是丢弃结果
+        """
+        if not result:
+            return
+        
+        if self._queue.full():
+            logger.warning(f"结果队列已满（{self.pending} 条），等待写入任务腾出空间")
+        await self._queue.put(result)
+        RESULT_QUEUE_DEPTH.set(self.pending)
+    
+    async def _next_batch(self):
+        """等待第一条结果，再在flush_interval内凑满一批"""
+        batch = [await self._queue.get()]
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.flush_interval
+        
+        while len(batch) < self.batch_size:
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+    
+    async def _write(self, batch):
+        """在线程中写入一批结果，失败时指数退避重试"""
+        delay = self.retry_delay
+        for attempt in range(self.max_retries + 1):
+            start = time.perf_counter()
+            try:
+                await asyncio.to_thread(self.save_batch, batch)
+                REDIS_WRITE_SECONDS.observe(time.perf_counter() - start)
+                self.written += len(batch)
+                return True
+            except Exception as e:
+                REDIS_WRITE_FAILURES.inc()
+                if attempt >= self.max_retries:
+                    logger.error(f"写入 {len(batch)} 条拨测结果失败，已重试 {self.max_retries} 次，放弃本批: {e}")
+                    self.dropped += len(batch)
+                    RESULTS_DROPPED.inc(len(batch))
+                    return False
+                logger.warning(f"写入拨测结果失败，{delay:.1f}秒后第{attempt + 1}次重试: {e}")
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, 60)
+    
+    async def _run(self):
+        while True:
+            batch = await self._next_batch()
+            try:
+                await self._write(batch)
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+                RESULT_QUEUE_DEPTH.set(self.pending)
+    
+    async def close(self, timeout=30):
+        """等待队列中的结果写完后停止写入任务"""
+        if self._task is None:
+            return
+        try:
+            await asyncio.wait_for(self._queue.join(), timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"停止写入任务时仍有 {self.pending} 条结果未写入")
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
@@ -1,6 +1,226 @@
 
-import pandas as pd
-from aliyun_boce import scrape_aliyun_boce, clean_url
+# pandas只在分析拨测结果时按需导入，保证导入本模块足够轻量
+import time
+
+from aliyun_boce import scrape_aliyun_boce, clean_url, PartialVerdict
+from metrics import ANALYZE_SECONDS
+from tracing import trace
+
+# 各阶段耗时列名 -> 分析结果中的指标名
+PHASE_COLUMNS = {
+    'Analysis Time': 'analysis_time_ms',
+    'Connection Time': 'connection_time_ms',
+    'SSL Time': 'ssl_time_ms',
+    'First Packet Time': 'first_packet_time_ms',
+    'Download Time': 'download_time_ms'
+}
+
+# 统计的延迟分位数
+LATENCY_PERCENTILES = {'p50': 0.5, 'p90': 0.9, 'p99': 0.99}
+
+
+def _to_ms(series):
+    """将'123ms'、'-'等文本列向量化转换为毫秒数值，无法解析的为NaN"""
+    import pandas as pd
+    
+    values = series.astype(str).str.replace('ms', '', regex=False).str.strip()
+    return pd.to_numeric(values.replace(['-', ''], float('nan')), errors='coerce')
+
+
+def _clean_number(value):
+    """转换为可JSON序列化的数值，NaN转为None"""
+    import pandas as pd
+    
+    if value is None or pd.isna(value):
+        return None
+    return round(float(value), 2)
+
+
+def prepare_probe_frame(df):
+    """
+    将原始拨测表格转换为分析用的数值列
+    
+    :param df: 拨测结果数据DataFrame（原始文本列）
+    :return: 包含Status、Response_Time_ms、各阶段耗时、ISP、Province列的DataFrame
+    """
+    import pandas as pd
+    
+    frame = pd.DataFrame({
+        'Detection Point': df['Detection Point'],
+        # 将Status列转换为整数类型 (可能是字符串)
+        'Status': pd.to_numeric(df['Status'], errors='coerce'),
+        # 处理响应时间，将'-'替换为NaN，将'ms'去掉，然后转为数值
+        'Response_Time_ms': _to_ms(df['Total Response Time'])
+    })
+    
+    for column, metric in PHASE_COLUMNS.items():
+        if column in df.columns:
+            frame[metric] = _to_ms(df[column])
+    
+    # 提取运营商和省份信息（探测点名称去掉运营商部分即为地区）
+    detection_point = frame['Detection Point'].astype(str)
+    frame['ISP'] = detection_point.str.extract(r'China-(Mobile|Telecom|Unicom)', expand=False)
+    frame['Province'] = (
+        detection_point.str.replace(r'China-(Mobile|Telecom|Unicom)', '', regex=True)
+        .str.strip(' -_')
+        .replace('', 'Unknown')
+    )
+    frame['Is_Success'] = frame['Status'] == 200
+    
+    return frame
+
+
+def _latency_metrics(frame):
+    """参与分位数统计的指标列"""
+    return ['Response_Time_ms'] + [m for m in PHASE_COLUMNS.values() if m in frame.columns]
+
+
+def _percentile_table(grouped, metrics):
+    """
+    一次向量化计算分组后各指标的分位数
+    
+    :return: 以分组键为索引、(指标, 分位数名)为列的DataFrame
+    """
+    import pandas as pd
+    
+    table = grouped[metrics].quantile(list(LATENCY_PERCENTILES.values())).unstack()
+    table.columns = pd.MultiIndex.from_tuples(
+        [(metric, name) for metric, q in table.columns
+         for name, value in LATENCY_PERCENTILES.items() if value == q]
+    )
+    return table
+
+
+def _group_breakdown(frame, keys, metrics):
+    """按指定键分组，统计成功率和成功请求的延迟分位数"""
+    counts = frame.groupby(keys, dropna=False)['Is_Success'].agg(['size', 'sum'])
+    
+    success_df = frame[frame['Is_Success']]
+    percentiles = _percentile_table(success_df.groupby(keys), metrics) if not success_df.empty else None
+    
+    breakdown = {}
+    for key, row in counts.iterrows():
+        total, success = int(row['size']), int(row['sum'])
+        latency = {}
+        for metric in metrics:
+            latency[metric] = {
+                name: _clean_number(percentiles.loc[key, (metric, name)])
+                if percentiles is not None and key in percentiles.index else None
+                for name in LATENCY_PERCENTILES
+            }
+        breakdown[key] = {
+            'total_checks': total,
+            'success_checks': success,
+            'success_rate': (success / total) * 100 if total > 0 else 0,
+            'latency': latency
+        }
+    
+    return breakdown
+
+
+def analyze_latency_breakdown(frame):
+    """
+    计算延迟分位数和分阶段耗时，按运营商和省份分组
+    
+    :param frame: prepare_probe_frame处理后的DataFrame
+    :return: 包含整体分位数、运营商分组、运营商+省份分组的字典
+    """
+    metrics = _latency_metrics(frame)
+    success_df = frame[frame['Is_Success']]
+    
+    overall = {}
+    if not success_df.empty:
+        quantiles = success_df[metrics].quantile(list(LATENCY_PERCENTILES.values()))
+        for metric in metrics:
+            overall[metric] = {
+                name: _clean_number(quantiles.loc[q, metric]) for name, q in LATENCY_PERCENTILES.items()
+            }
+    
+    # 运营商+省份一次分组；运营商为空的探测点归入Other
+    regional = frame.assign(ISP=frame['ISP'].fillna('Other'))
+    by_region = [
+        {'isp': isp, 'province': province, **stats}
+        for (isp, province), stats in _group_breakdown(regional, ['ISP', 'Province'], metrics).items()
+    ]
+    
+    return {
+        'overall': overall,
+        'by_isp_province': by_region
+    }
+
+
+def summarize_probe_frame(df):
+    """
+    根据prepare_probe_frame处理后的数据汇总域名可用性
+    
+    :param df: prepare_probe_frame处理后的DataFrame
+    :return: 分析结果字典
+    """
+    # 1. 计算基本统计信息
+    total_checks = len(df)
+    # 状态码200表示成功，不是失败！
+    success_df = df[df['Is_Success']]
+    success_checks = len(success_df)
+    success_rate = (success_checks / total_checks) * 100 if total_checks > 0 else 0
+    
+    # 2. 计算平均、最大、最小响应时间 - 状态码200表示成功！
+    avg_response_time = success_df['Response_Time_ms'].mean() if success_checks > 0 else float('nan')
+    max_response_time = success_df['Response_Time_ms'].max() if success_checks > 0 else float('nan')
+    min_response_time = success_df['Response_Time_ms'].min() if success_checks > 0 else float('nan')
+    
+    # 查找最高延迟的地区 - 更安全的方式，注意状态码200是成功！
+    max_latency_area = "N/A"
+    max_latency_value = float('nan')
+    min_latency_area = "N/A"
+    min_latency_value = float('nan')
+    
+    # 只筛选成功的行并且Response_Time_ms不是NaN的行
+    timed_df = success_df[success_df['Response_Time_ms'].notna()]
+    if not timed_df.empty:
+        max_row = timed_df.loc[timed_df['Response_Time_ms'].idxmax()]
+        min_row = timed_df.loc[timed_df['Response_Time_ms'].idxmin()]
+        
+        max_latency_area = max_row['Detection Point']
+        max_latency_value = max_row['Response_Time_ms']
+        min_latency_area = min_row['Detection Point']
+        min_latency_value = min_row['Response_Time_ms']
+    
+    # 3. 分析错误状态码分布 - 非200的状态码才是错误
+    failed_df = df[~df['Is_Success']]
+    error_status_counts = failed_df['Status'].value_counts().to_dict()
+    
+    # 4. 分析不可用地区 - 非200的状态码才表示不可用
+    unavailable_areas = failed_df[['Detection Point', 'Status']].values.tolist()
+    
+    # 5. 按运营商分组分析（一次分组同时得到成功率和延迟分位数）
+    metrics = _latency_metrics(df)
+    isp_analysis = _group_breakdown(df[df['ISP'].notna()], 'ISP', metrics)
+    
+    # 6. 判断整体可用性
+    # 假设：如果成功率 >= 80%，我们认为域名可用
+    is_available = success_rate >= 80
+    
+    # 7. 汇总结果
+    analysis_result = {
+        'total_checks': total_checks,
+        'success_checks': success_checks,
+        'success_rate': success_rate,
+        'average_response_time_ms': avg_response_time,
+        'max_response_time_ms': max_response_time,
+        'min_response_time_ms': min_response_time,
+        'max_latency_area': max_latency_area,
+        'max_latency_value': max_latency_value,
+        'min_latency_area': min_latency_area,
+        'min_latency_value': min_latency_value,
+        'error_status_distribution': error_status_counts,
+        'unavailable_areas': unavailable_areas,
+        'isp_analysis': isp_analysis,
+        'latency_breakdown': analyze_latency_breakdown(df),
+        'is_available': is_available
+    }
+    
+    return analysis_result
+
 
 def analyze_domain_availability(df):
     """
@@ -13,95 +233,8 @@ def analyze_domain_availability(df):
         # 确认DataFrame列名
         print("DataFrame列名:", df.columns.tolist())
         
-        # 将Status列转换为整数类型 (可能是字符串)
-        df['Status'] = pd.to_numeric(df['Status'], errors='coerce')
-        
-        # 1. 计算基本统计信息
-        total_checks = len(df)
-        # 状态码200表示成功，不是失败！
-        success_checks = len(df[df['Status'] == 200])
-        success_rate = (success_checks / total_checks) * 100 if total_checks > 0 else 0
-        
-        # 2. 计算响应时间统计
-        # 处理响应时间，将'-'替换为NaN，将'ms'去掉，然后转为数值
-        df['Response_Time_ms'] = df['Total Response Time'].str.replace('ms', '')
-        # 将'-'或空字符串替换为NaN
-        df['Response_Time_ms'] = df['Response_Time_ms'].replace(['-', ''], float('nan'))
-        # 转换为数值类型
-        df['Response_Time_ms'] = pd.to_numeric(df['Response_Time_ms'], errors='coerce')
-        
-        # 计算平均、最大、最小响应时间 - 状态码200表示成功！
-        avg_response_time = df[df['Status'] == 200]['Response_Time_ms'].mean() if success_checks > 0 else float('nan')
-        max_response_time = df[df['Status'] == 200]['Response_Time_ms'].max() if success_checks > 0 else float('nan')
-        min_response_time = df[df['Status'] == 200]['Response_Time_ms'].min() if success_checks > 0 else float('nan')
-        
-        # 查找最高延迟的地区 - 更安全的方式，注意状态码200是成功！
-        max_latency_area = "N/A"
-        max_latency_value = float('nan')
-        min_latency_area = "N/A"
-        min_latency_value = float('nan')
-        
-        if success_checks > 0:
-            # 只筛选成功的行并且Response_Time_ms不是NaN的行
-            success_df = df[(df['Status'] == 200) & df['Response_Time_ms'].notna()].copy()
-            
-            if not success_df.empty:
-                # 对筛选后的DataFrame进行排序，获取最高和最低值
-                max_row = success_df.sort_values('Response_Time_ms', ascending=False).iloc[0]
-                min_row = success_df.sort_values('Response_Time_ms', ascending=True).iloc[0]
-                
-                max_latency_area = max_row['Detection Point']
-                max_latency_value = max_row['Response_Time_ms']
-                min_latency_area = min_row['Detection Point']
-                min_latency_value = min_row['Response_Time_ms']
-        
-        # 3. 分析错误状态码分布 - 非200的状态码才是错误
-        error_status_counts = df[df['Status'] != 200]['Status'].value_counts().to_dict()
-        
-        # 4. 分析不可用地区 - 非200的状态码才表示不可用
-        unavailable_areas = df[df['Status'] != 200][['Detection Point', 'Status']].values.tolist()
-        
-        # 5. 按运营商分组分析
-        # 提取运营商信息
-        df['ISP'] = df['Detection Point'].str.extract(r'China-(Mobile|Telecom|Unicom)')
-        isp_analysis = {}
-        
-        for isp in df['ISP'].dropna().unique():
-            isp_df = df[df['ISP'] == isp]
-            isp_total = len(isp_df)
-            # 状态码200表示成功！
-            isp_success = len(isp_df[isp_df['Status'] == 200])
-            isp_success_rate = (isp_success / isp_total) * 100 if isp_total > 0 else 0
-            
-            isp_analysis[isp] = {
-                'total_checks': isp_total,
-                'success_checks': isp_success,
-                'success_rate': isp_success_rate
-            }
-        
-        # 6. 判断整体可用性
-        # 假设：如果成功率 >= 80%，我们认为域名可用
-        is_available = success_rate >= 80
-        
-        # 7. 汇总结果
-        analysis_result = {
-            'total_checks': total_checks,
-            'success_checks': success_checks,
-            'success_rate': success_rate,
-            'average_response_time_ms': avg_response_time,
-            'max_response_time_ms': max_response_time,
-            'min_response_time_ms': min_response_time,
-            'max_latency_area': max_latency_area,
-            'max_latency_value': max_latency_value,
-            'min_latency_area': min_latency_area,
-            'min_latency_value': min_latency_value,
-            'error_status_distribution': error_status_counts,
-            'unavailable_areas': unavailable_areas,
-            'isp_analysis': isp_analysis,
-            'is_available': is_available
-        }
-        
-        return analysis_result
+        with ANALYZE_SECONDS.time():
+            return summarize_probe_frame(prepare_probe_frame(df))
         
     except Exception as e:
         print(f"分析域名可用性时出错: {e}")
@@ -111,36 +244,90 @@ def analyze_domain_availability(df):
     
 
 
-def run_boce(url_to_check):
+class StreamingAvailabilityAnalyzer:
+    """
+    增量可用性分析器
+    逐块接收原始表格数据，只保留数值化后的紧凑列，最后统一汇总
+    
+    内存占用为O(行数)：精确分位数和不可用地区列表都需要逐行数据，
+    行数以单次拨测任务的探测点数量为上限（整张表格本就完整存在于页面中），
+    流式处理节省的是原始文本列和读取与分析交错的时间，而不是行数
+    """
+    
+    def __init__(self):
+        self._frames = []
+        self.row_count = 0
+        self.elapsed = 0.0  # 分析累计耗时（秒），与页面读取交错进行
+    
+    def feed(self, chunk):
+        """接收一块原始表格数据"""
+        start = time.perf_counter()
+        frame = prepare_probe_frame(chunk)
+        self._frames.append(frame)
+        self.row_count += len(frame)
+        self.elapsed += time.perf_counter() - start
+    
+    def result(self):
+        """汇总已接收的数据，无数据或出错时返回None"""
+        if not self._frames:
+            return None
+        
+        start = time.perf_counter()
+        try:
+            import pandas as pd
+            
+            return summarize_probe_frame(pd.concat(self._frames, ignore_index=True))
+        except Exception as e:
+            print(f"分析域名可用性时出错: {e}")
+            import traceback
+            traceback.print_exc()
+            return None
+        finally:
+            self.elapsed += time.perf_counter() - start
+            ANALYZE_SECONDS.observe(self.elapsed)
+
+
+def run_boce(url_to_check, probe_context=None):
     """
-    执行完整的拨测流程：执行拨测、等待下载、解析文件
+    执行完整的拨测流程：执行拨测、分块读取结果并增量分析
     
     :param url_to_check: 待检测的URL
+    :param probe_context: 可选的ProbeContext，用于超时取消
     :return: 解析后的数据或None（如果任何步骤失败）
     """
     # 清理URL
     cleaned_url = clean_url(url_to_check)
     print(f"\n开始检测网址: {cleaned_url}")
     
-    # 执行拨测并直接获取数据
-    result_data = scrape_aliyun_boce(cleaned_url)
+    # 执行拨测，结果表格分块送入增量分析器；各步骤耗时记录为span
+    # 部分结果已能确定不可用时提前结束（BOCE_EARLY_EXIT）
+    analyzer = StreamingAvailabilityAnalyzer()
+    early_exit = PartialVerdict.from_env()
+    with trace(cleaned_url) as probe_trace:
+        row_count = scrape_aliyun_boce(cleaned_url, row_consumer=analyzer.feed, early_exit=early_exit,
+                                       probe_context=probe_context)
     
-    # 检查result_data是否为DataFrame类型并且不为空
-    if result_data is None or (hasattr(result_data, 'empty') and result_data.empty):
-        print("拨测失败，无法获取数据")
+    if probe_context is not None and probe_context.cancelled:
+        print("拨测已超时取消，丢弃部分结果")
         return None
     
-    # 分析域名可用性
-    analysis_result = analyze_domain_availability(result_data)
-    if analysis_result is None:
-        print("分析域名可用性失败")
+    if not row_count:
+        print("拨测失败，无法获取数据")
         return None
     
-    # 4. 分析域名可用性
-    analysis_result = analyze_domain_availability(result_data)
+    # 汇总域名可用性
+    analysis_result = analyzer.result()
     if analysis_result is None:
         print("分析域名可用性失败")
         return None
+    analysis_result['spans'] = probe_trace.to_list()
+    
+    # 提前结束时只分析了已返回结果的检测点
+    analysis_result['partial'] = early_exit.verdict is not None
+    if early_exit.verdict:
+        analysis_result['early_exit'] = {'verdict': early_exit.verdict, **early_exit.counts}
+        if early_exit.verdict == 'unhealthy':
+            analysis_result['is_available'] = False
     print("\n域名可用性分析完成")
     print(f"检测总数: {analysis_result['total_checks']}")
     print(f"成功数量: {analysis_result['success_checks']}")
@@ -149,6 +336,13 @@ def run_boce(url_to_check):
     print(f"最高延迟地区: {analysis_result['max_latency_area']} ({analysis_result['max_latency_value']}ms)")
     print(f"最低延迟地区: {analysis_result['min_latency_area']} ({analysis_result['min_latency_value']}ms)")
     print(f"域名是否可用: {'是' if analysis_result['is_available'] else '否'}")
+    if analysis_result['partial']:
+        print(f"提前结束: {analysis_result['early_exit']}")
+    
+    # 显示延迟分位数
+    overall_latency = analysis_result['latency_breakdown']['overall']
+    for metric, percentiles in overall_latency.items():
+        print(f"{metric}: " + ", ".join(f"{name}={value}" for name, value in percentiles.items()))
     
     # 显示不可用地区
     if analysis_result['unavailable_areas']:
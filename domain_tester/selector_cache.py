@@ -0,0 +1,100 @@
+"""
+选择器命中缓存
+记录每组选择器的命中情况并持久化到本地JSON文件，
+上次命中的选择器优先尝试，其余按命中率排序，减少失败选择器的等待超时
+"""
+
+import json
+import os
+import tempfile
+import threading
+import time
+
+# 运行时状态不写入源码目录
+DEFAULT_CACHE_FILE = os.path.join(tempfile.gettempdir(), "domain_tester", "selector_cache.json")
+
+
+class SelectorCache:
+    """按分组记录选择器命中情况"""
+    
+    def __init__(self, path=DEFAULT_CACHE_FILE):
+        """
+        :param path: 持久化文件路径，为空时只在内存中记录
+        """
+        self.path = path
+        self._lock = threading.Lock()
+        self._data = self._load()
+    
+    @classmethod
+    def from_env(cls):
+        """根据环境变量BOCE_SELECTOR_CACHE创建缓存"""
+        return cls(os.environ.get("BOCE_SELECTOR_CACHE", DEFAULT_CACHE_FILE))
+    
+    def _load(self):
+        if not self.path or not os.path.exists(self.path):
+            return {}
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            return data if isinstance(data, dict) else {}
+        except (OSError, json.JSONDecodeError) as e:
+            print(f"读取选择器缓存失败，将重新统计: {e}")
+            return {}
+    
+    def _save(self):
+        if not self.path:
+            return
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(self._data, f, ensure_ascii=False, indent=2)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            print(f"保存选择器缓存失败: {e}")
+    
+    def order(self, group, selectors):
+        """
+        返回本次尝试的选择器顺序
+        
+        :param group: 选择器分组，如'input'、'ok_button'
+        :param selectors: 默认顺序的选择器列表
+        :return: 上次命中的选择器在前，其余按命中率降序（命中率相同时保持默认顺序）
+        """
+        with self._lock:
+            group_data = self._data.get(group, {})
+            stats = group_data.get("stats", {})
+            last_winner = group_data.get("last_winner")
+        
+        def hit_rate(selector):
+            item = stats.get(selector, {})
+            hits, misses = item.get("hits", 0), item.get("misses", 0)
+            # 拉普拉斯平滑，未尝试过的选择器视为50%
+            return (hits + 1) / (hits + misses + 2)
+        
+        ordered = sorted(selectors, key=lambda s: -hit_rate(s))
+        if last_winner in selectors:
+            ordered.remove(last_winner)
+            ordered.insert(0, last_winner)
+        return ordered
+    
+    def record(self, group, selector, hit):
+        """
+        记录一次选择器尝试结果并持久化
+        
+        :param group: 选择器分组
+        :param selector: 尝试的选择器
+        :param hit: 是否命中
+        """
+        with self._lock:
+            group_data = self._data.setdefault(group, {"stats": {}, "last_winner": None})
+            item = group_data["stats"].setdefault(selector, {"hits": 0, "misses": 0})
+            if hit:
+                item["hits"] += 1
+                item["last_hit"] = int(time.time())
+                group_data["last_winner"] = selector
+            else:
+                item["misses"] += 1
+                if group_data["last_winner"] == selector:
+                    group_data["last_winner"] = None
+            self._save()
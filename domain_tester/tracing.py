@@ -0,0 +1,151 @@
+"""
+拨测耗时追踪
+以上下文管理器记录每个步骤（以及每个备选选择器）的耗时，
+单次拨测的span列表附加到结果中，跨多次拨测的统计用于调整等待超时
+"""
+
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from metrics import BOCE_STAGE_SECONDS, register_json_route
+
+# 每个span保留的最近耗时样本数，用于计算分位数
+SAMPLE_SIZE = 200
+
+_current_trace = ContextVar("boce_trace", default=None)
+_current_path = ContextVar("boce_span_path", default=())
+
+
+class Trace:
+    """一次拨测中记录的span"""
+    
+    def __init__(self, name):
+        self.name = name
+        self.started = time.perf_counter()
+        self.spans = []
+    
+    def to_list(self):
+        return [dict(s) for s in self.spans]
+
+
+class SpanStats:
+    """跨拨测的span耗时统计"""
+    
+    def __init__(self, sample_size=SAMPLE_SIZE):
+        self.sample_size = sample_size
+        self._stats = {}
+        self._lock = threading.Lock()
+    
+    def record(self, name, duration_ms, error):
+        with self._lock:
+            stats = self._stats.get(name)
+            if stats is None:
+                stats = self._stats[name] = {
+                    "count": 0,
+                    "errors": 0,
+                    "total_ms": 0.0,
+                    "max_ms": 0.0,
+                    "samples": deque(maxlen=self.sample_size)
+                }
+            stats["count"] += 1
+            stats["errors"] += int(error)
+            stats["total_ms"] += duration_ms
+            stats["max_ms"] = max(stats["max_ms"], duration_ms)
+            stats["samples"].append(duration_ms)
+    
+    def summary(self):
+        """各span的次数、错误数、平均/最大耗时和最近样本的分位数（毫秒）"""
+        with self._lock:
+            items = [(name, dict(stats), sorted(stats["samples"])) for name, stats in self._stats.items()]
+        
+        summary = {}
+        for name, stats, samples in items:
+            summary[name] = {
+                "count": stats["count"],
+                "errors": stats["errors"],
+                "avg_ms": round(stats["total_ms"] / stats["count"], 2),
+                "max_ms": round(stats["max_ms"], 2),
+                "p50_ms": round(samples[int(len(samples) * 0.5)], 2),
+                "p90_ms": round(samples[min(len(samples) - 1, int(len(samples) * 0.9))], 2)
+            }
+        return summary
+    
+    def reset(self):
+        with self._lock:
+            self._stats.clear()
+
+
+SPAN_STATS = SpanStats()
+register_json_route("/spans", SPAN_STATS.summary)
+
+
+@contextmanager
+def trace(name):
+    """
+    开始一次拨测追踪，with代码块内的span都记录到返回的Trace中
+    
+    :param name: 追踪名称
+    """
+    current = Trace(name)
+    trace_token = _current_trace.set(current)
+    path_token = _current_path.set(())
+    try:
+        yield current
+    finally:
+        _current_path.reset(path_token)
+        _current_trace.reset(trace_token)
+
+
+class _Span:
+    def __init__(self):
+        self.attrs = {}
+    
+    def set(self, **attrs):
+        """附加属性，如选择器是否命中、轮询次数"""
+        self.attrs.update(attrs)
+
+
+@contextmanager
+def span(name, **attrs):
+    """
+    记录with代码块的耗时；嵌套的span以'/'连接成路径
+    代码块抛出异常时span标记为error，异常继续向外抛出
+    
+    :param name: span名称
+    :param attrs: 附加属性
+    """
+    path = _current_path.get() + (name,)
+    full_name = "/".join(path)
+    current = _Span()
+    current.attrs.update(attrs)
+    
+    path_token = _current_path.set(path)
+    start = time.perf_counter()
+    error = False
+    try:
+        yield current
+    except BaseException:
+        error = True
+        raise
+    finally:
+        duration = time.perf_counter() - start
+        _current_path.reset(path_token)
+        
+        duration_ms = duration * 1000
+        SPAN_STATS.record(full_name, duration_ms, error)
+        BOCE_STAGE_SECONDS.observe(duration, stage=full_name)
+        
+        active = _current_trace.get()
+        if active is not None:
+            record = {
+                "name": full_name,
+                "start_ms": round((start - active.started) * 1000, 2),
+                "duration_ms": round(duration_ms, 2),
+                "status": "error" if error else "ok"
+            }
+            if current.attrs:
+                record["attrs"] = current.attrs
+            active.spans.append(record)
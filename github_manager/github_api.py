@@ -7,7 +7,6 @@ GitHub API 直接提交管理器
 import json
 import base64
 import logging
-import requests
 from datetime import date
 from pathlib import Path
 from typing import Dict, Optional
@@ -44,6 +43,7 @@ class GitHubAPIManager:
     
     def _verify_access(self):
         """验证GitHub访问权限"""
+        import requests
         try:
             url = f"{self.base_url}/repos/{self.repo_owner}/{self.repo_name}"
             response = requests.get(url, headers=self.headers, timeout=30)
@@ -72,6 +72,7 @@ class GitHubAPIManager:
         Returns:
             dict: 包含content和sha的字典，文件不存在返回None
         """
+        import requests
         try:
             url = f"{self.base_url}/repos/{self.repo_owner}/{self.repo_name}/contents/{file_path}"
             params = {"ref": self.branch}
@@ -113,6 +114,7 @@ class GitHubAPIManager:
         Returns:
             bool: 是否成功
         """
+        import requests
         try:
             url = f"{self.base_url}/repos/{self.repo_owner}/{self.repo_name}/contents/{file_path}"
             
@@ -235,6 +237,65 @@ class DomainsGitHubManager:
             self.logger.error(f"替换域名失败: {e}")
             return False
     
+    @staticmethod
+    def _same_domain(url_a: str, url_b: str) -> bool:
+        """忽略协议和末尾斜杠比较两个域名URL"""
+        def normalize(url: str) -> str:
+            return url.split("://", 1)[-1].rstrip("/").lower()
+        return normalize(url_a or "") == normalize(url_b or "")
+    
+    def has_domain_of_brand(self, brand: str, domain: str) -> bool:
+        """
+        品牌在本地domains.json中是否已有该域名
+        
+        Args:
+            brand: 品牌名称
+            domain: 域名（可带或不带协议）
+            
+        Returns:
+            bool: 是否存在，读取失败时返回False
+        """
+        try:
+            brand_domains = self.load_local_domains().get("panels", {}).get(brand, [])
+            return any(self._same_domain(entry.get("url"), domain) for entry in brand_domains)
+        except Exception as e:
+            self.logger.error(f"读取品牌 {brand} 的域名列表失败: {e}")
+            return False
+    
+    def promote_domain_of_brand(self, brand: str, domain: str) -> bool:
+        """
+        将品牌列表中已有的域名移到第一位，原主域名顺延为第一个备用域名
+        
+        Args:
+            brand: 品牌名称
+            domain: 要提升的域名（可带或不带协议）
+            
+        Returns:
+            bool: 是否成功
+        """
+        try:
+            data = self.load_local_domains()
+            brand_domains = data.get("panels", {}).get(brand, [])
+            
+            index = next((i for i, entry in enumerate(brand_domains)
+                          if self._same_domain(entry.get("url"), domain)), None)
+            if index is None:
+                self.logger.error(f"品牌 {brand} 的域名列表中没有 {domain}")
+                return False
+            if index == 0:
+                self.logger.info(f"{domain} 已是品牌 {brand} 的主域名")
+                return True
+            
+            old_domain = brand_domains[0].get("url", "N/A")
+            brand_domains.insert(0, brand_domains.pop(index))
+            self.logger.info(f"品牌 {brand} 主域名已切换为已有的备用域名: {old_domain} -> {brand_domains[0].get('url')}")
+            
+            return self.save_local_domains(data)
+            
+        except Exception as e:
+            self.logger.error(f"提升域名失败: {e}")
+            return False
+    
     def commit_to_github(self, commit_message: str = None) -> bool:
         """将本地domains.json提交到GitHub"""
         try:
@@ -285,4 +346,26 @@ class DomainsGitHubManager:
             
         except Exception as e:
             self.logger.error(f"替换并提交域名失败: {e}")
+            return False
+    
+    def promote_and_commit(self, brand: str, domain: str) -> bool:
+        """将已有的备用域名提升为主域名并提交到GitHub（一站式操作）"""
+        try:
+            # 1. 调整本地域名顺序
+            if not self.promote_domain_of_brand(brand, domain):
+                return False
+            
+            # 2. 生成提交消息
+            today = date.today().strftime("%Y-%m-%d")
+            commit_message = f"自动切换{brand}品牌主域名到备用域名: {domain} ({today})"
+            
+            # 3. 提交到GitHub
+            if not self.commit_to_github(commit_message):
+                return False
+            
+            self.logger.info(f"成功提升并提交域名: {brand} -> {domain}")
+            return True
+            
+        except Exception as e:
+            self.logger.error(f"提升并提交域名失败: {e}")
             return False
\ No newline at end of file
@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+"""
+导入耗时审计工具
+基于 python -X importtime 统计各入口模块的启动导入耗时，
+检查重依赖是否被提前加载，并与基准文件比较以发现启动性能回退
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+current_dir = Path(__file__).parent
+
+# 审计目标: 名称 -> (工作目录, 导入的模块, 启动时不允许加载的重依赖)
+AUDIT_TARGETS = {
+    "domain_tester": ("domain_tester", "domain_tester", ["DrissionPage", "pandas", "numpy", "httpx"]),
+    "boce_api": ("domain_tester", "boce_api", ["DrissionPage", "pandas", "numpy"]),
+    "run_boce": ("domain_tester", "run_boce", ["DrissionPage", "pandas", "numpy"]),
+    "domain_monitor": ("domain_monitor", "domain_monitor", ["DrissionPage", "pandas", "numpy", "redis", "requests"]),
+    "coordinator": (".", "coordinator", ["DrissionPage", "pandas", "numpy", "redis", "requests"]),
+}
+
+DEFAULT_BUDGET_FILE = current_dir / "import_budget.json"
+
+# 超出基准的容忍比例，避免机器抖动造成误报
+BUDGET_TOLERANCE = 1.2
+
+
+def measure_import(workdir: str, module: str) -> dict:
+    """
+    在独立进程中导入模块并解析 -X importtime 输出
+    
+    Args:
+        workdir: 运行目录（相对项目根目录）
+        module: 要导入的模块名
+    
+    Returns:
+        dict: 包含总耗时(ms)、各模块累计耗时和目标模块直接依赖耗时的字典
+    """
+    env = dict(os.environ)
+    env["PYTHONDONTWRITEBYTECODE"] = "1"
+    
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=current_dir / workdir,
+        env=env,
+        capture_output=True,
+        text=True,
+        timeout=120
+    )
+    
+    modules = {}
+    children = []
+    pending = []
+    for line in proc.stderr.splitlines():
+        # 格式: import time: self [us] | cumulative | imported package（按嵌套层级缩进）
+        if not line.startswith("import time:") or "imported package" in line:
+            continue
+        parts = line.replace("import time:", "").split("|")
+        if len(parts) != 3 or not parts[1].strip().isdigit():
+            continue
+        
+        name = parts[2].strip()
+        depth = (len(parts[2]) - len(parts[2].lstrip()) - 1) // 2
+        cumulative_ms = int(parts[1]) / 1000
+        modules[name] = cumulative_ms
+        
+        # 输出按完成顺序排列，目标模块之前的同批次行就是它导入的依赖
+        if depth == 0:
+            if name == module:
+                children = [(n, ms) for n, d, ms in pending if d == 1]
+            pending = []
+        else:
+            pending.append((name, depth, cumulative_ms))
+    
+    return {
+        "ok": proc.returncode == 0,
+        "error": proc.stderr.strip().splitlines()[-1] if proc.returncode != 0 and proc.stderr else None,
+        "total_ms": round(modules.get(module, 0.0), 2),
+        "modules": modules,
+        "children": children
+    }
+
+
+def audit(targets: list, top: int) -> dict:
+    """审计指定目标，返回每个目标的耗时和违规导入"""
+    report = {}
+    
+    for name in targets:
+        workdir, module, forbidden = AUDIT_TARGETS[name]
+        result = measure_import(workdir, module)
+        
+        loaded_forbidden = [m for m in forbidden if m in result["modules"]]
+        heaviest = sorted(result["children"], key=lambda item: item[1], reverse=True)[:top]
+        
+        report[name] = {
+            "ok": result["ok"],
+            "error": result["error"],
+            "total_ms": result["total_ms"],
+            "forbidden_loaded": loaded_forbidden,
+            "heaviest": [{"module": m, "cumulative_ms": round(ms, 2)} for m, ms in heaviest]
+        }
+    
+    return report
+
+
+def load_budget(path: Path) -> dict:
+    """加载导入耗时基准"""
+    if not path.exists():
+        return {}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="统计入口模块的导入耗时并检查启动性能回退")
+    parser.add_argument("targets", nargs="*",
+                        help=f"要审计的目标，默认全部: {', '.join(AUDIT_TARGETS)}")
+    parser.add_argument("--top", type=int, default=10, help="显示最慢的前N个直接依赖")
+    parser.add_argument("--budget", type=Path, default=DEFAULT_BUDGET_FILE, help="基准文件路径")
+    parser.add_argument("--update-budget", action="store_true", help="用本次结果更新基准文件")
+    parser.add_argument("--json", action="store_true", help="以JSON格式输出")
+    args = parser.parse_args()
+    
+    targets = args.targets or list(AUDIT_TARGETS.keys())
+    unknown = [t for t in targets if t not in AUDIT_TARGETS]
+    if unknown:
+        parser.error(f"未知的审计目标: {unknown}")
+    
+    report = audit(targets, args.top)
+    budget = load_budget(args.budget)
+    
+    failures = []
+    for name, item in report.items():
+        if not item["ok"]:
+            failures.append(f"{name}: 导入失败 - {item['error']}")
+            continue
+        if item["forbidden_loaded"]:
+            failures.append(f"{name}: 启动时加载了重依赖 {item['forbidden_loaded']}")
+        limit = budget.get(name)
+        if limit and item["total_ms"] > limit * BUDGET_TOLERANCE:
+            failures.append(f"{name}: 导入耗时 {item['total_ms']}ms 超出基准 {limit}ms")
+    
+    if args.json:
+        print(json.dumps({"report": report, "failures": failures}, ensure_ascii=False, indent=2))
+    else:
+        for name, item in report.items():
+            print(f"\n=== {name}: {item['total_ms']}ms (基准: {budget.get(name, 'N/A')}ms) ===")
+            if item["error"]:
+                print(f"  导入失败: {item['error']}")
+            for entry in item["heaviest"]:
+                print(f"  {entry['cumulative_ms']:>10.2f}ms  {entry['module']}")
+        print()
+        for failure in failures:
+            print(f"[回退] {failure}")
+    
+    if args.update_budget:
+        budget.update({name: item["total_ms"] for name, item in report.items() if item["ok"]})
+        with open(args.budget, "w", encoding="utf-8") as f:
+            json.dump(budget, f, ensure_ascii=False, indent=4)
+        print(f"基准已更新: {args.budget}")
+    
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
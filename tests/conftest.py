@@ -0,0 +1,14 @@
+"""
+测试路径配置
+domain_tester以工作目录内的平铺模块运行（from aliyun_boce import ...），
+caddy_ssh_manager以包的形式从仓库根目录导入
+"""
+
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+for path in (ROOT, ROOT / "domain_tester"):
+    if str(path) not in sys.path:
+        sys.path.insert(0, str(path))
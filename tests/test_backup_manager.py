@@ -0,0 +1,97 @@
+"""远程Caddyfile备份管理测试：文件名解析、保留策略和哈希失败时中止"""
+
+from datetime import datetime, timedelta
+
+from caddy_ssh_manager.backup_manager import CaddyBackupManager
+
+CADDYFILE = "/etc/caddy/Caddyfile"
+SHA256 = "ab" * 32
+
+
+class FakeSSH:
+    """按命令前缀返回预设结果，并记录执行过的命令"""
+    
+    def __init__(self, responses):
+        self.responses = responses
+        self.commands = []
+    
+    def execute_command(self, command):
+        self.commands.append(command)
+        for prefix, response in self.responses.items():
+            if command.startswith(prefix):
+                return response
+        return "", "", 0
+
+
+def backup(timestamp, sha=None):
+    return {"path": f"{CADDYFILE}.bak.{timestamp:%Y%m%d%H%M%S}", "timestamp": timestamp,
+            "sha256_prefix": sha, "compressed": False}
+
+
+def test_parse_backup_list_sorts_newest_first():
+    manager = CaddyBackupManager(FakeSSH({}), CADDYFILE)
+    output = "\n".join([
+        f"{CADDYFILE}.bak.20240101120000",
+        f"{CADDYFILE}.bak.20240301120000.{'c' * 12}.gz",
+        f"{CADDYFILE}.bak.20240201120000.{'b' * 12}",
+        f"{CADDYFILE}.bak.notes",
+        "/etc/other/Caddyfile.bak.20240401120000"
+    ])
+    
+    backups = manager._parse_backup_list(output)
+    
+    assert [b["timestamp"].month for b in backups] == [3, 2, 1]
+    assert backups[0]["compressed"] and backups[0]["sha256_prefix"] == "c" * 12
+    assert backups[2]["sha256_prefix"] is None
+
+
+def test_retention_keeps_last_daily_and_weekly():
+    manager = CaddyBackupManager(FakeSSH({}), CADDYFILE, keep_last=2, keep_daily=3, keep_weekly=2)
+    # 2024-03-13是周三；每天两份备份，共21天
+    start = datetime(2024, 3, 13, 20, 0, 0)
+    backups = [backup(start - timedelta(hours=12 * i)) for i in range(42)]
+    
+    kept = [b["timestamp"] for b in manager.select_backups_to_keep(backups)]
+    
+    expected = {
+        start, start - timedelta(hours=12),  # 最近两份
+        datetime(2024, 3, 12, 20), datetime(2024, 3, 11, 20),  # 之前两天各自最新的一份
+        datetime(2024, 3, 10, 20),  # 上一周最新的一份
+    }
+    assert set(kept) == expected
+
+
+def test_create_backup_aborts_when_hash_fails():
+    ssh = FakeSSH({
+        "sha256sum": ("", "sha256sum: /etc/caddy/Caddyfile: Permission denied", 1),
+        "ls": (f"{CADDYFILE}.bak.20240101120000\n", "", 0)
+    })
+    manager = CaddyBackupManager(ssh, CADDYFILE)
+    
+    assert manager.create_backup() is None
+    assert not any(c.startswith(("cp", "gzip")) for c in ssh.commands)
+
+
+def test_create_backup_reuses_backup_with_same_hash():
+    existing = f"{CADDYFILE}.bak.20240101120000.{SHA256[:12]}"
+    ssh = FakeSSH({
+        "sha256sum": (f"{SHA256}  {CADDYFILE}\n", "", 0),
+        "ls": (existing + "\n", "", 0)
+    })
+    manager = CaddyBackupManager(ssh, CADDYFILE)
+    
+    assert manager.create_backup() == existing
+    assert not any(c.startswith("cp") for c in ssh.commands)
+
+
+def test_create_backup_copies_changed_content():
+    ssh = FakeSSH({
+        "sha256sum": (f"{SHA256}  {CADDYFILE}\n", "", 0),
+        "ls": (f"{CADDYFILE}.bak.20240101120000.{'0' * 12}\n", "", 0)
+    })
+    manager = CaddyBackupManager(ssh, CADDYFILE)
+    
+    path = manager.create_backup()
+    
+    assert path.endswith(f".{SHA256[:12]}")
+    assert any(c.startswith("cp ") and c.endswith(path) for c in ssh.commands)
@@ -0,0 +1,191 @@
+"""Caddy访问日志采集测试：提示信息识别、汇总和轮转边界的偏移量"""
+
+import json
+import socket
+import threading
+
+from caddy_ssh_manager.log_tail import CaddyLogTailer, LogAggregator, minute_key, parse_tail_message
+
+
+def log_line(host="a.com", status=200, duration=0.2, ts=120.5):
+    return json.dumps({"request": {"host": host}, "status": status, "duration": duration, "ts": ts}).encode()
+
+
+class FakePipeline:
+    def __init__(self, redis):
+        self.redis = redis
+        self.ops = []
+    
+    def hincrby(self, key, field, value):
+        self.ops.append(("incr", key, field, value))
+    
+    def hincrbyfloat(self, key, field, value):
+        self.ops.append(("incr", key, field, value))
+    
+    def expire(self, key, seconds):
+        pass
+    
+    def hset(self, key, mapping):
+        self.ops.append(("hset", key, mapping))
+    
+    def execute(self):
+        for op in self.ops:
+            if op[0] == "incr":
+                _, key, field, value = op
+                bucket = self.redis.hashes.setdefault(key, {})
+                bucket[field] = bucket.get(field, 0) + value
+            else:
+                _, key, mapping = op
+                self.redis.hashes[key] = dict(mapping)
+                self.redis.checkpoints.append(dict(mapping))
+
+
+class FakeRedis:
+    def __init__(self):
+        self.hashes = {}
+        self.checkpoints = []
+    
+    def pipeline(self, transaction=True):
+        return FakePipeline(self)
+    
+    def hgetall(self, key):
+        return {k.encode(): str(v).encode() for k, v in self.hashes.get(key, {}).items()}
+
+
+class FakeChannel:
+    """按顺序返回预设的数据块，读完后设置停止信号"""
+    
+    def __init__(self, chunks, stop_event):
+        self.chunks = list(chunks)
+        self.stop_event = stop_event
+        self.command = None
+    
+    def settimeout(self, timeout):
+        pass
+    
+    def exec_command(self, command):
+        self.command = command
+    
+    def recv(self, size):
+        if self.chunks:
+            return self.chunks.pop(0)
+        self.stop_event.set()
+        raise socket.timeout()
+    
+    def exit_status_ready(self):
+        return False
+    
+    def close(self):
+        pass
+
+
+class FakeSSH:
+    def __init__(self, channel):
+        self.channel = channel
+    
+    def get_connection(self):
+        return self
+    
+    def get_transport(self):
+        return self
+    
+    def open_session(self):
+        return self.channel
+    
+    def close(self):
+        pass
+
+
+def make_tailer(chunks, stats):
+    """创建使用假SSH通道和假Redis的采集器，stats为依次返回的(inode, 大小)"""
+    stop_event = threading.Event()
+    tailer = CaddyLogTailer(
+        {"host": "10.0.0.1", "port": 22, "username": "u", "password": "p"},
+        "/var/log/caddy/wujie.log",
+        redis_client=FakeRedis(),
+        flush_interval=3600,
+        retention=60
+    )
+    channel = FakeChannel(chunks, stop_event)
+    tailer.ssh = FakeSSH(channel)
+    stats = iter(stats)
+    tailer._remote_stat = lambda: next(stats)
+    return tailer, channel, stop_event
+
+
+def test_parse_tail_message_plain_and_appended():
+    message = b"tail: '/var/log/caddy/wujie.log' has been replaced;  following new file"
+    assert parse_tail_message(message) == message.decode()
+    # 旧文件最后一行没有换行符时，提示信息接在该行后面
+    assert parse_tail_message(b'{"request": {"ho' + message) == message.decode()
+
+
+def test_parse_tail_message_ignores_log_lines():
+    assert parse_tail_message(log_line()) is None
+    assert parse_tail_message(b'{"msg": "tail: not a message"}') is None
+
+
+def test_aggregator_buckets_by_host_and_minute():
+    aggregator = LogAggregator()
+    assert aggregator.feed(log_line(host="A.com:443", status=200, duration=0.05, ts=130))
+    assert aggregator.feed(log_line(status=502, duration=2.0, ts=170))
+    assert aggregator.feed(log_line(status=200, duration=7.0, ts=185))
+    assert not aggregator.feed(b"not json")
+    assert not aggregator.feed(log_line(host=""))
+    
+    buckets = aggregator.drain()
+    assert buckets[("a.com", 120)] == {
+        "count": 2, "s2xx": 1, "s5xx": 1, "duration_ms_sum": 2050.0, "le_100": 1, "le_5000": 1
+    }
+    assert buckets[("a.com", 180)]["gt_5000"] == 1
+    assert (aggregator.parsed, aggregator.skipped) == (3, 2)
+    assert aggregator.drain() == {}
+
+
+def test_run_once_resumes_from_checkpoint():
+    first = log_line()
+    tailer, channel, stop_event = make_tailer([first + b"\n"], [(7, 1000)])
+    tailer.redis.hashes[tailer.checkpoint_key] = {"inode": 7, "offset": 400}
+    
+    tailer.run_once(stop_event)
+    
+    assert channel.command.startswith("tail -c +401 -F ")
+    assert tailer.redis.checkpoints[-1] == {"inode": 7, "offset": 400 + len(first) + 1}
+
+
+def test_run_once_restarts_from_zero_after_rotation_offline():
+    tailer, channel, stop_event = make_tailer([], [(8, 10)])
+    tailer.redis.hashes[tailer.checkpoint_key] = {"inode": 7, "offset": 400}
+    
+    tailer.run_once(stop_event)
+    
+    assert channel.command.startswith("tail -c +1 -F ")
+    assert tailer.redis.checkpoints[-1] == {"inode": 8, "offset": 0}
+
+
+def test_run_once_splits_offsets_at_rotation_boundary():
+    old_line = log_line(status=200, ts=60)
+    partial = log_line(status=500, ts=60)[:20]
+    new_line = log_line(status=502, ts=60)
+    message = b"tail: '/var/log/caddy/wujie.log' has been replaced;  following new file\n"
+    # 数据块在行中间断开，旧文件最后一行没有换行符
+    stream = old_line + b"\n" + partial + message + new_line + b"\n"
+    chunks = [stream[:10], stream[10:len(old_line) + 25], stream[len(old_line) + 25:]]
+    tailer, _, stop_event = make_tailer(chunks, [(7, 0), (8, len(new_line) + 1)])
+    
+    tailer.run_once(stop_event)
+    
+    # 轮转时先保存旧文件的断点（不完整的最后一行不计入），之后按新文件从头计算
+    assert tailer.redis.checkpoints[0] == {"inode": 7, "offset": len(old_line) + 1}
+    assert tailer.redis.checkpoints[-1] == {"inode": 8, "offset": len(new_line) + 1}
+    
+    totals = tailer.redis.hashes[minute_key("a.com", 60)]
+    assert totals["count"] == 2
+    assert (totals["s2xx"], totals["s5xx"]) == (1, 1)
+
+
+def test_non_rotation_message_keeps_position():
+    tailer, _, _ = make_tailer([], [])
+    
+    assert tailer._handle_tail_message("tail: inotify cannot be used, reverting to polling", 7, 42) == (7, 42)
+    assert tailer.redis.checkpoints == []
@@ -0,0 +1,72 @@
+"""运行指标的Prometheus文本输出测试"""
+
+import pytest
+
+from metrics import Counter, Gauge, Histogram, Registry
+
+
+def test_counter_renders_labels_with_escaping():
+    counter = Counter("probes_total", "拨测次数", ["brand", "status"])
+    counter.inc(brand="wujie", status="success")
+    counter.inc(2, brand="wujie", status="success")
+    counter.inc(brand='v2"word', status="failed")
+    
+    lines = counter.render().split("\n")
+    
+    assert lines[:2] == ["# HELP probes_total 拨测次数", "# TYPE probes_total counter"]
+    assert 'probes_total{brand="wujie",status="success"} 3' in lines
+    assert 'probes_total{brand="v2\\"word",status="failed"} 1' in lines
+
+
+def test_label_mismatch_raises():
+    counter = Counter("probes_total", "拨测次数", ["brand"])
+    with pytest.raises(ValueError):
+        counter.inc(status="success")
+
+
+def test_histogram_buckets_are_cumulative():
+    histogram = Histogram("stage_seconds", "阶段耗时", ["stage"], buckets=(1, 5))
+    for value in (0.5, 1, 3, 10):
+        histogram.observe(value, stage="open")
+    
+    lines = histogram.render().split("\n")
+    
+    assert 'stage_seconds_bucket{stage="open",le="1"} 2' in lines
+    assert 'stage_seconds_bucket{stage="open",le="5"} 3' in lines
+    assert 'stage_seconds_bucket{stage="open",le="+Inf"} 4' in lines
+    assert 'stage_seconds_sum{stage="open"} 14.5' in lines
+    assert 'stage_seconds_count{stage="open"} 4' in lines
+
+
+def test_histogram_time_records_on_exception():
+    histogram = Histogram("write_seconds", "写入耗时")
+    with pytest.raises(RuntimeError):
+        with histogram.time():
+            raise RuntimeError("写入失败")
+    
+    assert "write_seconds_count 1" in histogram.render().split("\n")
+
+
+def test_gauge_callback_and_failing_callback():
+    gauge = Gauge("queue_depth", "队列长度", ["queue"], callback=lambda: {("results",): 3})
+    assert 'queue_depth{queue="results"} 3' in gauge.render().split("\n")
+    
+    def broken():
+        raise RuntimeError("不可用")
+    
+    assert Gauge("broken", "回调出错", callback=broken).render().count("\n") == 1
+
+
+def test_registry_renders_all_and_rejects_duplicates():
+    registry = Registry()
+    registry.register(Counter("a_total", "A")).inc()
+    registry.register(Gauge("b", "B")).set(1.5)
+    
+    with pytest.raises(ValueError):
+        registry.register(Counter("a_total", "重复"))
+    
+    output = registry.render()
+    assert output.endswith("\n")
+    assert "a_total 1\n" in output
+    assert "b 1.5\n" in output
+    assert registry.get("b") is not None
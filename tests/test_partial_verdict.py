@@ -0,0 +1,71 @@
+"""部分拨测结果提前结束判断测试"""
+
+from aliyun_boce import PartialVerdict, is_status_pending
+
+
+def statuses(success, failed, pending):
+    return ["200"] * success + ["Timeout"] * (failed // 2) + ["-"] * (failed - failed // 2) + [""] * pending
+
+
+def evaluate_twice(verdict, values):
+    """总数连续两次不变时才做判断"""
+    verdict.evaluate(values)
+    return verdict.evaluate(values)
+
+
+def test_is_status_pending():
+    assert is_status_pending("")
+    assert is_status_pending("  ")
+    assert is_status_pending("Testing...")
+    assert is_status_pending("检测中")
+    assert not is_status_pending("200")
+    assert not is_status_pending("-")
+    assert not is_status_pending("Timeout")
+
+
+def test_counts_pending_and_failed():
+    verdict = PartialVerdict()
+    verdict.evaluate(["200", "404", "-", "", "Loading"])
+    
+    assert verdict.counts == {"total": 5, "success": 1, "failed": 2, "pending": 2}
+
+
+def test_waits_until_total_is_stable():
+    verdict = PartialVerdict(threshold=70, min_points=5)
+    values = statuses(success=2, failed=8, pending=5)
+    
+    assert verdict.evaluate(values) is None
+    assert verdict.evaluate(values) == "unhealthy"
+
+
+def test_unhealthy_when_threshold_is_unreachable():
+    verdict = PartialVerdict(threshold=70, min_points=5)
+    # 最好情况 (4 + 6) / 20 = 50%
+    assert evaluate_twice(verdict, statuses(success=4, failed=10, pending=6)) == "unhealthy"
+
+
+def test_undecided_while_threshold_still_reachable():
+    verdict = PartialVerdict(threshold=70, min_points=5)
+    # 最好情况 (10 + 5) / 20 = 75%，最坏情况 50%
+    assert evaluate_twice(verdict, statuses(success=10, failed=5, pending=5)) is None
+
+
+def test_healthy_only_in_any_mode():
+    values = statuses(success=18, failed=0, pending=2)
+    
+    assert evaluate_twice(PartialVerdict(mode="unhealthy", threshold=70, min_points=5), values) is None
+    assert evaluate_twice(PartialVerdict(mode="any", threshold=70, min_points=5), values) == "healthy"
+
+
+def test_requires_min_points_and_pending_rows():
+    verdict = PartialVerdict(threshold=70, min_points=10)
+    assert evaluate_twice(verdict, statuses(success=0, failed=5, pending=15)) is None
+    
+    # 没有待定检测点时拨测已经结束，不需要提前判断
+    verdict = PartialVerdict(threshold=70, min_points=5)
+    assert evaluate_twice(verdict, statuses(success=0, failed=20, pending=0)) is None
+
+
+def test_off_mode_is_disabled():
+    assert not PartialVerdict(mode="off").enabled
+    assert PartialVerdict(mode="any").enabled
@@ -0,0 +1,60 @@
+"""单次拨测截止时间测试"""
+
+import asyncio
+import time
+
+import pytest
+
+from probe_deadline import ProbeRunner, ProbeTimeout
+
+
+def wait_for_cancel(url, context):
+    """模拟卡住的拨测：直到被取消才返回"""
+    context.cancel_event.wait(5)
+    return "cancelled" if context.cancelled else url
+
+
+def test_run_returns_result_within_deadline():
+    runner = ProbeRunner(deadline=5, cancel_grace=1)
+    try:
+        assert asyncio.run(runner.run(lambda url, context: url.upper(), "a.com")) == "A.COM"
+    finally:
+        runner.close()
+
+
+def test_run_cancels_after_deadline():
+    runner = ProbeRunner(deadline=0.2, cancel_grace=1)
+    try:
+        with pytest.raises(ProbeTimeout):
+            asyncio.run(runner.run(wait_for_cancel, "a.com"))
+    finally:
+        runner.close()
+
+
+def test_run_sync_cancels_and_propagates_errors():
+    runner = ProbeRunner(deadline=0.2, cancel_grace=1)
+    try:
+        with pytest.raises(ProbeTimeout):
+            runner.run_sync(wait_for_cancel, "a.com")
+        
+        def broken(url, context):
+            raise ValueError(url)
+        
+        with pytest.raises(ValueError):
+            runner.run_sync(broken, "a.com")
+    finally:
+        runner.close()
+
+
+def test_stuck_thread_gets_replaced_executor():
+    runner = ProbeRunner(deadline=0.1, cancel_grace=0.1)
+    try:
+        stuck = runner._executor
+        with pytest.raises(ProbeTimeout):
+            # 忽略取消标志的拨测，线程在宽限期内不会退出
+            runner.run_sync(lambda url, context: time.sleep(1), "a.com")
+        assert runner._executor is not stuck
+        
+        assert runner.run_sync(lambda url, context: url, "b.com") == "b.com"
+    finally:
+        runner.close()
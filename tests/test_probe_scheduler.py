@@ -0,0 +1,123 @@
+"""自适应拨测调度器测试"""
+
+import time
+
+from probe_scheduler import ProbeScheduler
+
+
+def target(url, primary=True, brand="wujie"):
+    return {"url": url, "brand": brand, "primary": primary, "references": [{"brand": brand}]}
+
+
+def drain(scheduler, now=None):
+    """取出所有已到期的域名"""
+    now = time.time() + 1 if now is None else now
+    popped = []
+    while (info := scheduler.pop_due(now)) is not None:
+        popped.append(info)
+    return popped
+
+
+def test_sync_makes_new_domains_due_primary_first():
+    scheduler = ProbeScheduler(min_interval=10, max_interval=100)
+    added, removed = scheduler.sync([target("https://b.com", primary=False), target("https://a.com")])
+    
+    assert (added, removed) == (2, 0)
+    assert [d["url"] for d in drain(scheduler, time.time() + 2)] == ["https://a.com", "https://b.com"]
+
+
+def test_same_domain_is_scheduled_once():
+    scheduler = ProbeScheduler()
+    scheduler.sync([target("https://a.com"), target("http://a.com", brand="v2word")])
+    
+    assert len(scheduler) == 1
+    assert len(drain(scheduler)) == 1
+
+
+def test_pop_due_returns_none_until_due():
+    scheduler = ProbeScheduler(min_interval=10, max_interval=100)
+    scheduler.sync([target("https://a.com")])
+    info = drain(scheduler)[0]
+    scheduler.record(info, {"is_available": True})
+    
+    assert scheduler.pop_due() is None
+    assert 0 < scheduler.seconds_until_next_due() <= 20
+
+
+def test_record_backs_off_while_healthy_and_resets_on_failure():
+    scheduler = ProbeScheduler(min_interval=10, max_interval=50)
+    scheduler.sync([target("https://a.com")])
+    info = drain(scheduler)[0]
+    
+    intervals = [scheduler.record(info, {"is_available": True}) for _ in range(4)]
+    assert intervals == [20, 40, 50, 50]
+    
+    assert scheduler.record(info, {"is_available": False}) == 10
+    assert scheduler.record(info, None) == 10
+
+
+def test_backup_domains_use_scaled_intervals():
+    scheduler = ProbeScheduler(min_interval=10, max_interval=50, backup_factor=3)
+    scheduler.sync([target("https://a.com"), target("https://b.com", primary=False)])
+    backup = [d for d in drain(scheduler, time.time() + 2) if not d["primary"]][0]
+    
+    assert scheduler.record(backup, None) == 30
+    assert [scheduler.record(backup, {"is_available": True}) for _ in range(4)] == [60, 120, 150, 150]
+
+
+def test_sync_drops_removed_domains():
+    scheduler = ProbeScheduler()
+    scheduler.sync([target("https://a.com"), target("https://b.com")])
+    added, removed = scheduler.sync([target("https://a.com")])
+    
+    assert (added, removed) == (0, 1)
+    assert [d["url"] for d in drain(scheduler)] == ["https://a.com"]
+    assert scheduler.record(target("https://b.com"), None) is None
+
+
+def test_sync_requeues_popped_domain_that_was_never_recorded():
+    scheduler = ProbeScheduler()
+    domains = [target("https://a.com")]
+    scheduler.sync(domains)
+    
+    # 取出后处理中途出错，没有调用record
+    assert len(drain(scheduler)) == 1
+    assert drain(scheduler) == []
+    
+    scheduler.sync(domains)
+    assert [d["url"] for d in drain(scheduler)] == ["https://a.com"]
+
+
+def test_sync_does_not_duplicate_scheduled_domains():
+    scheduler = ProbeScheduler(min_interval=10, max_interval=100)
+    domains = [target("https://a.com")]
+    scheduler.sync(domains)
+    scheduler.record(drain(scheduler)[0], {"is_available": True})
+    
+    scheduler.sync(domains)
+    assert scheduler.pop_due() is None
+
+
+def test_force_due_resets_interval_and_filters_by_brand():
+    scheduler = ProbeScheduler(min_interval=10, max_interval=100)
+    scheduler.sync([target("https://a.com")])
+    info = drain(scheduler)[0]
+    scheduler.record(info, {"is_available": True})
+    scheduler.record(info, {"is_available": True})
+    
+    assert scheduler.force_due("https://a.com", brand="v2word") == 0
+    assert scheduler.pop_due() is None
+    
+    assert scheduler.force_due("a.com", brand="wujie") == 1
+    assert [d["url"] for d in drain(scheduler)] == ["https://a.com"]
+    # 强制到期后按最小间隔重新开始退避
+    assert scheduler.record(info, {"is_available": True}) == 20
+
+
+def test_rescheduled_entry_ignores_stale_heap_items():
+    scheduler = ProbeScheduler()
+    scheduler.sync([target("https://a.com")])
+    scheduler.force_due("https://a.com")
+    scheduler.force_due("https://a.com")
+    
+    assert len(drain(scheduler)) == 1